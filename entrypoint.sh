@@ -26,6 +26,9 @@ fi
 echo "Running migrations..."
 python manage.py migrate --noinput
 
+echo "Creating LocationLog partitions..."
+python manage.py create_location_partitions
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput --clear
 
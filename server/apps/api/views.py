@@ -7,6 +7,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from server.apps.dashboard.models import Team, Message
+from server.apps.dashboard.team_codes import team_codes
 from server.apps.asgi_socket.consumers import (
     push_to_team,
     push_to_backoffice,
@@ -31,10 +32,10 @@ def upload_message_image(request):
     if not team_code:
         return JsonResponse({"error": "Missing X-Team-Code header"}, status=401)
 
-    try:
-        team = Team.objects.select_related("edition").get(code=team_code)
-    except Team.DoesNotExist:
+    entry = team_codes.lookup(team_code)
+    if entry is None or not entry.activated:
         return JsonResponse({"error": "Invalid team code"}, status=401)
+    team = Team.objects.select_related("edition").get(pk=entry.team_id)
 
     if not team.edition.messaging_enabled:
         return JsonResponse({"error": "Messaging is disabled"}, status=403)
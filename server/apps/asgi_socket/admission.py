@@ -0,0 +1,139 @@
+"""
+Admission control for the app socket.
+
+When a whole area loses coverage and comes back, every phone reconnects at
+once: authenticate, newLocation, a batch of pings. Without a limit each of
+those takes a thread of the ``database_sync_to_async`` pool and a database
+connection at the same time.
+
+- ``Admission`` bounds the number of database-bound socket requests running
+  at once per process (``SOCKET_DB_CONCURRENCY``). A request that cannot get
+  a slot within ``SOCKET_ADMISSION_TIMEOUT`` seconds is not run; the app gets
+  a "busy" answer with a jittered ``retryAfter`` so the retries spread out.
+- ``RateLimiter`` keeps a token bucket per team and endpoint
+  (``SOCKET_RATE_LIMITS``) for the chatty endpoints.
+
+The time spent waiting for a slot is recorded as ``queue_ms`` next to the
+query metrics of the endpoint (see ``dashboard.metrics``).
+"""
+import asyncio
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+from server.apps.dashboard.metrics import metrics
+
+
+class Busy(Exception):
+    """The request was not admitted; the app should retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def busy_response(endpoint, retry_after):
+    return {"type": "busy", "data": {"endpoint": endpoint, "retryAfter": retry_after}}
+
+
+class Admission:
+    def __init__(self, concurrency=8, timeout=2.0, retry_after=5):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._semaphore = None
+        self._loop = None
+
+        # Counters (see stats())
+        self.admitted = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.max_waiting = 0
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _retry_after(self):
+        # Spread the retries of a reconnect storm over twice the base delay
+        return self.retry_after + random.randint(0, self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self, name):
+        """Hold one of the ``concurrency`` slots; raises ``Busy`` after ``timeout``."""
+        semaphore = self._get_semaphore()
+        started = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Busy(self._retry_after()) from None
+        finally:
+            self.waiting -= 1
+            metrics.record_wait(name, (time.perf_counter() - started) * 1000)
+
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class RateLimiter:
+    """Token bucket per (team, endpoint): ``rate`` requests per second, ``burst`` at once."""
+
+    def __init__(self, limits, max_buckets=10000):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets: dict[tuple[int, str], tuple[float, float]] = {}
+        self.limited = 0
+
+    def check(self, team_id, endpoint):
+        """Take a token; raises ``Busy`` with the time until the next one when empty."""
+        if endpoint not in self.limits:
+            return
+        rate, burst = self.limits[endpoint]
+        now = time.monotonic()
+        tokens, updated = self._buckets.get((team_id, endpoint), (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._buckets[(team_id, endpoint)] = (tokens, now)
+            self.limited += 1
+            raise Busy(math.ceil((1 - tokens) / rate))
+        self._buckets[(team_id, endpoint)] = (tokens - 1, now)
+        if len(self._buckets) > self.max_buckets:
+            self.prune()
+
+    def prune(self):
+        """Drop buckets that have filled up again (they equal a fresh bucket)."""
+        now = time.monotonic()
+        for key, (tokens, updated) in list(self._buckets.items()):
+            rate, burst = self.limits[key[1]]
+            if tokens + (now - updated) * rate >= burst:
+                del self._buckets[key]
+
+
+admission = Admission(
+    concurrency=getattr(settings, "SOCKET_DB_CONCURRENCY", 8),
+    timeout=getattr(settings, "SOCKET_ADMISSION_TIMEOUT", 2.0),
+    retry_after=getattr(settings, "SOCKET_BUSY_RETRY_AFTER", 5),
+)
+rate_limiter = RateLimiter(getattr(settings, "SOCKET_RATE_LIMITS", {}))
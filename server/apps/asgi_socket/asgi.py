@@ -9,3 +9,20 @@ def get_asgi_application():
     from .router import urls
 
     return AuthMiddlewareStack(URLRouter(urls))
+
+
+class ProcessTaskMiddleware:
+    """
+    Start the per-process listener (edition broadcasts, cache invalidations,
+    see ``consumers.ensure_process_task``) on the first connection of any
+    kind, so a process that only served HTTP also drops stale caches.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        from .consumers import ensure_process_task
+
+        ensure_process_task()
+        return await self.app(scope, receive, send)
@@ -1 +1,2 @@
 TYPE_AUTHENTICATION = "authenticate"
+TYPE_RESUME = "resume"
@@ -1,53 +1,367 @@
 import json
 import asyncio
 import logging
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from server.apps.backoffice.permissions import org_qs
+from server.apps.dashboard import route_cache
+from server.apps.dashboard.models import Edition, Message, Team
+from server.apps.dashboard.team_codes import team_codes
+
+from . import sessions
+from .admission import Busy, admission, busy_response, rate_limiter
+from .constants import TYPE_RESUME
+from .handler_functions import INLINE_FUNCTION_MAPPING
 from .handlers import SocketDataHandler
 
 logger = logging.getLogger(__name__)
 
-# ── Global registry for pushing messages from sync code (backoffice views) ──
+# ── Consumers connected to this process (pushes go through the channel layer) ──
 _connected_consumers: dict[int, "AppConsumer"] = {}
-_backoffice_consumers: dict[int, set["BackofficeConsumer"]] = {}  # edition_id → set of consumers
-_event_loop: asyncio.AbstractEventLoop | None = None
+_edition_members: dict[int, set["AppConsumer"]] = {}  # edition_id → authenticated consumers
+_process_task: asyncio.Task | None = None
+
+# Every process listens on these groups: edition broadcasts are fanned out to
+# its own members, cache invalidations are applied to its in-memory caches
+BROADCAST_GROUP = "edition-broadcast"
+INVALIDATION_GROUP = "cache-invalidation"
+PROCESS_GROUPS = (BROADCAST_GROUP, INVALIDATION_GROUP)
+# Tells this process's own invalidations apart (it applied them already)
+PROCESS_ID = uuid.uuid4().hex
+
+# ── Presence: online/last_seen per team, written back in bulk ──
+_presence: dict[int, dict] = {}  # team_id → {"online": bool, "last_seen": datetime}
+_presence_dirty: set[int] = set()
+_presence_task: asyncio.Task | None = None
+
+# ── Live positions: the newest ping per team, sent to the backoffice in bulk ──
+_positions: dict[int, dict[int, dict]] = {}  # edition_id → team_id → location event data
+_positions_task: asyncio.Task | None = None
+
+
+def mark_seen(team_id: int, online: bool | None = None):
+    """Record activity of a team; written to the database on the next presence flush."""
+    entry = _presence.setdefault(team_id, {"online": False, "last_seen": None})
+    entry["last_seen"] = timezone.now()
+    if online is not None:
+        entry["online"] = online
+    _presence_dirty.add(team_id)
+
+
+def get_presence() -> dict[int, dict]:
+    """Snapshot of live presence, safe to read from sync code."""
+    return {team_id: dict(entry) for team_id, entry in list(_presence.items())}
+
+
+def apply_presence(teams):
+    """Overlay live presence on Team instances; returns them as a list."""
+    presence = get_presence()
+    teams = list(teams)
+    for team in teams:
+        if entry := presence.get(team.id):
+            team.online = entry["online"]
+            team.last_seen = entry["last_seen"]
+    return teams
+
+
+def flush_presence():
+    """Write online/last_seen of all changed and online teams in one bulk UPDATE.
+
+    Also resets teams that are still flagged online in the database but have
+    not been seen for PRESENCE_STALE_SECONDS (e.g. after a server restart).
+    """
+    team_ids = set(_presence_dirty)
+    _presence_dirty.difference_update(team_ids)
+    presence = get_presence()
+    team_ids.update(tid for tid, entry in presence.items() if entry["online"])
+
+    rows = [
+        Team(id=tid, online=presence[tid]["online"], last_seen=presence[tid]["last_seen"])
+        for tid in team_ids
+        if tid in presence
+    ]
+    if rows:
+        Team.objects.bulk_update(rows, ["online", "last_seen"])
+
+    # Offline teams are in the database now; no need to keep them in memory
+    for row in rows:
+        if not row.online and row.id not in _presence_dirty:
+            _presence.pop(row.id, None)
+
+    stale_cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, "PRESENCE_STALE_SECONDS", 3600)
+    )
+    online_ids = [tid for tid, entry in presence.items() if entry["online"]]
+    Team.objects.filter(online=True, last_seen__lt=stale_cutoff).exclude(
+        id__in=online_ids
+    ).update(online=False)
+    return len(rows)
+
+
+async def _presence_loop():
+    interval = getattr(settings, "PRESENCE_FLUSH_SECONDS", 15)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await database_sync_to_async(flush_presence)()
+        except Exception:
+            logger.exception("Presence flush failed")
 
 
-def _ensure_loop():
-    global _event_loop
-    if _event_loop is None:
-        return False
-    return True
+def _ensure_presence_task():
+    global _presence_task
+    loop = asyncio.get_running_loop()
+    if _presence_task is None or _presence_task.done() or _presence_task.get_loop() is not loop:
+        _presence_task = loop.create_task(_presence_loop())
 
 
-def push_to_team(team_id: int, payload: dict):
-    """Send a message to a connected team from sync code (e.g. a Django view)."""
-    if not _ensure_loop():
-        return
-    consumer = _connected_consumers.get(team_id)
-    if consumer is not None:
-        asyncio.run_coroutine_threadsafe(
-            consumer.send_dict_json(payload), _event_loop
+def queue_position(edition_id: int, data: dict):
+    """Keep the newest position of a team; sent on the next positions flush.
+
+    Pings arrive every few seconds from every team; sent one by one, each is
+    a channel-layer message (a NOTIFY on Postgres) to the backoffice.
+    """
+    _positions.setdefault(edition_id, {})[data["team"]] = data
+    global _positions_task
+    loop = asyncio.get_running_loop()
+    if _positions_task is None or _positions_task.done() or _positions_task.get_loop() is not loop:
+        _positions_task = loop.create_task(_positions_loop())
+
+
+async def flush_positions():
+    """Send the queued positions as one "locations" message per edition."""
+    channel_layer = get_channel_layer()
+    for edition_id in list(_positions):
+        positions = _positions.pop(edition_id)
+        await channel_layer.group_send(backoffice_group(edition_id), {
+            "type": "backoffice.push",
+            "payload": {"type": "locations", "data": list(positions.values())},
+        })
+
+
+async def _positions_loop():
+    while True:
+        await asyncio.sleep(getattr(settings, "LOCATION_FLUSH_INTERVAL_MS", 1000) / 1000)
+        try:
+            await flush_positions()
+        except Exception:
+            logger.exception("Positions flush failed")
+
+
+async def fan_out(consumers, text: str) -> dict:
+    """Send pre-encoded ``text`` to ``consumers`` with bounded concurrency.
+
+    Consumers that fail or do not accept the frame within
+    BROADCAST_SEND_TIMEOUT seconds are counted as dropped.
+    """
+    consumers = list(consumers)
+    semaphore = asyncio.Semaphore(getattr(settings, "BROADCAST_CONCURRENCY", 50))
+    timeout = getattr(settings, "BROADCAST_SEND_TIMEOUT", 5)
+
+    async def deliver(consumer):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(consumer.send(text), timeout)
+                return True
+            except Exception:
+                logger.warning("Broadcast to team %s dropped", consumer._team_id)
+                return False
+
+    results = await asyncio.gather(*(deliver(c) for c in consumers))
+    delivered = sum(results)
+    return {"recipients": len(consumers), "delivered": delivered, "dropped": len(consumers) - delivered}
+
+
+async def _keep_membership(channel_layer, channel):
+    """Re-join the PROCESS_GROUPS well within the layer's ``group_expiry``.
+
+    The in-memory layer (and PostgresChannelLayer on top of it) silently drops
+    group members after ``group_expiry`` seconds, and this process stays up for
+    days during an event.
+    """
+    interval = getattr(channel_layer, "group_expiry", 86400) / 4
+    while True:
+        await asyncio.sleep(interval)
+        for group in PROCESS_GROUPS:
+            await channel_layer.group_add(group, channel)
+
+
+async def _process_loop():
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    for group in PROCESS_GROUPS:
+        await channel_layer.group_add(group, channel)
+    membership = asyncio.create_task(_keep_membership(channel_layer, channel))
+    try:
+        while True:
+            message = await channel_layer.receive(channel)
+            try:
+                if message["type"] == "cache.invalidate":
+                    apply_invalidation(message)
+                else:
+                    await _edition_broadcast(channel_layer, message)
+            except Exception:
+                logger.exception("Handling %s failed", message.get("type"))
+    finally:
+        membership.cancel()
+
+
+async def _edition_broadcast(channel_layer, message):
+    edition_id = message["edition_id"]
+    report = await fan_out(_edition_members.get(edition_id, ()), message["text"])
+    if message.get("report_message") and report["recipients"]:
+        totals = await database_sync_to_async(store_broadcast_report)(
+            message["report_message"], report
         )
+        await channel_layer.group_send(backoffice_group(edition_id), {
+            "type": "backoffice.push",
+            "payload": {"type": "broadcastReport", "data": totals},
+        })
 
 
-def push_to_edition(edition_id: int, payload: dict):
-    """Broadcast a message to all connected teams of an edition."""
-    for consumer in list(_connected_consumers.values()):
-        if consumer._edition_id == edition_id:
-            push_to_team(consumer._team_id, payload)
+def push_invalidation(cache: str, ids=None):
+    """Make the other processes drop ``ids`` (None: everything) from an in-memory cache.
 
+    ``cache`` is "team_codes" (``dashboard.team_codes``) or "route_payloads"
+    (``dashboard.route_cache``, per team id). Call it after the change is
+    committed, or another process may reload the old rows.
+    """
+    _group_send(INVALIDATION_GROUP, {
+        "type": "cache.invalidate", "origin": PROCESS_ID, "cache": cache, "ids": ids,
+    })
 
-def push_to_backoffice(edition_id: int, payload: dict):
-    """Push a message to all connected backoffice clients for an edition."""
-    if not _ensure_loop():
+
+def apply_invalidation(message):
+    if message["origin"] == PROCESS_ID:
         return
-    consumers = _backoffice_consumers.get(edition_id, set())
-    for consumer in list(consumers):
-        asyncio.run_coroutine_threadsafe(
-            consumer.send_dict_json(payload), _event_loop
+    if message["cache"] == "team_codes":
+        team_codes.reset()
+    elif message["cache"] == "route_payloads":
+        route_cache.forget_teams(message["ids"])
+    else:
+        logger.warning("Invalidation of unknown cache %s", message["cache"])
+
+
+REPORT_FIELDS = {
+    "recipients": "broadcast_recipients",
+    "delivered": "broadcast_delivered",
+    "dropped": "broadcast_dropped",
+}
+
+
+def _report_totals(row):
+    return {"id": row["id"], **{key: row[field] for key, field in REPORT_FIELDS.items()}}
+
+
+def store_broadcast_report(message_id: int, report: dict):
+    """Add the counts of this process to the broadcast's Message row; returns the totals so far."""
+    Message.objects.filter(pk=message_id).update(**{
+        field: F(field) + report[key] for key, field in REPORT_FIELDS.items()
+    })
+    return _report_totals(Message.objects.values("id", *REPORT_FIELDS.values()).get(pk=message_id))
+
+
+def broadcast_report(edition_id: int):
+    """Delivery totals of the latest broadcast of the edition, or None."""
+    row = (
+        Message.objects.filter(
+            edition_id=edition_id, sender_team__isnull=True, recipient_team__isnull=True
         )
+        .order_by("-id").values("id", *REPORT_FIELDS.values()).first()
+    )
+    if row is None or not row["broadcast_recipients"]:
+        return None
+    return _report_totals(row)
+
+
+def ensure_process_task():
+    """Start listening for edition broadcasts and cache invalidations in this process."""
+    global _process_task
+    loop = asyncio.get_running_loop()
+    if _process_task is None or _process_task.done() or _process_task.get_loop() is not loop:
+        _process_task = loop.create_task(_process_loop())
+
+
+def team_group(team_id: int) -> str:
+    return f"team.{team_id}"
+
+
+def edition_group(edition_id: int) -> str:
+    return f"edition.{edition_id}"
+
+
+def backoffice_group(edition_id: int) -> str:
+    return f"backoffice.{edition_id}"
+
+
+def _group_send(group: str, message: dict) -> bool:
+    """Send to a channel-layer group from sync code (e.g. a Django view).
+
+    Returns False (and logs why) when the message could not be sent, e.g.
+    ``MessageTooLarge`` from PostgresChannelLayer.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return False
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception:
+        logger.exception("Sending to group %s failed", group)
+        return False
+    return True
+
+
+def push_to_team(team_id: int, payload: dict) -> bool:
+    """Send a message to a connected team, in whichever process it is connected.
+
+    The payload gets the team's next ``seq`` and is kept for session
+    resumption, so a team that missed it (False: not sent) gets it on resume.
+    """
+    payload = sessions.record_event(sessions.team_stream(team_id), payload)
+    return _group_send(team_group(team_id), {"type": "app.push", "payload": payload})
+
+
+def refresh_team_state(team_id: int):
+    """Make a connected team reload its snapshot after a backoffice change."""
+    _group_send(team_group(team_id), {"type": "team.reload"})
+
+
+def refresh_edition_state(edition_id: int):
+    """Reload the snapshot of every connected team of an edition."""
+    _group_send(edition_group(edition_id), {"type": "team.reload"})
+
+
+def push_to_edition(edition_id: int, payload: dict, report_message: int | None = None) -> bool:
+    """Broadcast a message to all connected teams of an edition.
+
+    The payload gets the edition's next ``editionSeq`` (kept for session
+    resumption) and is encoded once; each process sends the same frame to its
+    members. With ``report_message`` (a Message id), every process adds its
+    delivered/dropped counts to that row (``store_broadcast_report``) and
+    pushes the totals as a "broadcastReport" to the backoffice clients of the
+    edition. Returns False when the broadcast could not be sent.
+    """
+    payload = sessions.record_event(sessions.edition_stream(edition_id), payload, "editionSeq")
+    return _group_send(BROADCAST_GROUP, {
+        "type": "edition.broadcast",
+        "edition_id": edition_id,
+        "text": json.dumps(payload),
+        "report_message": report_message,
+    })
+
+
+def push_to_backoffice(edition_id: int, payload: dict) -> bool:
+    """Push a message to all connected backoffice clients for an edition."""
+    return _group_send(backoffice_group(edition_id), {"type": "backoffice.push", "payload": payload})
 
 
 # ─── App Consumer (teams) ───────────────────────────────────────────
@@ -58,9 +372,8 @@ class AppConsumer(AsyncWebsocketConsumer):
     _edition_id: int | None = None
 
     async def connect(self):
-        global _event_loop
-        _event_loop = asyncio.get_running_loop()
-
+        _ensure_presence_task()
+        ensure_process_task()
         self.handler = SocketDataHandler(self)
         await self.accept()
 
@@ -79,39 +392,76 @@ class AppConsumer(AsyncWebsocketConsumer):
             return
 
         if not self.handler.is_authenticated:
-            team = await database_sync_to_async(self.handler.authenticate)(
-                request_endpoint, request_data
-            )
-            if not team:
+            try:
+                async with admission.slot("socket:authenticate"):
+                    state = await database_sync_to_async(self.handler.authenticate)(
+                        request_endpoint, request_data
+                    )
+            except Busy as busy:
+                await self.send_dict_json(busy_response(request_endpoint, busy.retry_after))
+                return
+            resuming = request_endpoint == TYPE_RESUME
+            if not state:
+                if resuming:
+                    # The app falls back to a normal "authenticate"
+                    await self.send_dict_json({"type": "resume", "data": {"result": 0}})
+                    return
                 await self.send_dict_json({"type": "auth", "data": {"result": 0}})
                 await self.close(4003)
                 return
 
-            self._team_id = team.id
-            self._edition_id = await database_sync_to_async(
-                lambda: team.edition_id
-            )()
-            _connected_consumers[team.id] = self
-
-            auth_data = await database_sync_to_async(
-                lambda: {
-                    "locationInterval": team.location_update_interval,
-                    "messagingEnabled": team.edition.messaging_enabled,
-                }
-            )()
+            self._team_id = state.team_id
+            self._edition_id = state.edition_id
+            mark_seen(state.team_id, online=True)
+            _connected_consumers[state.team_id] = self
+            await self._join_groups()
+            await self._publish_to_backoffice(
+                {"type": "presence", "data": {"team": state.team_id, "online": True}}
+            )
+
+            missed = self.handler.missed
             await self.send_dict_json({
-                "type": "auth",
+                "type": "resume" if resuming else "auth",
                 "data": {
                     "result": 1,
-                    **auth_data,
+                    **state.app_config(),
+                    **self.handler.session,
+                    **({"complete": missed is not None} if resuming else {}),
                 },
             })
+            for payload in missed or ():
+                await self.send_dict_json(payload)
+            if self.handler.route_update is not None:
+                await self.send_dict_json(self.handler.route_update)
             return
 
+        mark_seen(self._team_id)
+
         try:
-            response = await database_sync_to_async(self.handler.handle_request)(
-                request_endpoint, request_data
-            )
+            rate_limiter.check(self._team_id, request_endpoint)
+        except Busy as busy:
+            await self.send_dict_json(busy_response(request_endpoint, busy.retry_after))
+            return
+
+        if request_endpoint in INLINE_FUNCTION_MAPPING:
+            try:
+                response = self.handler.handle_inline(request_endpoint, request_data)
+            except (KeyError, TypeError, ValueError):
+                logger.warning("AppConsumer: invalid data for '%s'", request_endpoint)
+                return
+            if response is not None:
+                await self.send_dict_json(response)
+            await self._publish_events()
+            return
+
+        try:
+            async with admission.slot(f"socket:{request_endpoint}"):
+                response = await database_sync_to_async(self.handler.handle_request)(
+                    request_endpoint, request_data
+                )
+        except Busy as busy:
+            await self.send_dict_json(busy_response(request_endpoint, busy.retry_after))
+            return
         except KeyError:
             logger.warning("AppConsumer: unknown endpoint '%s'", request_endpoint)
             return
@@ -119,46 +469,119 @@ class AppConsumer(AsyncWebsocketConsumer):
             logger.exception("AppConsumer: error handling '%s'", request_endpoint)
             return
 
+        await self._publish_events()
+
         if response is not None:
             await self.send_dict_json(response)
 
             # If a team sent a message, also notify connected backoffice clients
             if request_endpoint == "sendMessage" and self._edition_id:
-                bo_consumers = _backoffice_consumers.get(self._edition_id, set())
-                for bo in list(bo_consumers):
-                    try:
-                        await bo.send_dict_json(response)
-                    except Exception:
-                        logger.warning("AppConsumer: failed to forward to backoffice consumer")
+                await self._publish_to_backoffice(response)
 
     async def send_dict_json(self, data):
         data_json = json.dumps(data)
         return await self.send(data_json)
 
+    async def _publish_to_backoffice(self, payload):
+        await self.channel_layer.group_send(
+            backoffice_group(self._edition_id),
+            {"type": "backoffice.push", "payload": payload},
+        )
+
+    async def _publish_events(self):
+        """Forward live-map/dashboard events (locations, completions, undo) to the backoffice."""
+        for event in self.handler.pop_events():
+            if event["type"] == "location":
+                queue_position(self._edition_id, event["data"])
+                continue
+            try:
+                await self._publish_to_backoffice(event)
+            except Exception:
+                logger.warning("AppConsumer: failed to publish %s event", event["type"])
+
+    async def _join_groups(self):
+        _edition_members.setdefault(self._edition_id, set()).add(self)
+        await self.channel_layer.group_add(team_group(self._team_id), self.channel_name)
+        await self.channel_layer.group_add(edition_group(self._edition_id), self.channel_name)
+
+    async def _leave_groups(self):
+        members = _edition_members.get(self._edition_id, set())
+        members.discard(self)
+        if not members:
+            _edition_members.pop(self._edition_id, None)
+        await self.channel_layer.group_discard(team_group(self._team_id), self.channel_name)
+        await self.channel_layer.group_discard(edition_group(self._edition_id), self.channel_name)
+
+    # ── Channel layer handlers ──
+
+    async def app_push(self, event):
+        await self.send_dict_json(event["payload"])
+
+    async def team_reload(self, event):
+        await self.reload_state()
+
+    async def reload_state(self):
+        """Reload the team snapshot and push changed app settings as "config"."""
+        old_config = self.handler.state.app_config()
+        try:
+            state = await database_sync_to_async(self.handler.reload_state)()
+        except Exception:
+            logger.exception("AppConsumer: reloading state of team %s failed", self._team_id)
+            return
+        if state.edition_id != self._edition_id:
+            await self._leave_groups()
+            self._edition_id = state.edition_id
+            await self._join_groups()
+
+        changed = {
+            key: value
+            for key, value in state.app_config().items()
+            if old_config.get(key) != value
+        }
+        if changed:
+            await self.send_dict_json({"type": "config", "data": changed})
+
     async def disconnect(self, close_code):
-        if self.handler.is_authenticated and close_code != 4005:
-            await database_sync_to_async(self.handler.close)()
+        if self._team_id is None:
+            return
+
+        await self._leave_groups()
 
-        if self._team_id is not None:
-            _connected_consumers.pop(self._team_id, None)
+        # Another connection of the same team may have taken over already
+        if _connected_consumers.get(self._team_id) is self:
+            _connected_consumers.pop(self._team_id)
+            if close_code != 4005:
+                mark_seen(self._team_id, online=False)
+                await self._publish_to_backoffice(
+                    {"type": "presence", "data": {"team": self._team_id, "online": False}}
+                )
 
 
 # ─── Backoffice Consumer (admin dashboard) ──────────────────────────
 
+def _edition_visible(user, edition_id):
+    """Whether ``user`` may see the edition (same organisation filter as the backoffice views)."""
+    return org_qs(user, Edition.objects, "event__organization").filter(pk=edition_id).exists()
+
+
 class BackofficeConsumer(AsyncWebsocketConsumer):
     _edition_id: int | None = None
 
     async def connect(self):
-        global _event_loop
-        _event_loop = asyncio.get_running_loop()
+        # Live team positions go over this socket: staff of the edition's organisation only
+        user = self.scope.get("user")
+        if user is None or not user.is_staff:
+            await self.close()
+            return
 
-        self._edition_id = int(self.scope["url_route"]["kwargs"]["edition_id"])
-        await self.accept()
+        edition_id = int(self.scope["url_route"]["kwargs"]["edition_id"])
+        if not await database_sync_to_async(_edition_visible)(user, edition_id):
+            await self.close()
+            return
 
-        # Register in backoffice consumer set
-        if self._edition_id not in _backoffice_consumers:
-            _backoffice_consumers[self._edition_id] = set()
-        _backoffice_consumers[self._edition_id].add(self)
+        self._edition_id = edition_id
+        await self.accept()
+        await self.channel_layer.group_add(backoffice_group(self._edition_id), self.channel_name)
 
     async def send_dict_json(self, data):
         data_json = json.dumps(data)
@@ -168,9 +591,11 @@ class BackofficeConsumer(AsyncWebsocketConsumer):
         # Backoffice doesn't send messages via WebSocket (uses HTTP forms)
         pass
 
+    async def backoffice_push(self, event):
+        await self.send_dict_json(event["payload"])
+
     async def disconnect(self, close_code):
         if self._edition_id is not None:
-            consumers = _backoffice_consumers.get(self._edition_id, set())
-            consumers.discard(self)
-            if not consumers:
-                _backoffice_consumers.pop(self._edition_id, None)
+            await self.channel_layer.group_discard(
+                backoffice_group(self._edition_id), self.channel_name
+            )
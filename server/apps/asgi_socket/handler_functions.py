@@ -1,36 +1,85 @@
-from server.apps.dashboard.models import Message
+from django.conf import settings
+from django.db.models import Q, Subquery
 
+from server.apps.dashboard.completion import complete_destination
+from server.apps.dashboard.metrics import query_budget
+from server.apps.dashboard.models import Message, Team
+from server.apps.dashboard.route_cache import get_route_payload, route_version
 
+from .ingestion import location_buffer, parse_location
+
+
+def route_answer(handler):
+    """The "route" message; ``routeVersion`` is what the app sends back on resume."""
+    payload = get_route_payload(
+        handler.state.team_id, lambda: handler.team.get_next_open_routepart_formatted()
+    )
+    return {"type": "route", "data": payload, "routeVersion": route_version(payload)}
+
+
+@query_budget(4)
 def send_new_location(handler, data=None):
-    return {"type": "route", "data": handler.team.get_next_open_routepart_formatted()}
+    return route_answer(handler)
 
 
+@query_budget(12)
 def receive_destination_confirmed(handler, data=None):
-    destination_id = data["id"]
-    handler.team.handle_destination_completion(destination_id)
-    return None
+    result = complete_destination(handler.team, data["id"])
+    dest = result.destination
+    handler.publish(
+        "completion",
+        route=result.part.route_id,
+        id=dest.id,
+        lat=dest.lat,
+        lng=dest.lng,
+        time=dest.completed_time.isoformat(),
+        partCompleted=result.part_completed,
+    )
+    # Answer with the next route right away, no newLocation round-trip needed
+    return route_answer(handler)
 
 
 def log_location(handler, data=None):
-    handler.team.location_logs.create(
-        lat=data["lat"],
-        lng=data["lng"],
-    )
+    lat, lng, logged_at = parse_location(data)
+    location_buffer.add(handler.state.team_id, lat, lng, logged_at)
+    handler.publish("location", lat=lat, lng=lng, time=logged_at.isoformat())
     return None
 
 
+def log_locations(handler, data=None):
+    """Batch of pings the app queued while offline: {"locations": [{lat, lng, time}, ...]}."""
+    points = data.get("locations", []) if isinstance(data, dict) else data
+    max_points = getattr(settings, "LOCATION_BATCH_MAX_POINTS", 1000)
+
+    parsed = []
+    for point in (points or [])[:max_points]:
+        try:
+            parsed.append(parse_location(point))
+        except (KeyError, TypeError, ValueError):
+            continue
+    location_buffer.add_many(handler.state.team_id, parsed)
+    if parsed:
+        lat, lng, logged_at = max(parsed, key=lambda point: point[2])
+        handler.publish("location", lat=lat, lng=lng, time=logged_at.isoformat())
+    return {"type": "locationsReceived", "data": {"count": len(parsed)}}
+
+
+@query_budget(12)
 def undo_completion(handler, data=None):
     if handler.team.check_undoable_completion():
         handler.team.undo_last_completion()
+        handler.publish("undo")
     return None
 
 
+# 3 once the team has a thread; its first message creates it (message_threads)
+@query_budget(5)
 def send_message(handler, data=None):
     """Team sends a message to the organisation."""
-    if not handler.team.edition.messaging_enabled:
+    if not handler.state.messaging_enabled:
         return None
     msg = Message.objects.create(
-        edition=handler.team.edition,
+        edition_id=handler.state.edition_id,
         sender_team=handler.team,
         recipient_team=None,  # to organisation
         text=data["text"],
@@ -38,39 +87,92 @@ def send_message(handler, data=None):
     return {"type": "message", "data": msg.to_app_format()}
 
 
+def _message_cursor(data, key):
+    try:
+        return int(data[key]) if data and data.get(key) is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+@query_budget(1)
 def get_messages(handler, data=None):
-    """Return message history for this team."""
-    team = handler.team
-    if not team.edition.messaging_enabled:
-        return {"type": "messageHistory", "data": []}
+    """Return a window of the message history of this team.
+
+    Without parameters: the newest ``MESSAGE_PAGE_SIZE`` messages. ``beforeId``
+    pages back from there, ``afterId`` pages forward from a message the app
+    has, and ``unread`` starts after the team's read cursor (see
+    ``markMessagesRead``). Messages are always sent oldest first; ``hasMore``
+    tells whether the window was cut off.
+    """
+    if not handler.state.messaging_enabled:
+        return {"type": "messageHistory", "data": [], "hasMore": False}
+
+    limit = getattr(settings, "MESSAGE_PAGE_SIZE", 50)
+    try:
+        limit = max(1, min(int((data or {}).get("limit") or limit), limit))
+    except (TypeError, ValueError):
+        pass
+
     messages = Message.objects.filter(
-        edition=team.edition,
-    ).filter(
-        # Broadcasts (recipient=None, sender=None) OR sent to this team OR sent by this team
-        models_q_broadcast_or_team(team)
-    ).order_by("created_at")[:50]
+        models_q_broadcast_or_team(handler.state.team_id),
+        edition_id=handler.state.edition_id,
+    ).select_related("sender_team")
+
+    after_id = _message_cursor(data, "afterId")
+    if after_id is None and data and data.get("unread"):
+        after_id = Subquery(
+            Team.objects.filter(pk=handler.state.team_id).values("messages_read_cursor")
+        )
+    if after_id is not None:
+        page = list(messages.filter(id__gt=after_id).order_by("id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+    else:
+        if (before_id := _message_cursor(data, "beforeId")) is not None:
+            messages = messages.filter(id__lt=before_id)
+        page = list(messages.order_by("-id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
 
     return {
         "type": "messageHistory",
-        "data": [m.to_app_format() for m in messages],
+        "data": [m.to_app_format() for m in page],
+        "hasMore": has_more,
     }
 
 
+@query_budget(1)
+def mark_messages_read(handler, data=None):
+    """Move the team's read cursor forward to message ``id``."""
+    message_id = _message_cursor(data, "id")
+    if message_id is None:
+        return None
+    Team.objects.filter(
+        pk=handler.state.team_id, messages_read_cursor__lt=message_id
+    ).update(messages_read_cursor=message_id)
+    return None
+
+
 def models_q_broadcast_or_team(team):
     """Q filter: messages visible to this team."""
-    from django.db.models import Q
     return (
-        Q(sender_team__isnull=True, recipient_team__isnull=True)  # broadcast
-        | Q(sender_team__isnull=True, recipient_team=team)  # org → this team
+        # Organisation messages: broadcasts (recipient=None) and those for this team
+        Q(sender_team__isnull=True) & (Q(recipient_team__isnull=True) | Q(recipient_team=team))
         | Q(sender_team=team)  # this team → org
     )
 
 
-FUNCTION_MAPPING = {
+# Endpoints that never touch the database; run directly on the event loop.
+INLINE_FUNCTION_MAPPING = {
     "updateLocation": log_location,
+    "updateLocations": log_locations,
+}
+
+FUNCTION_MAPPING = {
     "newLocation": send_new_location,
     "destinationConfirmed": receive_destination_confirmed,
     "undoCompletion": undo_completion,
     "sendMessage": send_message,
     "getMessages": get_messages,
+    "markMessagesRead": mark_messages_read,
 }
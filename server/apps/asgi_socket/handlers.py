@@ -1,19 +1,83 @@
-from django.contrib.auth import authenticate
+from dataclasses import dataclass
 
+from server.apps.dashboard.metrics import QueryTimer, check_budget, metrics
 from server.apps.dashboard.models import Team
+from server.apps.dashboard.team_codes import team_codes
+
+from . import sessions
+from .constants import TYPE_AUTHENTICATION, TYPE_RESUME
+from .handler_functions import FUNCTION_MAPPING, INLINE_FUNCTION_MAPPING, route_answer
+
+
+@dataclass(frozen=True)
+class TeamState:
+    """Immutable per-connection snapshot of everything the socket needs per message."""
+
+    team_id: int
+    edition_id: int
+    messaging_enabled: bool
+    location_interval: int
+
+    @classmethod
+    def from_code(cls, entry):
+        """Build from a ``team_codes.TeamCode``."""
+        return cls(
+            team_id=entry.team_id,
+            edition_id=entry.edition_id,
+            messaging_enabled=entry.messaging_enabled,
+            location_interval=entry.location_interval,
+        )
+
+    @classmethod
+    def from_team(cls, team):
+        """Build from a Team loaded with select_related("edition")."""
+        return cls(
+            team_id=team.id,
+            edition_id=team.edition_id,
+            messaging_enabled=team.edition.messaging_enabled,
+            location_interval=team.location_update_interval,
+        )
+
+    def app_config(self):
+        """Settings the app receives on auth and in "config" pushes."""
+        return {
+            "locationInterval": self.location_interval,
+            "messagingEnabled": self.messaging_enabled,
+        }
 
-from .constants import TYPE_AUTHENTICATION
-from .handler_functions import FUNCTION_MAPPING
 
 class SocketDataHandler:
     consumer = None
-    team = None
+    _team = None
+    state: TeamState | None = None
     is_authenticated = False
+    session: dict | None = None
+    missed: list | None = None
+    route_update: dict | None = None
 
     def __init__(self, consumer) -> None:
         self.consumer = consumer
+        self.events = []
+
+    def publish(self, event_type, **data):
+        """Queue a compact event for the backoffice; the consumer sends it after the request."""
+        self.events.append({"type": event_type, "data": {"team": self.state.team_id, **data}})
+
+    def pop_events(self):
+        events, self.events = self.events, []
+        return events
+
+    @property
+    def team(self):
+        """The Team row, loaded by the first handler that needs more than ``state``."""
+        if self._team is None:
+            self._team = Team.objects.select_related("edition").get(pk=self.state.team_id)
+        return self._team
 
     def authenticate(self, endpoint, data):
+        if endpoint == TYPE_RESUME:
+            return self.resume(data)
+
         # if its not an auth request: ignore
         if not endpoint == TYPE_AUTHENTICATION:
             return None
@@ -22,24 +86,97 @@ class SocketDataHandler:
         if not (auth_str := data["authStr"]):
             return None
 
-        # try to get an Team by auth_str
+        # resolve the code in memory; codes missing there cost one indexed lookup
+        entry = team_codes.lookup(auth_str)
+        if entry is None or not entry.activated:
+            return None
+
+        # when there is an team set everything right
+        self.state = TeamState.from_code(entry)
+        self._start_session(auth_str.strip())
+        return self.state
+
+    def resume(self, data):
+        """Authenticate with a session token; ``self.missed`` gets the events since lastSeq/lastEditionSeq.
+
+        ``self.missed`` is None when not all of them are kept anymore (the app
+        then needs a full sync). ``self.route_update`` is the "route" answer
+        when the route changed since the ``routeVersion`` of the last "route"
+        the app got.
+        """
+        claims = sessions.verify_token((data or {}).get("session"))
+        if claims is None:
+            return None
+        team_id, code_hash = claims
         try:
-            self.team = Team.objects.get(code=auth_str)
+            self._team = Team.objects.select_related("edition").exclude(code="").get(
+                pk=team_id, is_activated=True
+            )
         except Team.DoesNotExist:
             return None
+        # Regenerating the code ends the sessions of the old one
+        if not sessions.code_matches(code_hash, self._team.code):
+            self._team = None
+            return None
+        self.state = TeamState.from_team(self._team)
 
-        # when there is an team set everything right
-        self.team.go_online()
+        try:
+            last_seq = int(data.get("lastSeq") or 0)
+            last_edition_seq = int(data.get("lastEditionSeq") or 0)
+        except (TypeError, ValueError):
+            last_seq = last_edition_seq = -1
+        self._start_session(self._team.code)
+        team_events = sessions.events_since(
+            sessions.team_stream(team_id), last_seq, self.session["seq"]
+        )
+        edition_events = sessions.events_since(
+            sessions.edition_stream(self.state.edition_id), last_edition_seq, self.session["editionSeq"]
+        )
+        self.missed = (
+            None if team_events is None or edition_events is None
+            else team_events + edition_events
+        )
+        route = route_answer(self)
+        if data.get("routeVersion") != route["routeVersion"]:
+            self.route_update = route
+        return self.state
+
+    def _start_session(self, code):
         self.is_authenticated = True
-        return self.team
+        team_stream = sessions.team_stream(self.state.team_id)
+        edition_stream = sessions.edition_stream(self.state.edition_id)
+        seqs = sessions.current_seqs([team_stream, edition_stream])
+        self.session = {
+            "session": sessions.issue_token(self.state.team_id, code),
+            "seq": seqs[team_stream],
+            "editionSeq": seqs[edition_stream],
+        }
+
+    def reload_state(self):
+        """Reload team + snapshot after a backoffice change; returns the new state."""
+        self._team = Team.objects.select_related("edition").get(pk=self.state.team_id)
+        self.state = TeamState.from_team(self._team)
+        return self.state
 
     def handle_request(self, endpoint, data=None):
         """Run the handler and return optional response dict to send."""
-        self.team.touch()
-        return FUNCTION_MAPPING[endpoint](self, data)
+        func = FUNCTION_MAPPING[endpoint]
+        name = f"socket:{endpoint}"
+        with QueryTimer() as timer:
+            response = func(self, data)
+        metrics.record(name, timer)
+        check_budget(name, func, timer)
+        return response
 
-    def close(self):
-        self.team.go_offline()
+    def handle_inline(self, endpoint, data=None):
+        """Run a database-free handler directly on the event loop."""
+        func = INLINE_FUNCTION_MAPPING[endpoint]
+        name = f"socket:{endpoint}"
+        with QueryTimer() as timer:
+            response = func(self, data)
+        metrics.record(name, timer)
+        check_budget(name, func, timer)
+        return response
 
 
 """
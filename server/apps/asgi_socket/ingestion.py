@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from server.apps.dashboard.geofence import geofence_engine, record_hits
+from server.apps.dashboard.metrics import QueryTimer, metrics
+from server.apps.dashboard.models import LocationLog
+from server.apps.dashboard.positions import record_positions
+
+logger = logging.getLogger(__name__)
+
+
+def parse_location(data):
+    """Return (lat, lng, time) for a single location ping from the app.
+
+    ``time`` is optional (ISO 8601); pings without it are stamped on arrival.
+    Raises ValueError/KeyError/TypeError for malformed pings.
+    """
+    lat = float(data["lat"])
+    lng = float(data["lng"])
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("coordinates out of range")
+
+    logged_at = None
+    if raw_time := data.get("time"):
+        logged_at = parse_datetime(str(raw_time))
+        if logged_at is not None and timezone.is_naive(logged_at):
+            logged_at = timezone.make_aware(logged_at)
+    return lat, lng, logged_at or timezone.now()
+
+
+class LocationBuffer:
+    """
+    In-process buffer for location pings of all connected teams.
+
+    Pings are collected on the event loop without touching the database and
+    written with one ``bulk_create`` every ``flush_interval_ms``, or as soon as
+    ``max_rows`` pings are waiting. Outside an event loop (management commands,
+    tests) pings are written immediately.
+
+    A failed flush is retried with the next one; after ``max_retries`` failures
+    in a row the pings are written one by one and those the database rejects
+    (e.g. of a deleted team) are dropped, so one bad ping cannot hold up the
+    rest. ``close()`` writes what is still queued when the process exits.
+    """
+
+    def __init__(self, flush_interval_ms=1000, max_rows=500, max_pending=20000, max_retries=3):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._pending: list[LocationLog] = []
+        self._failures = 0
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+
+        # Counters (see stats())
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.max_queue_depth = 0
+
+    # ── Producer side (event loop) ────────────────────────────────
+
+    def add(self, team_id, lat, lng, logged_at=None):
+        self._append([
+            LocationLog(
+                team_id=team_id, lat=lat, lng=lng,
+                time=logged_at or timezone.now(),
+            )
+        ])
+
+    def add_many(self, team_id, points):
+        """Queue a batch of (lat, lng, time) tuples for one team."""
+        self._append([
+            LocationLog(team_id=team_id, lat=lat, lng=lng, time=logged_at)
+            for lat, lng, logged_at in points
+        ])
+
+    def _append(self, rows):
+        if not rows:
+            return
+        self.received += len(rows)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop: nothing to batch with, write straight away.
+            self._write(rows)
+            return
+
+        self._pending.extend(rows)
+        self._trim()
+        self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+        self._ensure_task(loop)
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    def _trim(self):
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.warning("LocationBuffer: dropped %d pings, buffer full", overflow)
+
+    def _ensure_task(self, loop):
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    # ── Flushing ──────────────────────────────────────────────────
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def flush(self):
+        """Write everything that is currently queued."""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        write = self._write if self._failures < self.max_retries else self._write_each
+        started = time.perf_counter()
+        try:
+            written = await database_sync_to_async(write)(rows)
+        except Exception:
+            self.failed_flushes += 1
+            self._failures += 1
+            logger.exception("LocationBuffer: flush of %d pings failed", len(rows))
+            # Put them back in front so they are retried on the next tick
+            self._pending[:0] = rows
+            self._trim()
+            return 0
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._failures = 0
+
+        if elapsed_ms > self.flush_interval * 1000:
+            logger.warning(
+                "LocationBuffer: flush of %d pings took %.0f ms", len(rows), elapsed_ms
+            )
+        return written
+
+    def close(self):
+        """Write what is still queued; called at server exit (see ``server.asgi``)."""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            return self._write(rows)
+        except Exception:
+            logger.exception("LocationBuffer: flush of %d pings failed, writing them one by one", len(rows))
+        return self._write_each(rows)
+
+    def _write(self, rows):
+        with QueryTimer() as timer, transaction.atomic():
+            LocationLog.objects.bulk_create(rows, batch_size=self.max_rows)
+            record_positions(rows)
+        self._written(rows, timer)
+        return len(rows)
+
+    def _write_each(self, rows):
+        """Write ``rows`` one at a time, dropping the ones the database rejects."""
+        with QueryTimer() as timer:
+            written = []
+            for row in rows:
+                try:
+                    with transaction.atomic():
+                        row.save(force_insert=True)
+                except (IntegrityError, DataError):
+                    self.rejected += 1
+                    logger.warning("LocationBuffer: dropped ping of team %s, rejected by the database", row.team_id)
+                    continue
+                written.append(row)
+            with transaction.atomic():
+                record_positions(written)
+        self._written(written, timer)
+        return len(written)
+
+    def _written(self, rows, timer):
+        metrics.record("ingestion:flush", timer)
+        self.written += len(rows)
+        self.flushes += 1
+        with QueryTimer() as timer:
+            self._geofence(rows)
+        metrics.record("ingestion:geofence", timer)
+
+    def _geofence(self, rows):
+        """Check the written pings against the open destinations; never fails the flush."""
+        from .consumers import push_to_backoffice
+
+        try:
+            hits = geofence_engine.evaluate(rows)
+            if not hits:
+                return
+            record_hits(hits)
+        except Exception:
+            logger.exception("LocationBuffer: geofence evaluation of %d pings failed", len(rows))
+            return
+        for hit in hits:
+            push_to_backoffice(hit.fence.edition_id, {"type": "geofence", "data": hit.to_live_format()})
+
+    # ── Introspection ─────────────────────────────────────────────
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+location_buffer = LocationBuffer(
+    flush_interval_ms=getattr(settings, "LOCATION_FLUSH_INTERVAL_MS", 1000),
+    max_rows=getattr(settings, "LOCATION_FLUSH_MAX_ROWS", 500),
+    max_retries=getattr(settings, "LOCATION_FLUSH_RETRIES", 3),
+)
@@ -0,0 +1,227 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL refuses NOTIFY payloads of 8000 bytes or more; larger messages are
+# sent base64-encoded in parts of CHUNK_CHARS (plus a small envelope)
+NOTIFY_MAX_BYTES = 7999
+CHUNK_CHARS = 7500
+MAX_CHUNKS = 128
+
+
+class MessageTooLarge(ValueError):
+    """The message does not fit in ``MAX_CHUNKS`` notifications; nothing was published."""
+
+
+class PostgresChannelLayer(InMemoryChannelLayer):
+    """
+    Channel layer for several Daphne processes sharing one PostgreSQL database.
+
+    Channels and group membership live in the process that owns the consumer
+    (like the in-memory layer). ``group_send`` delivers to the local members
+    straight away and publishes the message with ``NOTIFY``; every other
+    process ``LISTEN``s and delivers it to its own members. ``send`` to a
+    channel of another process goes the same way.
+
+    Messages must be JSON-serialisable. One of 8000 bytes or more (a route
+    payload, a long message) is split over several notifications and put
+    together again by the listeners; a message over ``MAX_CHUNKS`` parts
+    raises ``MessageTooLarge``.
+    """
+
+    def __init__(self, pg_channel="channels_layer", database="default", reconnect_delay=2, **kwargs):
+        super().__init__(**kwargs)
+        self.pg_channel = pg_channel
+        self.database = database
+        self.reconnect_delay = reconnect_delay
+        # Unique per process; also the prefix of our channel names
+        self.origin = uuid.uuid4().hex[:12]
+
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = threading.Lock()
+        self._listen_loop = None
+        self._listen_task = None
+        self._chunk_ids = itertools.count()
+        self._partial = OrderedDict()  # (origin, id) → received parts
+
+    # ── Connections ───────────────────────────────────────────────
+
+    def _connect(self):
+        import psycopg2
+
+        db = settings.DATABASES[self.database]
+        conn = psycopg2.connect(
+            dbname=db.get("NAME"),
+            user=db.get("USER") or None,
+            password=db.get("PASSWORD") or None,
+            host=db.get("HOST") or None,
+            port=db.get("PORT") or None,
+            **db.get("OPTIONS", {}),
+        )
+        conn.autocommit = True
+        return conn
+
+    def _notify(self, payload):
+        """Runs in a worker thread under ``_notify_lock``; reconnects once if the connection dropped."""
+        import psycopg2
+
+        for attempt in (1, 2):
+            try:
+                if self._notify_conn is None or self._notify_conn.closed:
+                    self._notify_conn = self._connect()
+                with self._notify_conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", [self.pg_channel, payload])
+                return
+            except psycopg2.OperationalError:
+                self._notify_conn = None
+                if attempt == 2:
+                    raise
+
+    def _notifications(self, envelope):
+        """The NOTIFY payloads for ``envelope``: itself, or its parts when too large."""
+        payload = json.dumps(envelope, separators=(",", ":"))
+        if len(payload.encode()) <= NOTIFY_MAX_BYTES:
+            return [payload]
+
+        encoded = base64.b64encode(payload.encode()).decode()
+        parts = [encoded[i:i + CHUNK_CHARS] for i in range(0, len(encoded), CHUNK_CHARS)]
+        if len(parts) > MAX_CHUNKS:
+            raise MessageTooLarge(
+                f"message for {envelope.get('g') or envelope.get('c')} is "
+                f"{len(payload.encode())} bytes"
+            )
+        chunk_id = next(self._chunk_ids)
+        return [
+            json.dumps({"o": self.origin, "p": [chunk_id, index, len(parts)], "d": part},
+                       separators=(",", ":"))
+            for index, part in enumerate(parts)
+        ]
+
+    def _notify_all(self, payloads):
+        # One connection, one lock: the parts arrive in order and are not interleaved
+        with self._notify_lock:
+            for payload in payloads:
+                self._notify(payload)
+
+    async def _publish(self, payloads):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._notify_all, payloads)
+
+    # ── Listening ─────────────────────────────────────────────────
+
+    def _ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self._listen_task is not None and not self._listen_task.done() and self._listen_loop is loop:
+            return
+        self._listen_loop = loop
+        self._listen_task = loop.create_task(self._listen())
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            readable = asyncio.Event()
+            try:
+                conn = await loop.run_in_executor(None, self._connect)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.pg_channel}"')
+                self._listen_conn = conn
+                loop.add_reader(conn.fileno(), readable.set)
+                try:
+                    while True:
+                        await readable.wait()
+                        readable.clear()
+                        conn.poll()
+                        while conn.notifies:
+                            await self._on_notify(conn.notifies.pop(0).payload)
+                finally:
+                    loop.remove_reader(conn.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("PostgresChannelLayer: listener failed, reconnecting")
+            finally:
+                if self._listen_conn is not None:
+                    self._listen_conn.close()
+                    self._listen_conn = None
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _on_notify(self, payload):
+        try:
+            envelope = json.loads(payload)
+        except ValueError:
+            logger.warning("PostgresChannelLayer: ignoring malformed notification")
+            return
+        if envelope.get("o") == self.origin:
+            return  # our own message, already delivered locally
+        if "p" in envelope:
+            envelope = self._add_part(envelope)
+            if envelope is None:
+                return
+
+        if group := envelope.get("g"):
+            await super().group_send(group, envelope["m"])
+        elif (channel := envelope.get("c")) and self._is_local(channel):
+            await super().send(channel, envelope["m"])
+
+    def _add_part(self, part):
+        """Keep one part of a split message; returns the message once all parts are in."""
+        chunk_id, index, count = part["p"]
+        key = (part["o"], chunk_id)
+        parts = self._partial.setdefault(key, {})
+        parts[index] = part["d"]
+        if len(parts) < count:
+            # Parts of messages whose rest never came (listener reconnect) are dropped
+            while len(self._partial) > MAX_CHUNKS:
+                self._partial.popitem(last=False)
+            return None
+        del self._partial[key]
+        try:
+            return json.loads(base64.b64decode("".join(parts[i] for i in range(count))))
+        except (KeyError, ValueError):
+            logger.warning("PostgresChannelLayer: ignoring malformed split notification")
+            return None
+
+    # ── Channel layer API ─────────────────────────────────────────
+
+    def _is_local(self, channel):
+        return channel.startswith(f"{self.origin}.")
+
+    async def new_channel(self, prefix="specific."):
+        self._ensure_listener()
+        return await super().new_channel(prefix=f"{self.origin}.{prefix}")
+
+    async def send(self, channel, message):
+        if self._is_local(channel):
+            await super().send(channel, message)
+        else:
+            await self._publish(self._notifications({"o": self.origin, "c": channel, "m": message}))
+
+    async def group_add(self, group, channel):
+        self._ensure_listener()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        # Raises MessageTooLarge before anyone got the message
+        payloads = self._notifications({"o": self.origin, "g": group, "m": message})
+        await super().group_send(group, message)
+        await self._publish(payloads)
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            self._listen_task = None
+        for conn in (self._listen_conn, self._notify_conn):
+            if conn is not None and not conn.closed:
+                conn.close()
+        self._listen_conn = self._notify_conn = None
@@ -0,0 +1,122 @@
+"""
+Resumable app sessions.
+
+On authentication the app gets a signed session token; it names the team and
+carries a keyed hash of the team code, so regenerating a (leaked) code ends
+the sessions opened with the old one. Everything pushed to a
+team (``push_to_team``) or to its edition (``push_to_edition``) gets a
+sequence number per stream and is kept for replay in the database
+(ReplayStream holds the counter, ReplayEvent the payloads), so every process
+numbers the same stream and a resume works on any process and after a
+restart. After a reconnect the app sends "resume" with the token, the last
+``seq``/``editionSeq`` it saw and the ``routeVersion`` of its last "route"
+answer. It then gets only the events it missed, and its route only when the
+route changed, without a code lookup and without pulling ``newLocation`` and
+``getMessages`` again. When the gap is larger than ``SOCKET_REPLAY_SIZE`` (or
+the events are older than ``SOCKET_REPLAY_TTL``) the resume answer says
+``complete: false`` and the app does a full sync as after a normal login.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from server.apps.dashboard.models import ReplayEvent, ReplayStream
+
+TOKEN_SALT = "asgi_socket.session"
+
+
+def code_hash(code):
+    return salted_hmac(TOKEN_SALT, code).hexdigest()[:16]
+
+
+def issue_token(team_id, code):
+    return signing.dumps({"team": team_id, "code": code_hash(code)}, salt=TOKEN_SALT, compress=True)
+
+
+def verify_token(token):
+    """(team id, code hash) of a valid, unexpired session token, or None."""
+    try:
+        data = signing.loads(
+            token, salt=TOKEN_SALT, max_age=getattr(settings, "SOCKET_SESSION_MAX_AGE", 12 * 3600)
+        )
+    except (signing.BadSignature, TypeError):
+        return None
+    if "team" not in data or "code" not in data:
+        return None
+    return data["team"], data["code"]
+
+
+def code_matches(hashed, code):
+    """Whether the code hash of a token belongs to the team's current ``code``."""
+    return constant_time_compare(hashed, code_hash(code))
+
+
+def team_stream(team_id):
+    return f"team.{team_id}"
+
+
+def edition_stream(edition_id):
+    return f"edition.{edition_id}"
+
+
+def current_seqs(streams):
+    """Last sequence number per stream, in one query; 0 for streams without events."""
+    found = dict(ReplayStream.objects.filter(name__in=streams).values_list("name", "seq"))
+    return {stream: found.get(stream, 0) for stream in streams}
+
+
+def current_seq(stream):
+    return current_seqs([stream])[stream]
+
+
+def _next_seq(stream):
+    """Increment the counter of ``stream``; the row stays locked until the transaction ends."""
+    if not ReplayStream.objects.filter(name=stream).update(seq=F("seq") + 1):
+        try:
+            with transaction.atomic():
+                ReplayStream.objects.create(name=stream, seq=1)
+            return 1
+        except IntegrityError:
+            # Created by a concurrent push
+            ReplayStream.objects.filter(name=stream).update(seq=F("seq") + 1)
+    return ReplayStream.objects.values_list("seq", flat=True).get(name=stream)
+
+
+def record_event(stream, payload, field="seq"):
+    """Number ``payload`` on ``stream`` (as ``field``) and keep it for replay; returns the numbered payload."""
+    size = getattr(settings, "SOCKET_REPLAY_SIZE", 100)
+    with transaction.atomic():
+        seq = _next_seq(stream)
+        payload = {**payload, field: seq}
+        ReplayEvent.objects.create(stream=stream, seq=seq, payload=payload)
+        if seq % size == 0:
+            # Keep between one and two buffers per stream
+            ReplayEvent.objects.filter(stream=stream, seq__lte=seq - size).delete()
+    return payload
+
+
+def events_since(stream, last_seq, current=None):
+    """Events after ``last_seq`` in order, or None when some of them are no longer kept."""
+    if current is None:
+        current = current_seq(stream)
+    if last_seq == current:
+        return []
+    if last_seq < 0 or last_seq > current:
+        # Unknown position: nothing to compare against
+        return None
+    if current - last_seq > getattr(settings, "SOCKET_REPLAY_SIZE", 100):
+        return None
+    kept_since = timezone.now() - timedelta(seconds=getattr(settings, "SOCKET_REPLAY_TTL", 3600))
+    payloads = list(
+        ReplayEvent.objects.filter(
+            stream=stream, seq__gt=last_seq, seq__lte=current, created_at__gte=kept_since
+        ).order_by("seq").values_list("payload", flat=True)
+    )
+    if len(payloads) != current - last_seq:
+        return None
+    return payloads
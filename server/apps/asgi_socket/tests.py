@@ -0,0 +1,787 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from server.apps.dashboard.constants import DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.distribution import distribute_route
+from server.apps.dashboard.metrics import metrics
+from server.apps.dashboard.team_codes import team_codes
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    LocationLog,
+    Message,
+    Organization,
+    ReplayEvent,
+    Route,
+    RoutePart,
+    Team,
+    UserProfile,
+)
+
+from server.apps.dashboard import route_cache
+
+from . import consumers, layers, sessions
+from .admission import Admission, Busy, RateLimiter
+from .handlers import SocketDataHandler
+from .ingestion import LocationBuffer, parse_location
+from .layers import PostgresChannelLayer
+from .router import urls
+
+
+def _create_team(code="TEAM1"):
+    org = Organization.objects.create(
+        name="Org", contact_person="X", contact_email="x@x.nl"
+    )
+    event = Event.objects.create(name="Event", organization=org)
+    edition = Edition.objects.create(
+        name="Edition",
+        date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+        date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+        event=event,
+    )
+    return Team.objects.create(
+        name="Team A",
+        code=code,
+        contact_name="Tester",
+        contact_email="t@t.nl",
+        edition=edition,
+    )
+
+
+class ParseLocationTest(TestCase):
+    """Validation of incoming location pings."""
+
+    def test_uses_client_time_when_given(self):
+        lat, lng, logged_at = parse_location(
+            {"lat": "52.1", "lng": 6.2, "time": "2026-06-01T10:15:00+02:00"}
+        )
+        self.assertEqual((lat, lng), (52.1, 6.2))
+        self.assertEqual(logged_at.isoformat(), "2026-06-01T10:15:00+02:00")
+
+    def test_naive_time_is_made_aware(self):
+        _, _, logged_at = parse_location({"lat": 52, "lng": 6, "time": "2026-06-01T10:15:00"})
+        self.assertTrue(timezone.is_aware(logged_at))
+
+    def test_out_of_range_is_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_location({"lat": 152, "lng": 6})
+
+
+class LocationBufferTest(TransactionTestCase):
+    """Buffered bulk writes of location pings."""
+
+    def setUp(self):
+        self.team = _create_team()
+
+    def test_add_without_event_loop_writes_immediately(self):
+        buffer = LocationBuffer()
+        buffer.add(self.team.id, 52.0, 6.0)
+        self.assertEqual(LocationLog.objects.filter(team=self.team).count(), 1)
+        self.assertEqual(buffer.queue_depth(), 0)
+
+    async def test_pings_are_batched_until_flush(self):
+        buffer = LocationBuffer(flush_interval_ms=60_000, max_rows=1000)
+        now = timezone.now()
+        buffer.add(self.team.id, 52.0, 6.0)
+        buffer.add_many(self.team.id, [(52.1, 6.1, now), (52.2, 6.2, now)])
+
+        self.assertEqual(buffer.queue_depth(), 3)
+        self.assertEqual(await LocationLog.objects.acount(), 0)
+
+        written = await buffer.flush()
+
+        self.assertEqual(written, 3)
+        self.assertEqual(buffer.queue_depth(), 0)
+        self.assertEqual(await LocationLog.objects.filter(team=self.team).acount(), 3)
+        stats = buffer.stats()
+        self.assertEqual(stats["flushes"], 1)
+        self.assertEqual(stats["max_queue_depth"], 3)
+
+    async def test_rejected_pings_are_dropped_after_retries(self):
+        buffer = LocationBuffer(flush_interval_ms=60_000, max_retries=1)
+        buffer.add(self.team.id, 52.0, 6.0)
+        buffer.add(self.team.id + 1000, 52.1, 6.1)  # team deleted meanwhile
+
+        self.assertEqual(await buffer.flush(), 0)
+        self.assertEqual(buffer.queue_depth(), 2)
+
+        self.assertEqual(await buffer.flush(), 1)
+        self.assertEqual(buffer.queue_depth(), 0)
+        self.assertEqual(await LocationLog.objects.filter(team=self.team).acount(), 1)
+        self.assertEqual((buffer.stats()["failed_flushes"], buffer.stats()["rejected"]), (1, 1))
+
+        # Back to batches after a good flush
+        buffer.add(self.team.id, 52.2, 6.2)
+        self.assertEqual(await buffer.flush(), 1)
+        self.assertEqual(await LocationLog.objects.filter(team=self.team).acount(), 2)
+
+    async def test_close_writes_queued_pings(self):
+        buffer = LocationBuffer(flush_interval_ms=60_000)
+        buffer.add(self.team.id, 52.0, 6.0)
+
+        self.assertEqual(await sync_to_async(buffer.close)(), 1)
+        self.assertEqual(buffer.queue_depth(), 0)
+        self.assertEqual(await LocationLog.objects.filter(team=self.team).acount(), 1)
+
+
+class PresenceTest(TestCase):
+    """In-memory presence registry and its bulk write-back."""
+
+    def setUp(self):
+        self.team = _create_team()
+        consumers._presence.clear()
+        consumers._presence_dirty.clear()
+
+    def tearDown(self):
+        consumers._presence.clear()
+        consumers._presence_dirty.clear()
+
+    def test_activity_is_not_written_until_flush(self):
+        consumers.mark_seen(self.team.id, online=True)
+        self.team.refresh_from_db()
+        self.assertFalse(self.team.online)
+        self.assertIsNone(self.team.last_seen)
+
+        consumers.flush_presence()
+
+        self.team.refresh_from_db()
+        self.assertTrue(self.team.online)
+        self.assertIsNotNone(self.team.last_seen)
+
+    def test_apply_presence_overlays_live_state(self):
+        consumers.mark_seen(self.team.id, online=True)
+        [team] = consumers.apply_presence(Team.objects.filter(pk=self.team.pk))
+        self.assertTrue(team.online)
+
+    def test_offline_team_is_flushed_and_forgotten(self):
+        consumers.mark_seen(self.team.id, online=True)
+        consumers.flush_presence()
+        consumers.mark_seen(self.team.id, online=False)
+
+        with self.assertNumQueries(2):
+            consumers.flush_presence()
+
+        self.team.refresh_from_db()
+        self.assertFalse(self.team.online)
+        self.assertNotIn(self.team.id, consumers.get_presence())
+
+    def test_stale_online_flag_is_reset(self):
+        Team.objects.filter(pk=self.team.pk).update(
+            online=True, last_seen=timezone.now() - timezone.timedelta(hours=2)
+        )
+        consumers.flush_presence()
+        self.team.refresh_from_db()
+        self.assertFalse(self.team.online)
+
+
+class TeamStateTest(TestCase):
+    """Per-connection team snapshot loaded on auth."""
+
+    def setUp(self):
+        self.team = _create_team()
+
+    def test_authenticate_loads_state_in_fixed_queries(self):
+        team_codes.warm()
+        handler = SocketDataHandler(consumer=None)
+        # The stream positions of the session; the state comes from the code table
+        with self.assertNumQueries(1):
+            handler.authenticate("authenticate", {"authStr": "TEAM1"})
+
+        state = handler.state
+        self.assertEqual(state.team_id, self.team.id)
+        self.assertEqual(state.edition_id, self.team.edition_id)
+        self.assertEqual(
+            state.app_config(),
+            {"locationInterval": self.team.location_update_interval, "messagingEnabled": False},
+        )
+
+    def test_unknown_code_is_rejected_with_one_query(self):
+        team_codes.warm()
+        handler = SocketDataHandler(consumer=None)
+        with self.assertNumQueries(1):
+            self.assertIsNone(handler.authenticate("authenticate", {"authStr": "NOPE1"}))
+        self.assertFalse(handler.is_authenticated)
+
+    def test_reload_state_picks_up_backoffice_changes(self):
+        handler = SocketDataHandler(consumer=None)
+        handler.authenticate("authenticate", {"authStr": "TEAM1"})
+        Team.objects.filter(pk=self.team.pk).update(location_update_interval=30)
+
+        self.assertEqual(handler.reload_state().location_interval, 30)
+
+
+@override_settings(
+    SERVER_URI="http://testserver",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class HandlerBudgetTest(TestCase):
+    """Socket handlers are measured and stay within their query budget."""
+
+    def setUp(self):
+        self.team = _create_team()
+        self.team.edition.messaging_enabled = True
+        self.team.edition.save()
+        route = Route.objects.create(name="Route", edition=self.team.edition)
+        for order in (1, 2):
+            part = RoutePart.objects.create(name=f"Part {order}", route=route, order=order)
+            Destination.objects.create(
+                lat=52.0 + order * 0.01, lng=6.0,
+                destination_type=DESTINATION_TYPE_MANDATORY, routepart=part,
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            distribute_route(route)
+        self.handler = SocketDataHandler(consumer=None)
+        self.handler.authenticate("authenticate", {"authStr": "TEAM1"})
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_handlers_are_recorded(self):
+        self.handler.handle_request("newLocation")
+        destination_id = self.team.teamrouteparts.order_by("order").first().destinations.get().id
+        self.handler.handle_request("destinationConfirmed", {"id": destination_id})
+        self.handler.handle_request("undoCompletion")
+        self.handler.handle_request("sendMessage", {"text": "Hallo"})
+        self.handler.handle_request("getMessages")
+        # Without an event loop the ping is written (and geofenced) right away
+        self.handler.handle_inline("updateLocation", {"lat": 52.0, "lng": 6.0})
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(
+            sorted(snapshot),
+            ["ingestion:flush", "ingestion:geofence", "socket:destinationConfirmed",
+             "socket:getMessages", "socket:newLocation", "socket:sendMessage",
+             "socket:undoCompletion", "socket:updateLocation"],
+        )
+        self.assertEqual(snapshot["socket:getMessages"]["count"], 1)
+        self.assertEqual(snapshot["socket:getMessages"]["queries"]["max"], 1)
+
+
+@override_settings(MESSAGE_PAGE_SIZE=2)
+class MessageHistoryTest(TestCase):
+    """getMessages windows (newest first, keyset cursors) and the read cursor."""
+
+    def setUp(self):
+        self.team = _create_team()
+        self.team.edition.messaging_enabled = True
+        self.team.edition.save()
+        other = Team.objects.create(
+            name="Team B", code="TEAM2", contact_name="Tester",
+            contact_email="t@t.nl", edition=self.team.edition,
+        )
+        edition = self.team.edition
+        self.visible = [
+            Message.objects.create(edition=edition, text="Welkom"),
+            Message.objects.create(edition=edition, recipient_team=self.team, text="Voor jou"),
+            Message.objects.create(edition=edition, sender_team=self.team, text="Hallo"),
+            Message.objects.create(edition=edition, text="Pauze"),
+        ]
+        Message.objects.create(edition=edition, recipient_team=other, text="Niet voor jou")
+        Message.objects.create(edition=edition, sender_team=other, text="Van B")
+
+        self.handler = SocketDataHandler(consumer=None)
+        self.handler.authenticate("authenticate", {"authStr": "TEAM1"})
+
+    def history(self, **data):
+        response = self.handler.handle_request("getMessages", data)
+        return [m["id"] for m in response["data"]], response["hasMore"]
+
+    def ids(self, *indexes):
+        return [self.visible[i].id for i in indexes]
+
+    def test_newest_window_and_paging_back(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.history(), (self.ids(2, 3), True))
+        self.assertEqual(self.history(beforeId=self.visible[2].id), (self.ids(0, 1), False))
+
+    def test_paging_forward(self):
+        self.assertEqual(self.history(afterId=self.visible[0].id), (self.ids(1, 2), True))
+        self.assertEqual(self.history(afterId=self.visible[2].id), (self.ids(3), False))
+
+    def test_unread_follows_the_read_cursor(self):
+        self.assertEqual(self.history(unread=True), (self.ids(0, 1), True))
+
+        self.handler.handle_request("markMessagesRead", {"id": self.visible[2].id})
+        self.assertEqual(self.history(unread=True), (self.ids(3), False))
+
+        # The cursor never moves back
+        self.handler.handle_request("markMessagesRead", {"id": self.visible[0].id})
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.messages_read_cursor, self.visible[2].id)
+
+
+class PushTest(TransactionTestCase):
+    """Pushes from sync code reach connected sockets through channel-layer groups."""
+
+    def setUp(self):
+        self.team = _create_team()
+        self.staff = User.objects.create_user("staff", is_staff=True)
+        UserProfile.objects.create(user=self.staff, organization=self.team.edition.event.organization)
+        self.application = URLRouter(urls)
+        route_cache._cache().clear()
+
+    async def _connect_app(self, endpoint="authenticate", data=None):
+        communicator = WebsocketCommunicator(self.application, "/ws/app/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_to(text_data=json.dumps(
+            {"endpoint": endpoint, "data": data or {"authStr": "TEAM1"}}
+        ))
+        auth = json.loads(await communicator.receive_from())
+        self.assertEqual(auth["data"]["result"], 1)
+        communicator.session = auth["data"]
+        return communicator
+
+    async def test_push_to_team_and_edition(self):
+        communicator = await self._connect_app()
+
+        await sync_to_async(consumers.push_to_team)(self.team.id, {"type": "ping"})
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "ping", "seq": 1})
+
+        await sync_to_async(consumers.push_to_edition)(self.team.edition_id, {"type": "all"})
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "all", "editionSeq": 1})
+
+        await communicator.disconnect()
+
+    async def _connect_backoffice(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/backoffice/{self.team.edition_id}/"
+        )
+        communicator.scope["user"] = self.staff
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_broadcasts_outlive_the_group_expiry(self):
+        layer = get_channel_layer()
+        if consumers._process_task is not None:
+            consumers._process_task.cancel()
+        with mock.patch.object(layer, "group_expiry", 4):
+            communicator = await self._connect_app()
+            joined = max(layer.groups[consumers.BROADCAST_GROUP].values())
+
+            # Two expiries later; the membership is renewed every second
+            clock = mock.Mock(time=lambda: time.time() + 8)
+            with mock.patch("channels.layers.time", clock):
+                for _ in range(30):
+                    if max(layer.groups[consumers.BROADCAST_GROUP].values()) > joined + 4:
+                        break
+                    await asyncio.sleep(0.1)
+                await sync_to_async(consumers.push_to_edition)(self.team.edition_id, {"type": "all"})
+                self.assertEqual(
+                    json.loads(await communicator.receive_from()), {"type": "all", "editionSeq": 1}
+                )
+        await communicator.disconnect()
+
+    async def test_invalidations_of_other_processes_are_applied(self):
+        communicator = await self._connect_app()
+        self.assertIsNotNone(team_codes._codes)
+
+        await sync_to_async(consumers._group_send)(consumers.INVALIDATION_GROUP, {
+            "type": "cache.invalidate", "origin": "other", "cache": "team_codes", "ids": None,
+        })
+        for _ in range(20):
+            if team_codes._codes is None:
+                break
+            await asyncio.sleep(0.05)
+        self.assertIsNone(team_codes._codes)
+        await communicator.disconnect()
+
+    async def test_route_invalidations_of_other_processes_are_applied(self):
+        communicator = await self._connect_app()
+        await self._route_version(communicator)
+        version = route_cache.get_versions([self.team.id])[self.team.id]
+
+        await sync_to_async(consumers._group_send)(consumers.INVALIDATION_GROUP, {
+            "type": "cache.invalidate", "origin": "other", "cache": "route_payloads",
+            "ids": [self.team.id],
+        })
+        for _ in range(20):
+            if route_cache.get_versions([self.team.id])[self.team.id] != version:
+                break
+            await asyncio.sleep(0.05)
+        self.assertNotEqual(route_cache.get_versions([self.team.id])[self.team.id], version)
+        await communicator.disconnect()
+
+    async def test_edition_broadcast_reports_delivery(self):
+        communicator = await self._connect_app()
+        backoffice = await self._connect_backoffice()
+
+        message = await Message.objects.acreate(edition_id=self.team.edition_id, text="Hallo")
+        await sync_to_async(consumers.push_to_edition)(
+            self.team.edition_id, {"type": "all"}, report_message=message.id
+        )
+
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "all", "editionSeq": 1})
+        report = json.loads(await backoffice.receive_from())
+        self.assertEqual(report["type"], "broadcastReport")
+        self.assertEqual(
+            report["data"], {"id": message.id, "recipients": 1, "delivered": 1, "dropped": 0}
+        )
+        # Kept on the message row for the messages page
+        self.assertEqual(
+            await sync_to_async(consumers.broadcast_report)(self.team.edition_id), report["data"]
+        )
+        await backoffice.disconnect()
+        await communicator.disconnect()
+
+    async def test_refresh_pushes_changed_config(self):
+        communicator = await self._connect_app()
+        await Team.objects.filter(pk=self.team.pk).aupdate(location_update_interval=42)
+
+        await sync_to_async(consumers.refresh_team_state)(self.team.id)
+
+        self.assertEqual(
+            json.loads(await communicator.receive_from()),
+            {"type": "config", "data": {"locationInterval": 42}},
+        )
+        await communicator.disconnect()
+
+    async def test_app_events_are_published_to_backoffice(self):
+        backoffice = await self._connect_backoffice()
+        communicator = await self._connect_app()
+        presence = json.loads(await backoffice.receive_from())
+        self.assertEqual(presence, {"type": "presence", "data": {"team": self.team.id, "online": True}})
+
+        for lat in (52.1, 52.2):
+            await communicator.send_to(text_data=json.dumps(
+                {"endpoint": "updateLocation", "data": {"lat": lat, "lng": 6.1}}
+            ))
+
+        # Coalesced: one message with the newest position per team
+        event = json.loads(await backoffice.receive_from(timeout=3))
+        self.assertEqual(event["type"], "locations")
+        self.assertEqual([(p["team"], p["lat"]) for p in event["data"]], [(self.team.id, 52.2)])
+        self.assertTrue(await backoffice.receive_nothing())
+        await communicator.disconnect()
+        await backoffice.disconnect()
+
+    async def _route_version(self, communicator):
+        await communicator.send_to(text_data=json.dumps({"endpoint": "newLocation"}))
+        route = json.loads(await communicator.receive_from())
+        self.assertEqual(route["type"], "route")
+        return route["routeVersion"]
+
+    async def test_resume_replays_missed_events(self):
+        communicator = await self._connect_app()
+        session = communicator.session
+        self.assertEqual((session["seq"], session["editionSeq"]), (0, 0))
+        route_version = await self._route_version(communicator)
+
+        await sync_to_async(consumers.push_to_team)(self.team.id, {"type": "ping"})
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "ping", "seq": 1})
+        await communicator.disconnect()
+
+        # Missed while offline
+        await sync_to_async(consumers.push_to_team)(self.team.id, {"type": "message"})
+        await sync_to_async(consumers.push_to_edition)(self.team.edition_id, {"type": "all"})
+        # Another process has none of this process's cache; the route is the same
+        route_cache._cache().clear()
+
+        communicator = await self._connect_app("resume", {
+            "session": session["session"], "lastSeq": 1, "lastEditionSeq": 0,
+            "routeVersion": route_version,
+        })
+        self.assertEqual(
+            (communicator.session["complete"], communicator.session["seq"],
+             communicator.session["editionSeq"]),
+            (True, 2, 1),
+        )
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "message", "seq": 2})
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "all", "editionSeq": 1})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_resume_sends_a_changed_route(self):
+        communicator = await self._connect_app()
+        session = communicator.session
+        route_version = await self._route_version(communicator)
+        await communicator.disconnect()
+
+        route = await Route.objects.acreate(name="Route", edition_id=self.team.edition_id)
+        part = await RoutePart.objects.acreate(name="Part", route=route, order=1)
+        await Destination.objects.acreate(
+            lat=52.0, lng=6.0, destination_type=DESTINATION_TYPE_MANDATORY, routepart=part,
+        )
+        await sync_to_async(distribute_route)(route)
+
+        communicator = await self._connect_app("resume", {
+            "session": session["session"], "lastSeq": 0, "lastEditionSeq": 0,
+            "routeVersion": route_version,
+        })
+        route = json.loads(await communicator.receive_from())
+        self.assertEqual(route["type"], "route")
+        self.assertNotEqual(route["routeVersion"], route_version)
+        await communicator.disconnect()
+
+    async def test_resume_after_the_code_was_regenerated(self):
+        communicator = await self._connect_app()
+        session = communicator.session
+        await communicator.disconnect()
+
+        self.team.code = "NEW99"
+        await self.team.asave()
+
+        communicator = WebsocketCommunicator(self.application, "/ws/app/")
+        await communicator.connect()
+        await communicator.send_to(text_data=json.dumps(
+            {"endpoint": "resume", "data": {"session": session["session"], "lastSeq": 0}}
+        ))
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "resume", "data": {"result": 0}})
+        await communicator.disconnect()
+
+    async def test_resume_with_invalid_token(self):
+        communicator = WebsocketCommunicator(self.application, "/ws/app/")
+        await communicator.connect()
+        await communicator.send_to(text_data=json.dumps(
+            {"endpoint": "resume", "data": {"session": "forged", "lastSeq": 0}}
+        ))
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "resume", "data": {"result": 0}})
+
+        # Still open for a normal login
+        await communicator.send_to(text_data=json.dumps(
+            {"endpoint": "authenticate", "data": {"authStr": "TEAM1"}}
+        ))
+        self.assertEqual(json.loads(await communicator.receive_from())["data"]["result"], 1)
+        await communicator.disconnect()
+
+    async def test_rate_limited_requests_get_busy(self):
+        communicator = await self._connect_app()
+        with mock.patch.dict(consumers.rate_limiter.limits, {"updateLocation": (0.01, 1)}):
+            for _ in range(2):
+                await communicator.send_to(text_data=json.dumps(
+                    {"endpoint": "updateLocation", "data": {"lat": 52.1, "lng": 6.1}}
+                ))
+            self.assertEqual(
+                json.loads(await communicator.receive_from()),
+                {"type": "busy", "data": {"endpoint": "updateLocation", "retryAfter": 100}},
+            )
+        consumers.rate_limiter._buckets.clear()
+        await communicator.disconnect()
+
+    async def test_backoffice_socket_requires_staff(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/backoffice/{self.team.edition_id}/"
+        )
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_backoffice_socket_is_limited_to_the_organisation(self):
+        other_org = await Organization.objects.acreate(
+            name="Other", contact_person="Y", contact_email="y@y.nl"
+        )
+        other = await User.objects.acreate(username="other", is_staff=True)
+        await UserProfile.objects.acreate(user=other, organization=other_org)
+
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/backoffice/{self.team.edition_id}/"
+        )
+        communicator.scope["user"] = other
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_push_to_backoffice(self):
+        communicator = await self._connect_backoffice()
+
+        await sync_to_async(consumers.push_to_backoffice)(self.team.edition_id, {"type": "message"})
+
+        self.assertEqual(json.loads(await communicator.receive_from()), {"type": "message"})
+        await communicator.disconnect()
+
+
+class AdmissionTest(TestCase):
+    """Bounded concurrency and token buckets for socket requests."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    async def test_waiting_too_long_is_rejected(self):
+        admission = Admission(concurrency=1, timeout=0.05, retry_after=5)
+        async with admission.slot("socket:test"):
+            with self.assertRaises(Busy) as busy:
+                async with admission.slot("socket:test"):
+                    pass
+        self.assertTrue(5 <= busy.exception.retry_after <= 10)
+
+        async with admission.slot("socket:test"):
+            pass
+        self.assertEqual((admission.admitted, admission.rejected, admission.waiting), (2, 1, 0))
+        self.assertGreaterEqual(metrics.snapshot()["socket:test"]["queue_ms"]["p95"], 50)
+
+    async def test_waiting_requests_run_in_turn(self):
+        admission = Admission(concurrency=2, timeout=1)
+        running = []
+
+        async def request():
+            async with admission.slot("socket:test"):
+                running.append(admission.concurrency - admission._semaphore._value)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request() for _ in range(6)))
+        self.assertEqual(max(running), 2)
+        self.assertEqual(admission.max_waiting, 6)
+
+    def test_token_bucket(self):
+        limiter = RateLimiter({"newLocation": (0.5, 2)})
+        limiter.check(1, "newLocation")
+        limiter.check(1, "newLocation")
+        with self.assertRaises(Busy) as busy:
+            limiter.check(1, "newLocation")
+        self.assertEqual(busy.exception.retry_after, 2)
+
+        # Other teams and endpoints have their own bucket
+        limiter.check(2, "newLocation")
+        limiter.check(1, "getMessages")
+        self.assertEqual(limiter.limited, 1)
+
+
+class ReplayBufferTest(TestCase):
+    """Sequence numbers and the bounded replay buffer behind session resumption."""
+
+    def test_events_since(self):
+        for n in range(3):
+            self.assertEqual(sessions.record_event("team.1", {"n": n})["seq"], n + 1)
+
+        self.assertEqual(sessions.events_since("team.1", 1), [{"n": 1, "seq": 2}, {"n": 2, "seq": 3}])
+        self.assertEqual(sessions.events_since("team.1", 3), [])
+        self.assertEqual(sessions.events_since("team.2", 0), [])
+
+    @override_settings(SOCKET_REPLAY_SIZE=2)
+    def test_gap_larger_than_buffer(self):
+        for n in range(3):
+            sessions.record_event("team.1", {"n": n})
+        self.assertIsNone(sessions.events_since("team.1", 0))
+        self.assertEqual(len(sessions.events_since("team.1", 1)), 2)
+
+    @override_settings(SOCKET_REPLAY_SIZE=2)
+    def test_buffer_is_pruned(self):
+        for n in range(6):
+            sessions.record_event("team.1", {"n": n})
+        self.assertEqual(
+            list(ReplayEvent.objects.filter(stream="team.1").values_list("seq", flat=True).order_by("seq")),
+            [5, 6],
+        )
+        self.assertEqual(sessions.events_since("team.1", 4), [{"n": 4, "seq": 5}, {"n": 5, "seq": 6}])
+
+    def test_expired_events(self):
+        sessions.record_event("team.1", {"n": 0})
+        ReplayEvent.objects.update(created_at=timezone.now() - timezone.timedelta(hours=2))
+        self.assertIsNone(sessions.events_since("team.1", 0))
+
+    def test_unknown_position(self):
+        self.assertIsNone(sessions.events_since("team.1", 5))
+        self.assertIsNone(sessions.events_since("team.1", -1))
+
+    def test_token(self):
+        token = sessions.issue_token(7, "ABC12")
+        team_id, code_hash = sessions.verify_token(token)
+        self.assertEqual(team_id, 7)
+        self.assertTrue(sessions.code_matches(code_hash, "ABC12"))
+        self.assertFalse(sessions.code_matches(code_hash, "XYZ98"))
+        self.assertNotIn("ABC12", json.dumps(signing.loads(token, salt=sessions.TOKEN_SALT)))
+        self.assertIsNone(sessions.verify_token(token[:-2] + "xx"))
+        self.assertIsNone(sessions.verify_token(None))
+        with override_settings(SOCKET_SESSION_MAX_AGE=-1):
+            self.assertIsNone(sessions.verify_token(token))
+
+
+class FanOutTest(TestCase):
+    """Bounded fan-out of one pre-encoded frame."""
+
+    async def test_failing_consumers_are_counted_as_dropped(self):
+        sent = []
+
+        class Fake:
+            _team_id = 1
+
+            def __init__(self, fail):
+                self.fail = fail
+
+            async def send(self, text):
+                if self.fail:
+                    raise RuntimeError("gone")
+                sent.append(text)
+
+        report = await consumers.fan_out([Fake(False), Fake(True), Fake(False)], "frame")
+
+        self.assertEqual(report, {"recipients": 3, "delivered": 2, "dropped": 1})
+        self.assertEqual(sent, ["frame", "frame"])
+
+
+class PostgresChannelLayerTest(TestCase):
+    """Routing of LISTEN/NOTIFY envelopes (no PostgreSQL needed)."""
+
+    async def test_notification_is_delivered_to_local_group(self):
+        layer = PostgresChannelLayer()
+        layer._ensure_listener = lambda: None
+        channel = await layer.new_channel()
+        await layer.group_add("edition.1", channel)
+
+        await layer._on_notify(json.dumps(
+            {"o": "otherprocess", "g": "edition.1", "m": {"type": "app.push"}}
+        ))
+
+        self.assertEqual(await layer.receive(channel), {"type": "app.push"})
+
+    async def test_own_notifications_are_ignored(self):
+        layer = PostgresChannelLayer()
+        layer._ensure_listener = lambda: None
+        channel = await layer.new_channel()
+        await layer.group_add("edition.1", channel)
+
+        await layer._on_notify(json.dumps(
+            {"o": layer.origin, "g": "edition.1", "m": {"type": "app.push"}}
+        ))
+
+        self.assertEqual(layer.channels.get(channel), None)
+
+    async def _sender(self):
+        layer = PostgresChannelLayer()
+        layer._ensure_listener = lambda: None
+        layer.sent = []
+        layer._notify = layer.sent.append
+        return layer
+
+    async def test_large_message_is_split_and_put_together(self):
+        sender = await self._sender()
+        receiver = PostgresChannelLayer()
+        receiver._ensure_listener = lambda: None
+        channel = await receiver.new_channel()
+        await receiver.group_add("edition.1", channel)
+        message = {"type": "app.push", "payload": {"text": "é" * 20000}}
+
+        await sender.group_send("edition.1", message)
+
+        self.assertGreater(len(sender.sent), 1)
+        self.assertTrue(all(len(p.encode()) <= layers.NOTIFY_MAX_BYTES for p in sender.sent))
+        for payload in sender.sent:
+            await receiver._on_notify(payload)
+        self.assertEqual(await receiver.receive(channel), message)
+        self.assertEqual(receiver._partial, {})
+
+    async def test_too_large_message_is_not_sent(self):
+        sender = await self._sender()
+        channel = await sender.new_channel()
+        await sender.group_add("edition.1", channel)
+
+        with mock.patch.object(layers, "MAX_CHUNKS", 2):
+            with self.assertRaises(layers.MessageTooLarge):
+                await sender.group_send("edition.1", {"type": "app.push", "text": "x" * 20000})
+        self.assertEqual((sender.sent, sender.channels.get(channel)), ([], None))
@@ -1,11 +1,22 @@
-from django.test import TestCase, Client
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
 
 from server.apps.dashboard.models import (
     Organization, Event, Edition, Route, Team, UserProfile,
+    RoutePart, TeamRoutePart, Destination, LocationLog, GeofenceEvent, Message, TeamPosition,
 )
+from server.apps.dashboard.distribution import distribute_route
+from server.apps.dashboard.metrics import QueryBudgetExceeded, metrics
+from server.apps.dashboard.positions import rebuild_positions, record_positions
 from django.utils import timezone
+from datetime import timedelta
+
+from .views import _compute_dashboard_ctx
 
 
 class OrgFilteringTestMixin:
@@ -216,3 +227,199 @@ class UserManagementAccessTest(OrgFilteringTestMixin, TestCase):
         self.assertEqual(resp.status_code, 302)
         self.user_a.refresh_from_db()
         self.assertTrue(self.user_a.check_password("brandnewpass123"))
+
+
+class RouteMapStateTest(OrgFilteringTestMixin, TestCase):
+    """Live map state: snapshot, ?since= deltas and latest-only mode."""
+
+    def setUp(self):
+        super().setUp()
+        rp = RoutePart.objects.create(name="RP", route=self.route_a, order=1)
+        trp = TeamRoutePart.objects.create(
+            name="RP", route=self.route_a, routepart=rp, team=self.team_a, order=1
+        )
+        self.now = timezone.now()
+        self.dest = Destination.objects.create(
+            lat=52.0, lng=6.0, teamroutepart=trp, completed_time=self.now - timedelta(minutes=5)
+        )
+        LocationLog.objects.create(team=self.team_a, lat=52.0, lng=6.0, time=self.now - timedelta(minutes=2))
+        LocationLog.objects.create(team=self.team_a, lat=52.1, lng=6.1, time=self.now - timedelta(minutes=1))
+        rebuild_positions()
+        self.url = reverse("backoffice:route_map_state", args=[self.route_a.id])
+        self.client.login(username="user_a", password="pass123")
+
+    def test_snapshot_has_latest_position_per_team(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual([(t["team__id"], t["lat"]) for t in data["teams"]], [(self.team_a.id, 52.1)])
+        self.assertEqual([c["id"] for c in data["completed_destinations"]], [self.dest.id])
+        self.assertEqual(data["completed_total"], 1)
+
+    def test_since_returns_only_new_rows(self):
+        TeamPosition.objects.update(updated_at=self.now - timedelta(minutes=1))
+        since = self.client.get(self.url).json()["server_time"]
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertEqual(data["teams"], [])
+        self.assertEqual(data["completed_destinations"], [])
+        self.assertEqual(data["completed_total"], 1)
+
+        # Stored now, with a phone clock that is behind the cursor
+        record_positions([
+            LocationLog.objects.create(team=self.team_a, lat=52.2, lng=6.2, time=self.now - timedelta(seconds=30))
+        ])
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertEqual([t["lat"] for t in data["teams"]], [52.2])
+
+    def test_latest_mode_skips_completions(self):
+        data = self.client.get(self.url, {"mode": "latest"}).json()
+        self.assertEqual(len(data["teams"]), 1)
+        self.assertNotIn("completed_destinations", data)
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get(self.url, {"since": "gisteren"}).status_code, 400)
+
+    def test_tracks_as_encoded_polylines(self):
+        cache.clear()
+        url = reverse("backoffice:route_map_tracks", args=[self.route_a.id])
+        data = self.client.get(url, {"zoom": 15}).json()
+        self.assertEqual(data["zoom"], 15)
+        self.assertEqual([(t["team"], t["points"]) for t in data["tracks"]], [(self.team_a.id, 2)])
+        self.assertEqual(self.client.get(url, {"zoom": "ver"}).status_code, 400)
+
+    def test_tracks_of_many_teams_stay_within_budget(self):
+        cache.clear()
+        rp = RoutePart.objects.get(route=self.route_a)
+        for i in range(20):
+            team = Team.objects.create(
+                name=f"Team {i}", code=f"T{i:04d}", contact_name="Tester",
+                contact_email="tester@test.nl", edition=self.team_a.edition,
+            )
+            TeamRoutePart.objects.create(name="RP", route=self.route_a, routepart=rp, team=team, order=1)
+            for minute in (2, 1):
+                LocationLog.objects.create(
+                    team=team, lat=52.0 + minute * 0.01, lng=6.0 + i * 0.01,
+                    time=self.now - timedelta(minutes=minute),
+                )
+        url = reverse("backoffice:route_map_tracks", args=[self.route_a.id])
+        data = self.client.get(url).json()
+        self.assertEqual(len(data["tracks"]), 21)
+
+    def test_geofence_events(self):
+        GeofenceEvent.objects.create(
+            team=self.team_a, destination=self.dest, kind=GeofenceEvent.KIND_NEAR_MISS,
+            distance=42.0, time=self.now - timedelta(minutes=3),
+        )
+        data = self.client.get(self.url).json()
+        self.assertEqual(
+            [(g["team"], g["destination"], g["kind"]) for g in data["geofence"]],
+            [(self.team_a.id, self.dest.id, GeofenceEvent.KIND_NEAR_MISS)],
+        )
+        since = (self.now + timedelta(minutes=1)).isoformat()
+        self.assertEqual(self.client.get(self.url, {"since": since}).json()["geofence"], [])
+
+        # An arrival from an offline batch: old ping time, stored after the cursor
+        GeofenceEvent.objects.create(
+            team=self.team_a, destination=self.dest, kind=GeofenceEvent.KIND_ARRIVAL,
+            distance=5.0, time=self.now - timedelta(minutes=2),
+            recorded_at=self.now + timedelta(minutes=2),
+        )
+        self.assertEqual(
+            [g["kind"] for g in self.client.get(self.url, {"since": since}).json()["geofence"]],
+            [GeofenceEvent.KIND_ARRIVAL],
+        )
+
+
+class EditionDashboardTest(OrgFilteringTestMixin, TestCase):
+    """Dashboard stats: fixed number of queries, cached per edition."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.edition_a.messaging_enabled = True
+        self.edition_a.save()
+        for order in (1, 2):
+            RoutePart.objects.create(name=f"RP {order}", route=self.route_a, order=order)
+        Message.objects.create(edition=self.edition_a, sender_team=self.team_a, text="Hallo")
+        self.url = reverse("backoffice:edition_dashboard_live", args=[self.edition_a.id])
+        self.client.login(username="user_a", password="pass123")
+
+    def _add_teams(self, count):
+        start = Team.objects.count()
+        teams = [
+            Team.objects.create(
+                name=f"Team {start + i}", edition=self.edition_a, code=f"T{start + i}",
+                contact_name="t", contact_email="t@t.nl",
+            )
+            for i in range(count)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            distribute_route(self.route_a, teams)
+
+    def test_query_count_does_not_grow_with_teams(self):
+        self._add_teams(2)
+        with self.assertNumQueries(5):
+            ctx = _compute_dashboard_ctx(self.edition_a)
+        self.assertEqual(ctx["teams_total"], 3)
+        self.assertEqual(ctx["routeparts_count"], 2)
+        self.assertEqual((ctx["messages_total"], ctx["messages_unread"]), (1, 1))
+
+        self._add_teams(30)
+        with self.assertNumQueries(5):
+            ctx = _compute_dashboard_ctx(self.edition_a)
+        self.assertEqual(ctx["teams_total"], 33)
+        self.assertEqual(ctx["routes"][0].teams_count, 32)
+
+    def test_result_is_shared_until_it_expires(self):
+        self.assertEqual(self.client.get(self.url).context["teams_total"], 1)
+        self._add_teams(1)
+        self.assertEqual(self.client.get(self.url).context["teams_total"], 1)
+
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).context["teams_total"], 2)
+
+
+class QueryMetricsTest(OrgFilteringTestMixin, TestCase):
+    """Server-Timing header, rolling p50/p95 and per-view query budgets."""
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.url = reverse("backoffice:route_map_state", args=[self.route_a.id])
+        self.client.login(username="user_a", password="pass123")
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_response_has_server_timing(self):
+        response = self.client.get(self.url)
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+
+    def test_snapshot_per_view(self):
+        for _ in range(3):
+            self.client.get(self.url)
+        data = self.client.get(reverse("backoffice:metrics")).json()
+        stats = data["metrics"]["backoffice:route_map_state"]
+        self.assertEqual(stats["count"], 3)
+        self.assertLessEqual(stats["queries"]["p50"], stats["queries"]["p95"])
+        self.assertIn("p95", stats["total_ms"])
+
+    def test_metrics_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(reverse("backoffice:metrics"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_budget_overrun(self):
+        with mock.patch("server.apps.backoffice.views.route_map_state.query_budget", 1):
+            with override_settings(QUERY_BUDGET_ENFORCE=True):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(self.url)
+            with override_settings(QUERY_BUDGET_ENFORCE=False):
+                with self.assertLogs("server.apps.dashboard.metrics", "WARNING"):
+                    self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_budget_is_not_checked_on_errors(self):
+        self.assertTrue(settings.QUERY_BUDGET_ENFORCE)
+        with mock.patch("server.apps.backoffice.views.route_map_state.query_budget", 0), \
+                mock.patch("server.apps.backoffice.views._latest_positions", side_effect=RuntimeError):
+            # The view's own error, not QueryBudgetExceeded for the error page
+            with self.assertRaises(RuntimeError):
+                self.client.get(self.url)
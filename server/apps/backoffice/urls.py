@@ -34,6 +34,7 @@ urlpatterns = [
     path("editions/<int:edition_id>/teams/<int:pk>/edit/", views.team_edit, name="team_edit"),
     path("editions/<int:edition_id>/teams/<int:pk>/delete/", views.team_delete, name="team_delete"),
     path("editions/<int:edition_id>/teams/<int:pk>/activate/", views.team_activate, name="team_activate"),
+    path("editions/<int:edition_id>/teams/resend-codes/", views.team_resend_codes, name="team_resend_codes"),
 
     # Messages
     path("editions/<int:edition_id>/messages/", views.messages_page, name="messages"),
@@ -51,9 +52,13 @@ urlpatterns = [
 
     path('routes/<int:route_id>/live_map', views.route_map, name='route_map'),
     path('routes/<int:route_id>/live_map/state/', views.route_map_state, name='route_map_state'),
+    path('routes/<int:route_id>/live_map/tracks/', views.route_map_tracks, name='route_map_tracks'),
 
     path("routes/<int:route_id>/stats", views.route_stats_page, name="route_stats"),
 
+    # Query count / latency per view (per process)
+    path("metrics/", views.query_metrics, name="metrics"),
+
     # RouteParts builder
     path("routes/<int:route_id>/parts/", views.routeparts_builder, name="routeparts_builder"),
     path("routes/<int:route_id>/parts/new", views.routepart_form, name="routepart_new"),
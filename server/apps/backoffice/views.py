@@ -3,26 +3,39 @@ from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.template.loader import render_to_string
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db import transaction
-from django.db.models import Q, Max, Min, Count, F, fields, OuterRef, Subquery, ExpressionWrapper
-from django.db.models.functions import Round, TruncTime
+from django.db.models import Q, Max, Min, Count, F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Round
 from django.views.decorators.http import require_POST, require_http_methods
 from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
 from urllib.parse import urlparse, parse_qs
 from django import forms
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.forms.models import model_to_dict
+from datetime import datetime, time, timedelta
 import json
-import googlemaps
+import os
 from collections import defaultdict
-from server.apps.asgi_socket.consumers import push_to_team, push_to_edition, push_to_backoffice
+from server.apps.asgi_socket.admission import admission, rate_limiter
+from server.apps.asgi_socket.consumers import (
+    push_to_team, push_to_edition, push_to_backoffice, apply_presence, get_presence,
+    refresh_team_state, refresh_edition_state, broadcast_report,
+)
 from .forms import RouteForm, RoutePartForm, BundleForm, DestinationForm, EditionRegistrationForm, UserManagementForm, EventForm, EditionForm
 from django.contrib.auth.models import User
 from server.apps.dashboard.models import (
-    Event, Edition, Route, Bundle, RoutePart, TeamRoutePart, Destination, Team, File, LocationLog,
-    Message, UserProfile, DESTINATION_TYPE_MANDATORY, DESTINATION_TYPE_CHOICE,
+    Event, Edition, Route, Bundle, RoutePart, TeamRoutePart, Destination, Team, File,
+    TeamPosition, GeofenceEvent, RouteTeamStats, Message, MessageThread, UserProfile, DESTINATION_TYPE_MANDATORY, DESTINATION_TYPE_CHOICE,
 )
 from server.apps.dashboard.constants import FILE_TYPE_IMAGE, FILE_TYPE_AUDIO
+from server.apps.dashboard.distance import route_distance_km
+from server.apps.dashboard import message_threads
+from server.apps.dashboard.jobs import enqueue as enqueue_job
+from server.apps.dashboard.metrics import metrics, query_budget
+from server.apps.dashboard.route_cache import invalidate_destinations
+from server.apps.dashboard.tracks import team_tracks
 from .permissions import org_qs, superuser_required
 
 
@@ -33,9 +46,7 @@ def edition_ctx(edition, nav_active="", active_route_id=None):
     # Unread messages: sent by teams, not yet read by organisation
     unread_messages = 0
     if edition and edition.messaging_enabled and nav_active != "messages":
-        unread_messages = Message.objects.filter(
-            edition=edition, sender_team__isnull=False, read_at__isnull=True,
-        ).count()
+        unread_messages = message_threads.unread_total(edition.id)
     return {
         "sidebar_edition": edition,
         "sidebar_routes": routes,
@@ -221,21 +232,42 @@ def edition_delete(request, edition_id: int):
 
 
 def _dashboard_ctx(edition):
-    """Collect all dashboard stats for an edition."""
-    # Reset stale online status (last_seen > 1 hour ago)
-    stale_cutoff = timezone.now() - timezone.timedelta(hours=1)
-    edition.teams.filter(online=True, last_seen__lt=stale_cutoff).update(online=False)
-
-    # Teams stats
-    teams = edition.teams.order_by("name")
-    teams_total = teams.count()
-    teams_active = teams.filter(is_activated=True).count()
-    teams_online = teams.filter(online=True).count()
+    """
+    All dashboard stats for an edition, cached for DASHBOARD_CACHE_SECONDS and
+    shared by everyone viewing the same edition.
+    """
+    key = f"edition_dashboard:{edition.id}"
+    ctx = cache.get(key)
+    if ctx is None:
+        ctx = _compute_dashboard_ctx(edition)
+        cache.set(key, ctx, timeout=settings.DASHBOARD_CACHE_SECONDS)
+    return {"edition": edition, **ctx}
+
+
+def _compute_dashboard_ctx(edition):
+    """Dashboard stats in a fixed number of queries, whatever the number of teams."""
+    # Teams stats (online/last_seen from the live presence registry)
+    teams = apply_presence(edition.teams.order_by("name"))
+    teams_total = len(teams)
+    teams_active = sum(1 for t in teams if t.is_activated)
+    teams_online = sum(1 for t in teams if t.online)
+
+    # Progress from the precomputed RouteTeamStats (see dashboard.route_stats)
+    per_team = defaultdict(lambda: [0, 0])
+    per_route = defaultdict(lambda: [0, 0, 0])
+    for team_id, route_id, total, completed in (
+        RouteTeamStats.objects.filter(team__edition=edition)
+        .values_list("team_id", "route_id", "parts_total", "parts_completed")
+    ):
+        per_team[team_id][0] += total
+        per_team[team_id][1] += completed
+        per_route[route_id][0] += total
+        per_route[route_id][1] += completed
+        per_route[route_id][2] += 1
 
     team_progress = []
     for t in teams:
-        total_trp = t.teamrouteparts.count()
-        completed_trp = t.teamrouteparts.filter(completed_time__isnull=False).count()
+        total_trp, completed_trp = per_team.get(t.id, (0, 0))
         team_progress.append({
             "team": t,
             "total": total_trp,
@@ -244,19 +276,9 @@ def _dashboard_ctx(edition):
         })
 
     # Routes stats
-    routes = (
-        edition.routes.order_by("name")
-        .annotate(
-            parts_count=Count("routeparts", distinct=True),
-            teams_count=Count("routeparts__teamrouteparts__team", distinct=True),
-            completed_count=Count(
-                "routeparts__teamrouteparts",
-                filter=Q(routeparts__teamrouteparts__completed_time__isnull=False),
-            ),
-            total_trp_count=Count("routeparts__teamrouteparts"),
-        )
-    )
+    routes = list(edition.routes.order_by("name").annotate(parts_count=Count("routeparts")))
     for r in routes:
+        r.total_trp_count, r.completed_count, r.teams_count = per_route.get(r.id, (0, 0, 0))
         r.completion_pct = round(r.completed_count / r.total_trp_count * 100) if r.total_trp_count else 0
 
     # Messages stats
@@ -265,24 +287,24 @@ def _dashboard_ctx(edition):
     recent_messages = []
     if edition.messaging_enabled:
         all_msgs = Message.objects.filter(edition=edition)
-        messages_total = all_msgs.count()
-        messages_unread = all_msgs.filter(read_at__isnull=True, sender_team__isnull=False).count()
-        recent_messages = (
+        counts = all_msgs.aggregate(
+            total=Count("id"),
+            unread=Count("id", filter=Q(read_at__isnull=True, sender_team__isnull=False)),
+        )
+        messages_total, messages_unread = counts["total"], counts["unread"]
+        recent_messages = list(
             all_msgs.select_related("sender_team", "recipient_team")
             .order_by("-created_at")[:5]
         )
 
-    routeparts_count = RoutePart.objects.filter(route__edition=edition).count()
-
     return {
-        "edition": edition,
         "teams_total": teams_total,
         "teams_active": teams_active,
         "teams_online": teams_online,
         "team_progress": team_progress,
         "routes": routes,
-        "routes_count": routes.count(),
-        "routeparts_count": routeparts_count,
+        "routes_count": len(routes),
+        "routeparts_count": sum(r.parts_count for r in routes),
         "messages_total": messages_total,
         "messages_unread": messages_unread,
         "recent_messages": recent_messages,
@@ -303,6 +325,7 @@ def edition_dashboard(request, edition_id: int):
 
 
 @staff_member_required
+@query_budget(12)
 def edition_dashboard_live(request, edition_id: int):
     """HTMX partial: live-refreshable dashboard content."""
     edition = get_object_or_404(
@@ -376,23 +399,21 @@ class TeamForm(forms.ModelForm):
         }
 
 @staff_member_required
+@query_budget(10)
 def team_list(request, edition_id: int):
     edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
 
-    # Reset stale online status
-    stale_cutoff = timezone.now() - timezone.timedelta(hours=1)
-    edition.teams.filter(online=True, last_seen__lt=stale_cutoff).update(online=False)
-
     teams = edition.teams.annotate(
-        trp_total=Count("teamrouteparts"),
-        trp_completed=Count("teamrouteparts", filter=Q(teamrouteparts__completed_time__isnull=False)),
+        trp_total=Coalesce(Sum("route_stats__parts_total"), 0),
+        trp_completed=Coalesce(Sum("route_stats__parts_completed"), 0),
     ).order_by("name")
 
     # Apply filters from query params
     status_filter = request.GET.get("status")
     search = request.GET.get("q", "").strip()
     if status_filter == "online":
-        teams = teams.filter(online=True)
+        live_online = [tid for tid, p in get_presence().items() if p["online"]]
+        teams = teams.filter(Q(online=True) | Q(id__in=live_online))
     elif status_filter == "active":
         teams = teams.filter(is_activated=True)
     elif status_filter == "registered":
@@ -400,6 +421,10 @@ def team_list(request, edition_id: int):
     if search:
         teams = teams.filter(name__icontains=search)
 
+    teams = apply_presence(teams)
+    if status_filter == "online":
+        teams = [t for t in teams if t.online]
+
     ctx = {
         "edition": edition,
         "teams": teams,
@@ -430,19 +455,12 @@ def team_edit(request, edition_id: int, pk: int):
     edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
     team = get_object_or_404(Team, pk=pk, edition=edition)
     if request.method == "POST":
-        old_interval = team.location_update_interval
         form = TeamForm(request.POST, instance=team)
         if form.is_valid():
             form.save()
 
-            # Push new interval to connected app if it changed
-            if team.location_update_interval != old_interval and team.online:
-                push_to_team(team.id, {
-                    "type": "config",
-                    "data": {
-                        "locationInterval": team.location_update_interval,
-                    },
-                })
+            # Connected app reloads its state and receives changed settings as "config"
+            refresh_team_state(team.id)
 
             return redirect("backoffice:team_list", edition_id=edition.id)
     else:
@@ -1064,84 +1082,14 @@ def bundle_delete(request, route_id: int, pk: int):
 @require_POST
 def distribute_route_to_teams(request, route_id: int):
     route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
-    teams = list(route.edition.teams.all())
-
-    trp_created = 0
-    dest_created = 0
-
-    with transaction.atomic():
-        # Alle RouteParts van deze route
-        for part in route.routeparts.select_related(
-            "route", "routedata_image", "routedata_audio"
-        ).all():
-
-            for team in teams:
-                # Maak (of vind) TeamRoutePart voor (routepart, team)
-                trp, created = TeamRoutePart.objects.get_or_create(
-                    routepart=part,      # ← belangrijk
-                    team=team,           # ← instance, geen id
-                    defaults={
-                        "route": route,  # ← instance, geen id
-                        "name": part.name,
-                        "route_type": part.route_type,
-                        "routepart_zoom": part.routepart_zoom,
-                        "routepart_fullscreen": part.routepart_fullscreen,
-                        "routedata_image": part.routedata_image,
-                        "routedata_audio": part.routedata_audio,
-                        "final": part.final,
-                        "order": part.order,
-                        "bundle": part.bundle,
-                    },
-                )
-                if created:
-                    trp_created += 1
-                else:
-                    # (optioneel) sync velden als part gewijzigd is
-                    dirty = False
-                    for field, value in {
-                        "route": route,
-                        "name": part.name,
-                        "route_type": part.route_type,
-                        "routepart_zoom": part.routepart_zoom,
-                        "routepart_fullscreen": part.routepart_fullscreen,
-                        "routedata_image": part.routedata_image,
-                        "routedata_audio": part.routedata_audio,
-                        "final": part.final,
-                        "order": part.order,
-                        "bundle": part.bundle,
-                    }.items():
-                        if getattr(trp, field) != value:
-                            setattr(trp, field, value)
-                            dirty = True
-                    if dirty:
-                        trp.save()
-
-                # Clone destinations van RoutePart naar TeamRoutePart (idempotent)
-                for d in part.destinations.all().order_by("id"):
-                    _, d_created = Destination.objects.get_or_create(
-                        teamroutepart=trp,                 # TRP-koppeling
-                        lat=d.lat,
-                        lng=d.lng,
-                        radius=d.radius,
-                        destination_type=d.destination_type,
-                        confirm_by_user=d.confirm_by_user,
-                        hide_for_user=d.hide_for_user,
-                        defaults={
-                            # completed_time, routepart niet overnemen
-                        },
-                    )
-                    if d_created:
-                        dest_created += 1
-
-    target = reverse("backoffice:teamrouteparts_builder", args=[route.id])
-
-    # HTMX → stuur redirect via header
-    if request.headers.get("HX-Request") or request.headers.get("Hx-Request"):
-        resp = HttpResponse(f"TRP: {trp_created}, DEST: {dest_created}")
-        resp["HX-Redirect"] = target
-        return resp
+    job = enqueue_job("distribute_route", edition=route.edition, route_id=route.id)
+    return _job_started(request, job, reverse("backoffice:teamrouteparts_builder", args=[route.id]))
+
 
-    # Gewone POST → normale redirect
+def _job_started(request, job, target):
+    """HTMX: voortgangsblok dat via de backoffice-socket bijwerkt; anders direct terug naar ``target``."""
+    if request.headers.get("HX-Request") or request.headers.get("Hx-Request"):
+        return render(request, "backoffice/_job_status.html", {"job": job, "redirect_url": target})
     return redirect(target)
 
 
@@ -1273,6 +1221,7 @@ def team_dests_bulk_move(request):
 
     qs = org_qs(request.user, Destination.objects, "teamroutepart__route__edition__event__organization").filter(id__in=ids, teamroutepart__isnull=False)
     updated = qs.update(lat=lat, lng=lng)
+    invalidate_destinations(ids)
     return JsonResponse({"ok": True, "updated": updated, "lat": lat, "lng": lng})
 
 
@@ -1306,6 +1255,7 @@ def team_dests_bulk_update(request):
         return HttpResponseBadRequest("Nothing to update")
 
     qs.update(**changed)
+    invalidate_destinations(ids)
     return JsonResponse({"ok": True, "updated": qs.count(), **changed})
 
 
@@ -1337,16 +1287,8 @@ def team_dests_bulk_delete(request):
 def teamrouteparts_clear(request, route_id:int):
     route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
     # Verwijder alle TeamRouteParts voor deze route (Destinations hangen aan TRP en verdwijnen mee)
-    TeamRoutePart.objects.filter(route=route).delete()
-
-    target = reverse("backoffice:teamrouteparts_builder", args=[route.id])
-
-    # HTMX → redirect header, anders normale redirect
-    if request.headers.get("HX-Request") or request.headers.get("Hx-Request"):
-        resp = HttpResponse("OK")
-        resp["HX-Redirect"] = target
-        return resp
-    return redirect(target)
+    job = enqueue_job("clear_teamrouteparts", edition=route.edition, route_id=route.id)
+    return _job_started(request, job, reverse("backoffice:teamrouteparts_builder", args=[route.id]))
 
 
 @staff_member_required
@@ -1391,17 +1333,14 @@ def route_map(request, route_id: int):
             teamroutepart__routepart__route=route,
             completed_time__isnull=False,
         )
-        .values("lat", "lng", "teamroutepart__team_id", "completed_time")
+        .values("id", "lat", "lng", "teamroutepart__team_id", "completed_time")
         .order_by("-completed_time")
     )
 
+    server_time = timezone.now()
     filter_date = route.date or timezone.localdate()
-    team_locations = list(
-        LocationLog.objects
-        .filter(team__in=teams_qs, time__date=filter_date)
-        .values("team__id", "lat", "lng", "time")
-        .order_by("-time")
-    )
+    team_locations = _latest_positions(teams_qs, filter_date)
+    geofence_events = _geofence_events(route, filter_date)
 
     ctx = {
         "route": route,
@@ -1411,127 +1350,161 @@ def route_map(request, route_id: int):
         "destinations": destinations,
         "completed_destinations": completed_destinations,
         "team_locations": team_locations,
+        "geofence_events": geofence_events,
+        "server_time": server_time.isoformat(),
         "GOOGLE_MAPS_API_KEY": settings.GOOGLE_MAPS_API_KEY,
         "GOOGLE_MAPS_MAP_ID": getattr(settings, "GOOGLE_MAPS_MAP_ID", ""),
     }
     ctx.update(edition_ctx(route.edition, "live_map", active_route_id=route.id))
     return render(request, "backoffice/route_map.html", ctx)
 
-@staff_member_required
-def route_map_state(request, route_id: int):
-    # Minimal JSON voor live updates
-    route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
-    teams_qs = Team.objects.filter(teamrouteparts__routepart__route=route).distinct()
+def _day_range(day):
+    """[start, end) of a local calendar day, usable on an index on time."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
 
-    now = timezone.now()
-    filter_date = route.date or timezone.localdate()
 
-    team_positions = list(
-        LocationLog.objects
-        .filter(team__in=teams_qs, time__date=filter_date)
-        .order_by('team_id','-time')
-        .values('team__id','lat','lng','time')
+def _latest_positions(teams_qs, day, since=None):
+    """Current position per team if it was logged on ``day`` (and changed after ``since``)."""
+    start, end = _day_range(day)
+    positions = TeamPosition.objects.filter(team__in=teams_qs, time__gte=start, time__lt=end)
+    if since is not None:
+        positions = positions.filter(updated_at__gte=since)
+    return list(
+        positions
+        .values("team__id", "lat", "lng", "time")
+        .order_by("team_id")
     )
 
-    completed = list(
-        Destination.objects
-        .filter(teamroutepart__team__in=teams_qs,
-                teamroutepart__routepart__route=route,
-                completed_time__isnull=False)
-        .values('lat','lng','teamroutepart__team_id','completed_time')
+
+def _geofence_events(route, day, since=None):
+    """Geofence observations (see dashboard.geofence) for the route on ``day`` (stored after ``since``)."""
+    start, end = _day_range(day)
+    events = GeofenceEvent.objects.filter(
+        destination__teamroutepart__route=route, time__gte=start, time__lt=end
     )
+    if since is not None:
+        events = events.filter(recorded_at__gte=since)
+    return [
+        {
+            "team": e["team_id"],
+            "route": route.id,
+            "destination": e["destination_id"],
+            "kind": e["kind"],
+            "lat": e["destination__lat"],
+            "lng": e["destination__lng"],
+            "distance": round(e["distance"], 1),
+            "time": e["time"],
+        }
+        for e in events
+        .values("team_id", "destination_id", "kind", "destination__lat", "destination__lng", "distance", "time")
+        .order_by("time")
+    ]
 
-    return JsonResponse({
-        "server_time": now.isoformat(),
-        "teams": team_positions,
-        "completed_destinations": completed,
-    })
 
+# Deltas page on server write times (a phone's clock may be off, offline pings
+# arrive late); look back a little for rows stamped before their flush committed
+ROUTE_MAP_DELTA_OVERLAP = timedelta(seconds=10)
+
+
+@staff_member_required
+@query_budget(10)
+def route_map_state(request, route_id: int):
+    """
+    Live-map state as JSON.
+
+    - no parameters: latest position per team + all completed destinations
+    - ``?since=<server_time>``: only positions/completions stored after the
+      ``server_time`` of a previous response (one position per team)
+    - ``?mode=latest``: only the latest position per team
 
+    ``completed_total`` lets the client notice undone completions and reload.
+    ``geofence`` lists arrivals, near misses and unreported arrivals.
+    """
+    route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
+    teams_qs = Team.objects.filter(teamrouteparts__routepart__route=route).distinct()
 
-def calculate_walking_distance(destinations):
-    
-    # Initialize Google Maps client
-    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+    now = timezone.now()
+    filter_date = route.date or timezone.localdate()
 
-    total_distance = 0.0
+    since = None
+    if raw_since := request.GET.get("since"):
+        since = parse_datetime(raw_since.replace(" ", "+"))
+        if since is None:
+            return HttpResponseBadRequest("Invalid since")
+        since -= ROUTE_MAP_DELTA_OVERLAP
 
-    # Split destinations into chunks of 10
-    chunk_size = 10
-    for i in range(0, len(destinations), chunk_size):
-        chunk = destinations[i:i + chunk_size]
+    data = {
+        "server_time": now.isoformat(),
+        "teams": _latest_positions(teams_qs, filter_date, since=since),
+    }
+    if request.GET.get("mode") == "latest":
+        return JsonResponse(data)
 
-        # Create a list of waypoints, excluding the first and last points
-        waypoints = chunk[1:-1]
+    completed_qs = Destination.objects.filter(
+        teamroutepart__team__in=teams_qs,
+        teamroutepart__routepart__route=route,
+        completed_time__isnull=False,
+    )
+    data["completed_total"] = completed_qs.count()
+    if since is not None:
+        completed_qs = completed_qs.filter(completed_time__gte=since)
+    data["completed_destinations"] = list(
+        completed_qs.values("id", "lat", "lng", "teamroutepart__team_id", "completed_time")
+    )
+    data["geofence"] = _geofence_events(route, filter_date, since=since)
+    return JsonResponse(data)
 
 
-        # Calculate the walking distance for the chunk
-        if waypoints:
-            directions_result = gmaps.directions(
-                chunk[0],  # Starting point
-                chunk[-1],  # Ending point
-                mode="walking",  # Walking mode
-                waypoints=waypoints,
-            )
-            #print(directions_result)
+@staff_member_required
+@query_budget(8)
+def route_map_tracks(request, route_id: int):
+    """
+    Simplified tracks of the day per team as encoded polylines.
 
-            # Extract distance from the result
-            distance = directions_result[0]["legs"][0]["distance"]["value"]  # in meters
-            total_distance += distance
+    ``?zoom=`` is the map zoom level (default 14); ``?team=`` limits the
+    response to one team.
+    """
+    route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
+    team_ids = list(
+        Team.objects.filter(teamrouteparts__routepart__route=route)
+        .distinct().order_by("id").values_list("id", flat=True)
+    )
+    try:
+        zoom = int(request.GET.get("zoom", 14))
+        if raw_team := request.GET.get("team"):
+            team_ids = [t for t in team_ids if t == int(raw_team)]
+    except ValueError:
+        return HttpResponseBadRequest("Invalid zoom or team")
 
-    # Convert total distance to kilometers or miles, depending on your preference
-    total_distance_km = total_distance / 1000.0
-    return round(total_distance_km,2)
+    filter_date = route.date or timezone.localdate()
+    return JsonResponse({
+        "zoom": zoom,
+        "tracks": team_tracks(team_ids, filter_date, zoom),
+    })
 
 
 @staff_member_required
+@query_budget(12)
 def route_stats_page(request, route_id: int):
     route = get_object_or_404(org_qs(request.user, Route.objects, "edition__event__organization"), pk=route_id)
     edition = route.edition
 
-    # Mandatory destinations for this route (+ optioneel annotatie voor eerste choice)
-    mandatory_qs = Destination.objects.filter(
+    # Mandatory destinations for this route
+    destinations_count = Destination.objects.filter(
         routepart__route=route,
         destination_type=DESTINATION_TYPE_MANDATORY
-    )
-
-    first_choice_subq = Destination.objects.filter(
-        routepart__route=route,
-        destination_type=DESTINATION_TYPE_CHOICE,
-        routepart=OuterRef('routepart')
-    ).order_by('id').values('id')[:1]
-
-    mandatory_qs = mandatory_qs.annotate(first_choice_destination=Subquery(first_choice_subq))
-
-    destinations_count = mandatory_qs.count()
+    ).count()
 
-    # Distance (km) op basis van mandatory dests
-    coords = [(d.lat, d.lng) for d in mandatory_qs]
-    distance = calculate_walking_distance(coords) if coords else 0
+    # Distance (km) op basis van mandatory dests (gecachet, zie dashboard.distance)
+    distance = route_distance_km(route)
 
-    # Teams die aan deze route hangen
-    teams = Team.objects.filter(teamrouteparts__route=route).distinct()
-
-    # Per team: first/last completed (alleen tijd), totale duur, totaal aantal completed destinations
+    # Per team: first/last completed, totale duur, totaal aantal completed destinations
     team_stats = (
-        teams
-        .annotate(
-            first_completed=TruncTime(Min('teamrouteparts__completed_time')),
-            last_completed=TruncTime(Max('teamrouteparts__completed_time')),
-        )
-        .annotate(
-            time_difference=ExpressionWrapper(
-                F('last_completed') - F('first_completed'),
-                output_field=fields.DurationField(),
-            ),
-        )
-        .annotate(
-            completed_destinations_count=Count(
-                'teamrouteparts__destinations',
-                filter=Q(teamrouteparts__destinations__completed_time__isnull=False)
-            ),
-        )
-        .order_by('name')
+        RouteTeamStats.objects
+        .filter(route=route)
+        .select_related("team")
+        .order_by("team__name")
     )
 
     ctx = {
@@ -1545,6 +1518,16 @@ def route_stats_page(request, route_id: int):
     return render(request, 'backoffice/route_stats.html', ctx)
 
 
+@staff_member_required
+def query_metrics(request):
+    """Query count, latency and queue time (p50/p95) per view and socket endpoint of this process."""
+    return JsonResponse({
+        "pid": os.getpid(),
+        "metrics": metrics.snapshot(),
+        "admission": {**admission.stats(), "rate_limited": rate_limiter.limited},
+    })
+
+
 @staff_member_required
 def edition_registration(request, edition_id: int):
     """Edit registration settings for an edition."""
@@ -1553,6 +1536,7 @@ def edition_registration(request, edition_id: int):
         form = EditionRegistrationForm(request.POST, instance=edition)
         if form.is_valid():
             form.save()
+            refresh_edition_state(edition.id)
             return redirect("backoffice:edition_dashboard", edition_id=edition.id)
     else:
         form = EditionRegistrationForm(instance=edition)
@@ -1564,23 +1548,31 @@ def edition_registration(request, edition_id: int):
 @staff_member_required
 @require_POST
 def team_activate(request, edition_id: int, pk: int):
-    """Activate a team: generate code, distribute routes, send email."""
-    from server.views import _unique_team_code, _distribute_routes_for_team, _send_team_code_email
+    """Activate a team: generate code; routes and email follow in a background job."""
+    from server.views import _unique_team_code
 
     edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
     team = get_object_or_404(Team, pk=pk, edition=edition)
 
     if not team.is_activated:
         with transaction.atomic():
-            team.code = _unique_team_code(edition)
+            team.code = _unique_team_code()
             team.is_activated = True
             team.save()
-            _distribute_routes_for_team(team)
-        _send_team_code_email(team)
+            enqueue_job("activate_team", edition=edition, team_id=team.id)
 
     return redirect("backoffice:team_list", edition_id=edition_id)
 
 
+@staff_member_required
+@require_POST
+def team_resend_codes(request, edition_id: int):
+    """Mail the team code again to every activated team (queued in a background job)."""
+    edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
+    enqueue_job("resend_team_codes", edition=edition, edition_id=edition.id)
+    return redirect("backoffice:team_list", edition_id=edition_id)
+
+
 # ─── Messages ──────────────────────────────────────────────────────
 
 
@@ -1613,7 +1605,7 @@ def messages_page(request, edition_id: int, team_id: int = None):
     edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
     if not edition.messaging_enabled:
         return redirect("backoffice:team_list", edition_id=edition.id)
-    teams = edition.teams.all().order_by("name")
+    teams = apply_presence(edition.teams.all().order_by("name"))
 
     # Selected team thread (None = broadcast / all)
     selected_team = None
@@ -1637,7 +1629,7 @@ def messages_page(request, edition_id: int, team_id: int = None):
             if selected_team:
                 push_to_team(selected_team.id, msg_payload)
             else:
-                push_to_edition(edition.id, msg_payload)
+                push_to_edition(edition.id, msg_payload, report_message=msg.id)
             push_to_backoffice(edition.id, msg_payload)
 
         # Redirect back to the same thread
@@ -1663,13 +1655,10 @@ def messages_page(request, edition_id: int, team_id: int = None):
             recipient_team__isnull=True,
         ).order_by("created_at")
 
-    # Annotate unread count per team
+    # Unread count per team (see dashboard.message_threads)
     unread_counts = dict(
-        Message.objects.filter(
-            edition=edition,
-            sender_team__isnull=False,
-            read_at__isnull=True,
-        ).values_list("sender_team").annotate(count=Count("id")).values_list("sender_team", "count")
+        MessageThread.objects.filter(edition=edition, unread_count__gt=0)
+        .values_list("team_id", "unread_count")
     )
     teams_with_unread = []
     for t in teams:
@@ -1685,6 +1674,7 @@ def messages_page(request, edition_id: int, team_id: int = None):
         "teams": teams_with_unread,
         "selected_team": selected_team,
         "thread_messages": thread_messages,
+        "broadcast_report": None if selected_team else broadcast_report(edition.id),
     }
     ctx.update(edition_ctx(edition, "messages"))
     return render(request, "backoffice/messages.html", ctx)
@@ -1696,10 +1686,7 @@ def messages_mark_read(request, edition_id: int, team_id: int):
     """AJAX: mark all unread messages from a team as read."""
     edition = get_object_or_404(org_qs(request.user, Edition.objects, "event__organization"), pk=edition_id)
     team = get_object_or_404(Team, pk=team_id, edition=edition)
-    updated = Message.objects.filter(
-        edition=edition, sender_team=team, read_at__isnull=True
-    ).update(read_at=timezone.now())
-    return JsonResponse({"marked": updated})
+    return JsonResponse({"marked": message_threads.mark_read(edition.id, team.id)})
 
 
 @staff_member_required
@@ -1717,6 +1704,8 @@ def messages_clear(request, edition_id: int, team_id: int = None):
             Q(sender_team=team)
             | Q(sender_team__isnull=True, recipient_team=team)
         ).delete()
+        message_threads.refresh_threads([team.id])
+        message_threads.push_unread(edition.id, team.id)
         return redirect("backoffice:messages_team", edition_id=edition.id, team_id=team.id)
     else:
         # Delete all broadcasts
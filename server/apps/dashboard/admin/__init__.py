@@ -13,24 +13,43 @@ from server.apps.dashboard.models import (
     RoutePart,
     TeamRoutePart,
     File,
+    Job,
     LocationLog,
+    OutboundEmail,
     UserProfile,
 )
 
 from adminsortable2.admin import SortableAdminMixin
 
 from .inlines import DestinationInline
-from .actions import distribute_to_teams
+from .actions import distribute_to_teams, resend_team_codes
 
 admin.site.register(Organization)
 admin.site.register(Event)
-admin.site.register(Edition)
 admin.site.register(Bundle)
 admin.site.register(File)
 admin.site.register(LocationLog)
 admin.site.register(UserProfile)
 
 
+@admin.register(Edition)
+class EditionAdmin(admin.ModelAdmin):
+    actions = [resend_team_codes]
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("to", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to", "subject")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "edition", "status", "progress", "total", "attempts", "created_at")
+    list_filter = ("status", "kind")
+
+
 @admin.register(Route)
 class TeamAdmin(admin.ModelAdmin):
     actions = [distribute_to_teams]
@@ -0,0 +1,79 @@
+"""
+Completion of destinations reported by the app.
+
+All destinations of the part are loaded in one query (with their part), the
+mandatory/choice rules are evaluated in memory and only the changed columns
+are written, in one transaction.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import DESTINATION_TYPE_CHOICE, DESTINATION_TYPE_MANDATORY
+from .models import Destination, TeamRoutePart
+from .route_stats import record_completion
+
+
+@dataclass
+class CompletionResult:
+    part: TeamRoutePart
+    destination: Destination
+    part_completed: bool
+
+
+def part_is_complete(destinations):
+    """All mandatory destinations done and, if there are choices, at least one."""
+    choices = []
+    for dest in destinations:
+        if dest.destination_type == DESTINATION_TYPE_MANDATORY and not dest.completed_time:
+            return False
+        if dest.destination_type == DESTINATION_TYPE_CHOICE:
+            choices.append(dest)
+    return not choices or any(dest.completed_time for dest in choices)
+
+
+def complete_destination(team, destination_id, complete_time=None):
+    """
+    Mark a destination of ``team`` as completed and complete its part when the
+    rules are met. Raises TeamRoutePart.DoesNotExist for unknown destinations.
+
+    Confirming a destination that is already completed (a retried
+    destinationConfirmed) changes nothing: its time is kept and it is not
+    counted again.
+    """
+    complete_time = complete_time or timezone.now()
+
+    destinations = list(
+        Destination.objects.select_related("teamroutepart")
+        .filter(
+            teamroutepart__team_id=team.id,
+            teamroutepart__destinations__id=destination_id,
+        )
+        .order_by("id")
+    )
+    target = next((d for d in destinations if d.id == int(destination_id)), None)
+    if target is None:
+        raise TeamRoutePart.DoesNotExist(f"No destination {destination_id} for team {team.id}")
+    part = target.teamroutepart
+    if target.completed_time is not None:
+        return CompletionResult(part=part, destination=target, part_completed=False)
+
+    target.completed_time = complete_time
+    part_completed = part.completed_time is None and part_is_complete(destinations)
+
+    with transaction.atomic():
+        # Only the first of two concurrent confirmations gets the row
+        claimed = Destination.objects.filter(
+            pk=target.pk, completed_time__isnull=True
+        ).update(completed_time=complete_time)
+        if not claimed:
+            target.refresh_from_db(fields=["completed_time"])
+            return CompletionResult(part=part, destination=target, part_completed=False)
+        if part_completed:
+            part.completed_time = complete_time
+            part.save(update_fields=["completed_time"])
+        if part.route_id is not None:
+            record_completion(team.id, part.route_id, complete_time, part_completed)
+
+    return CompletionResult(part=part, destination=target, part_completed=part_completed)
@@ -0,0 +1,118 @@
+"""
+Walking distance along a sequence of coordinates, for the route statistics.
+
+The distance comes from a provider, chosen with ``DISTANCE_PROVIDER``:
+
+- ``"haversine"`` (default): great-circle distance between consecutive points,
+  computed locally; no network, no API quota.
+- ``"google"``: Google Directions in walking mode, summing every leg.
+- a dotted path to a function ``points -> metres``, e.g. one that routes over
+  a local walking graph.
+
+Results are cached under a hash of the provider and the coordinate sequence.
+When a destination moves, is added or is removed the sequence (and so the
+key) changes, so stale distances are never served.
+"""
+import hashlib
+import logging
+import math
+
+import googlemaps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .constants import DESTINATION_TYPE_MANDATORY
+from .models import Destination
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000
+
+# Origin + destination + 8 waypoints per Directions request
+GOOGLE_CHUNK_SIZE = 10
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+# ── Providers: [(lat, lng), ...] -> metres ────────────────────────
+
+def haversine_distance(points):
+    return sum(
+        distance_m(lat1, lng1, lat2, lng2)
+        for (lat1, lng1), (lat2, lng2) in zip(points, points[1:])
+    )
+
+
+def google_walking_distance(points):
+    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+    total = 0
+    # Chunks share their end point, so the legs between chunks are counted too
+    step = GOOGLE_CHUNK_SIZE - 1
+    for start in range(0, len(points) - 1, step):
+        chunk = points[start:start + GOOGLE_CHUNK_SIZE]
+        result = gmaps.directions(chunk[0], chunk[-1], mode="walking", waypoints=chunk[1:-1])
+        total += sum(leg["distance"]["value"] for leg in result[0]["legs"])
+    return total
+
+
+DISTANCE_PROVIDERS = {
+    "haversine": haversine_distance,
+    "google": google_walking_distance,
+}
+
+
+def get_provider(name=None):
+    name = name or getattr(settings, "DISTANCE_PROVIDER", "haversine")
+    if name in DISTANCE_PROVIDERS:
+        return name, DISTANCE_PROVIDERS[name]
+    return name, import_string(name)
+
+
+# ── Cached lookup ─────────────────────────────────────────────────
+
+def _cache_key(provider_name, points):
+    raw = ";".join(f"{float(lat):.6f},{float(lng):.6f}" for lat, lng in points)
+    digest = hashlib.sha1(f"{provider_name}|{raw}".encode()).hexdigest()
+    return f"walking_distance:{digest}"
+
+
+def walking_distance_km(points, provider=None):
+    """Distance in km (2 decimals) along ``points`` in the given order."""
+    points = [(float(lat), float(lng)) for lat, lng in points]
+    if len(points) < 2:
+        return 0.0
+
+    name, func = get_provider(provider)
+    key = _cache_key(name, points)
+    if (cached := cache.get(key)) is not None:
+        return cached
+
+    try:
+        metres = func(points)
+    except Exception:
+        # Rather a straight-line figure than a broken stats page; not cached
+        logger.warning("Distance provider %s failed, using haversine", name, exc_info=True)
+        return round(haversine_distance(points) / 1000, 2)
+
+    km = round(metres / 1000, 2)
+    cache.set(key, km, timeout=getattr(settings, "DISTANCE_CACHE_TTL", 7 * 24 * 3600))
+    return km
+
+
+def route_distance_km(route, provider=None):
+    """Distance along the mandatory destinations of a route, in route order."""
+    points = (
+        Destination.objects
+        .filter(routepart__route=route, destination_type=DESTINATION_TYPE_MANDATORY)
+        .order_by("routepart__order", "id")
+        .values_list("lat", "lng")
+    )
+    return walking_distance_km(list(points), provider=provider)
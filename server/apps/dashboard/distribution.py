@@ -0,0 +1,161 @@
+"""
+Distribution of route parts (and their destinations) to teams.
+
+Every RoutePart gets one TeamRoutePart per team, with a copy of the part's
+destinations. The engine works set-based: the parts, the existing
+TeamRouteParts and their destinations are loaded up front, diffed in memory
+and written with ``bulk_create``/``bulk_update``. Running it again is
+idempotent; it only creates what is missing and syncs changed part fields.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+
+from django.db import transaction
+
+from . import route_cache
+from .models import Destination, RoutePart, TeamRoutePart
+from .route_stats import refresh_stats
+
+# TeamRoutePart fields copied from (and kept in sync with) the RoutePart
+SYNCED_PART_FIELDS = (
+    "route_id",
+    "name",
+    "route_type",
+    "routepart_zoom",
+    "routepart_fullscreen",
+    "routedata_image_id",
+    "routedata_audio_id",
+    "final",
+    "order",
+    "bundle_id",
+)
+
+# Destination fields that identify a team copy of a route part destination
+DESTINATION_KEY_FIELDS = ("lat", "lng", "radius", "destination_type")
+SYNCED_DESTINATION_FIELDS = ("confirm_by_user", "hide_for_user")
+
+BATCH_SIZE = 500
+
+
+@dataclass
+class DistributionResult:
+    parts_created: int = 0
+    parts_updated: int = 0
+    destinations_created: int = 0
+    destinations_updated: int = 0
+
+    def __add__(self, other):
+        return DistributionResult(
+            self.parts_created + other.parts_created,
+            self.parts_updated + other.parts_updated,
+            self.destinations_created + other.destinations_created,
+            self.destinations_updated + other.destinations_updated,
+        )
+
+    def __str__(self):
+        return (
+            f"TRP: {self.parts_created} nieuw, {self.parts_updated} bijgewerkt; "
+            f"DEST: {self.destinations_created} nieuw, {self.destinations_updated} bijgewerkt"
+        )
+
+
+def _destination_key(dest):
+    return tuple(getattr(dest, field) for field in DESTINATION_KEY_FIELDS)
+
+
+def distribute(routeparts, teams):
+    """Distribute ``routeparts`` (queryset or list) to ``teams``; returns a DistributionResult."""
+    parts = list(routeparts)
+    team_ids = sorted({team.id for team in teams})
+    result = DistributionResult()
+    if not parts or not team_ids:
+        return result
+
+    part_ids = [part.id for part in parts]
+    template_destinations = defaultdict(list)
+    for dest in Destination.objects.filter(routepart_id__in=part_ids).order_by("id"):
+        template_destinations[dest.routepart_id].append(dest)
+
+    with transaction.atomic():
+        trps = {}
+        for trp in (
+            TeamRoutePart.objects.filter(routepart_id__in=part_ids, team_id__in=team_ids)
+            .order_by("id")
+        ):
+            trps.setdefault((trp.routepart_id, trp.team_id), trp)
+
+        # TeamRouteParts: create missing, sync changed
+        new_trps, changed_trps = [], []
+        for part in parts:
+            values = {field: getattr(part, field) for field in SYNCED_PART_FIELDS}
+            for team_id in team_ids:
+                trp = trps.get((part.id, team_id))
+                if trp is None:
+                    trp = TeamRoutePart(routepart_id=part.id, team_id=team_id, **values)
+                    trps[(part.id, team_id)] = trp
+                    new_trps.append(trp)
+                elif any(getattr(trp, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(trp, field, value)
+                    changed_trps.append(trp)
+
+        TeamRoutePart.objects.bulk_create(new_trps, batch_size=BATCH_SIZE)
+        if changed_trps:
+            TeamRoutePart.objects.bulk_update(
+                changed_trps, [field.removesuffix("_id") for field in SYNCED_PART_FIELDS],
+                batch_size=BATCH_SIZE,
+            )
+        result.parts_created, result.parts_updated = len(new_trps), len(changed_trps)
+
+        # Destinations: match existing copies by key, one copy per template
+        existing = defaultdict(list)
+        for dest in (
+            Destination.objects
+            .filter(teamroutepart__routepart_id__in=part_ids, teamroutepart__team_id__in=team_ids)
+            .order_by("id")
+        ):
+            existing[(dest.teamroutepart_id, _destination_key(dest))].append(dest)
+
+        new_dests, changed_dests = [], []
+        for (part_id, _team_id), trp in trps.items():
+            for template in template_destinations[part_id]:
+                matches = existing.get((trp.id, _destination_key(template)))
+                if not matches:
+                    new_dests.append(Destination(
+                        teamroutepart_id=trp.id,
+                        **{field: getattr(template, field)
+                           for field in DESTINATION_KEY_FIELDS + SYNCED_DESTINATION_FIELDS},
+                    ))
+                    continue
+                dest = matches.pop(0)
+                if any(getattr(dest, f) != getattr(template, f) for f in SYNCED_DESTINATION_FIELDS):
+                    for field in SYNCED_DESTINATION_FIELDS:
+                        setattr(dest, field, getattr(template, field))
+                    changed_dests.append(dest)
+
+        Destination.objects.bulk_create(new_dests, batch_size=BATCH_SIZE)
+        if changed_dests:
+            Destination.objects.bulk_update(changed_dests, SYNCED_DESTINATION_FIELDS, batch_size=BATCH_SIZE)
+        result.destinations_created, result.destinations_updated = len(new_dests), len(changed_dests)
+
+        # Bulk writes skip the post_save signals that invalidate route payloads.
+        # Both run after the commit so no reader caches (or counts) the old parts.
+        if new_trps or changed_trps or new_dests or changed_dests:
+            transaction.on_commit(partial(route_cache.invalidate_teams, team_ids))
+        if new_trps or changed_trps:
+            transaction.on_commit(partial(refresh_stats, team_ids))
+
+    return result
+
+
+def distribute_route(route, teams=None):
+    """Distribute all parts of ``route`` to ``teams`` (default: all teams of the edition)."""
+    if teams is None:
+        teams = route.edition.teams.all()
+    return distribute(RoutePart.objects.filter(route=route), teams)
+
+
+def distribute_routes_for_team(team):
+    """Distribute the parts of every route of the team's edition to ``team``."""
+    return distribute(RoutePart.objects.filter(route__edition_id=team.edition_id), [team])
@@ -0,0 +1,299 @@
+"""
+Server-side geofencing of location pings.
+
+Per team the open destinations are kept in an in-memory geohash index: each
+destination sits in the cell of its centre, and a ping only looks at the
+destinations in its own cell and the eight around it. The cell size is chosen
+so that every destination within reach (radius + near-miss margin) is in one
+of those nine cells, so checking a ping costs nine dict lookups and a handful
+of distance calculations, whatever the number of destinations.
+
+The index of a team is rebuilt (one query for all teams that need it) when
+its route payload version changes, i.e. after completions or backoffice
+edits, and otherwise never touches the database.
+
+Observations per team destination, each reported once:
+
+- ``arrival``: a ping inside the radius
+- ``near_miss``: the team came within radius + ``GEOFENCE_NEAR_MISS_METERS``
+  and left that band again without arriving
+- ``unreported``: an arrival the app has not completed
+  ``GEOFENCE_UNREPORTED_SECONDS`` later (by the time of the team's pings)
+
+The state of a team is dropped after ``GEOFENCE_IDLE_SECONDS`` without pings,
+and right away when the team is deactivated or deleted in this process.
+"""
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+
+from . import route_cache
+from .distance import distance_m
+from .models import Destination, GeofenceEvent
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# ── Geometry ──────────────────────────────────────────────────────
+
+def geohash(lat, lng, precision):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size_deg(precision):
+    """(lat, lng) size in degrees of a geohash cell."""
+    total = 5 * precision
+    lng_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def precision_for(reach_m, lat):
+    """Finest geohash precision whose cells are at least ``reach_m`` wide."""
+    for precision in range(9, 0, -1):
+        dlat, dlng = cell_size_deg(precision)
+        height = dlat * 111320
+        width = dlng * 111320 * math.cos(math.radians(lat))
+        if min(height, width) >= reach_m:
+            return precision
+    return 1
+
+
+# ── Index ─────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Fence:
+    destination_id: int
+    team_id: int
+    edition_id: int
+    route_id: int
+    lat: float
+    lng: float
+    radius: int
+
+
+class GeofenceIndex:
+    def __init__(self, fences, margin):
+        self.margin = margin
+        reach = max((f.radius for f in fences), default=0) + margin
+        ref_lat = fences[0].lat if fences else 52.0
+        self.precision = precision_for(reach, min(85.0, abs(ref_lat) + 1))
+        self.dlat, self.dlng = cell_size_deg(self.precision)
+        self.cells = defaultdict(list)
+        for fence in fences:
+            self.cells[geohash(fence.lat, fence.lng, self.precision)].append(fence)
+        self.size = len(fences)
+
+    def nearby(self, lat, lng):
+        """[(fence, distance)] for fences within radius + margin of the point."""
+        if not self.size:
+            return []
+        hits = []
+        seen = set()
+        for dlat in (-self.dlat, 0, self.dlat):
+            for dlng in (-self.dlng, 0, self.dlng):
+                cell = geohash(max(-90.0, min(90.0, lat + dlat)), (lng + dlng + 180) % 360 - 180, self.precision)
+                if cell in seen:
+                    continue
+                seen.add(cell)
+                for fence in self.cells.get(cell, ()):
+                    dist = distance_m(lat, lng, fence.lat, fence.lng)
+                    if dist <= fence.radius + self.margin:
+                        hits.append((fence, dist))
+        return hits
+
+
+# ── Engine ────────────────────────────────────────────────────────
+
+@dataclass
+class GeofenceHit:
+    fence: Fence
+    kind: str
+    distance: float
+    time: object
+
+    def to_live_format(self):
+        return {
+            "team": self.fence.team_id,
+            "route": self.fence.route_id,
+            "destination": self.fence.destination_id,
+            "kind": self.kind,
+            "lat": self.fence.lat,
+            "lng": self.fence.lng,
+            "distance": round(self.distance, 1),
+            "time": self.time.isoformat(),
+        }
+
+
+@dataclass
+class _TeamFences:
+    version: str
+    index: GeofenceIndex
+    arrived: dict = field(default_factory=dict)   # destination_id -> (fence, time, distance)
+    near: dict = field(default_factory=dict)      # destination_id -> (fence, time, closest distance)
+    reported: set = field(default_factory=set)    # (destination_id, kind)
+    last_ping: float = 0.0                        # time.monotonic() of the last evaluated ping
+
+
+class GeofenceEngine:
+    """Per-process geofence state for the teams whose pings this process writes."""
+
+    def __init__(self, near_miss_margin=50, unreported_after=120, idle_after=3600):
+        self.near_miss_margin = near_miss_margin
+        self.unreported_after = timedelta(seconds=unreported_after)
+        self.idle_after = idle_after
+        self._teams: dict[int, _TeamFences] = {}
+        self._pruned_at = time.monotonic()
+
+    def _load(self, versions):
+        """(Re)build the index of teams whose route version changed; one query."""
+        stale = [team_id for team_id, version in versions.items()
+                 if team_id not in self._teams or self._teams[team_id].version != version]
+        if not stale:
+            return
+
+        fences = defaultdict(list)
+        for row in (
+            Destination.objects
+            .filter(
+                teamroutepart__team_id__in=stale,
+                completed_time__isnull=True,
+                teamroutepart__completed_time__isnull=True,
+            )
+            .values_list(
+                "id", "teamroutepart__team_id", "teamroutepart__team__edition_id",
+                "teamroutepart__route_id", "lat", "lng", "radius",
+            )
+        ):
+            fences[row[1]].append(Fence(*row))
+
+        for team_id in stale:
+            previous = self._teams.get(team_id)
+            state = _TeamFences(
+                version=versions[team_id],
+                index=GeofenceIndex(fences[team_id], self.near_miss_margin),
+            )
+            if previous is not None:
+                # Keep what we saw of destinations that are still open
+                open_ids = {f.destination_id for f in fences[team_id]}
+                state.arrived = {d: v for d, v in previous.arrived.items() if d in open_ids}
+                state.near = {d: v for d, v in previous.near.items() if d in open_ids}
+                state.reported = {r for r in previous.reported if r[0] in open_ids}
+            self._teams[team_id] = state
+
+    def evaluate(self, rows):
+        """Check LocationLog rows (or objects with team_id/lat/lng/time); returns new GeofenceHits."""
+        by_team = defaultdict(list)
+        for row in rows:
+            by_team[row.team_id].append(row)
+        if not by_team:
+            return []
+        self._load(route_cache.get_versions(by_team))
+
+        now = time.monotonic()
+        hits = []
+        for team_id, pings in by_team.items():
+            state = self._teams[team_id]
+            state.last_ping = now
+            pings.sort(key=lambda ping: ping.time)
+            for ping in pings:
+                hits.extend(self._check_ping(state, ping))
+
+            # Arrivals the app still has not completed (index not rebuilt since)
+            latest = pings[-1].time
+            for destination_id, (fence, arrived_at, dist) in state.arrived.items():
+                key = (destination_id, GeofenceEvent.KIND_UNREPORTED)
+                if key not in state.reported and latest - arrived_at >= self.unreported_after:
+                    state.reported.add(key)
+                    hits.append(GeofenceHit(fence, GeofenceEvent.KIND_UNREPORTED, dist, latest))
+
+        if now - self._pruned_at >= self.idle_after:
+            self.prune(now)
+        return hits
+
+    def _check_ping(self, state, ping):
+        hits = []
+        in_band = set()
+        for fence, dist in state.index.nearby(ping.lat, ping.lng):
+            destination_id = fence.destination_id
+            if dist <= fence.radius:
+                state.near.pop(destination_id, None)
+                state.arrived.setdefault(destination_id, (fence, ping.time, dist))
+                if (destination_id, GeofenceEvent.KIND_ARRIVAL) not in state.reported:
+                    state.reported.add((destination_id, GeofenceEvent.KIND_ARRIVAL))
+                    hits.append(GeofenceHit(fence, GeofenceEvent.KIND_ARRIVAL, dist, ping.time))
+            elif destination_id not in state.arrived:
+                in_band.add(destination_id)
+                closest = state.near.get(destination_id)
+                if closest is None or dist < closest[2]:
+                    state.near[destination_id] = (fence, ping.time, dist)
+
+        # Left the band without arriving: near miss at the closest approach
+        for destination_id in [d for d in state.near if d not in in_band]:
+            fence, closest_at, dist = state.near.pop(destination_id)
+            if (destination_id, GeofenceEvent.KIND_NEAR_MISS) not in state.reported:
+                state.reported.add((destination_id, GeofenceEvent.KIND_NEAR_MISS))
+                hits.append(GeofenceHit(fence, GeofenceEvent.KIND_NEAR_MISS, dist, closest_at))
+        return hits
+
+    def forget(self, team_id):
+        self._teams.pop(team_id, None)
+
+    def prune(self, now=None):
+        """Drop the state of teams without pings for ``idle_after`` seconds; returns how many.
+
+        Deactivated teams, cleared routes and finished editions stop sending
+        pings, and the process that evaluates them is not always the one that
+        changed them.
+        """
+        now = time.monotonic() if now is None else now
+        idle = [team_id for team_id, state in self._teams.items()
+                if now - state.last_ping >= self.idle_after]
+        for team_id in idle:
+            del self._teams[team_id]
+        self._pruned_at = now
+        return len(idle)
+
+
+def record_hits(hits):
+    """Store hits as GeofenceEvents; duplicates from other processes are ignored."""
+    GeofenceEvent.objects.bulk_create(
+        [
+            GeofenceEvent(
+                team_id=hit.fence.team_id,
+                destination_id=hit.fence.destination_id,
+                kind=hit.kind,
+                distance=hit.distance,
+                time=hit.time,
+            )
+            for hit in hits
+        ],
+        ignore_conflicts=True,
+    )
+
+
+geofence_engine = GeofenceEngine(
+    near_miss_margin=getattr(settings, "GEOFENCE_NEAR_MISS_METERS", 50),
+    unreported_after=getattr(settings, "GEOFENCE_UNREPORTED_SECONDS", 120),
+    idle_after=getattr(settings, "GEOFENCE_IDLE_SECONDS", 3600),
+)
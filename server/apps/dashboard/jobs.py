@@ -0,0 +1,197 @@
+"""
+Database-backed background jobs for long backoffice operations.
+
+Views ``enqueue`` a Job and return straight away; the ``run_jobs`` management
+command claims queued jobs and runs the registered handler. Handlers report
+progress with ``report_progress``; every change is pushed to the backoffice of
+the job's edition as a ``job`` event. A failing job is retried with
+exponential backoff until ``max_attempts`` is reached.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from server.apps.asgi_socket.consumers import (
+    push_to_backoffice,
+    refresh_edition_state,
+    refresh_team_state,
+)
+
+from .distribution import distribute_route, distribute_routes_for_team
+from .models import Job, Route, Team, TeamRoutePart
+from .outbox import queue_emails
+from .route_stats import refresh_stats
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register ``func(job, **params)`` as the handler for jobs of ``kind``."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+# ── Queue ─────────────────────────────────────────────────────────
+
+def _push(job):
+    if job.edition_id:
+        push_to_backoffice(job.edition_id, {"type": "job", "data": job.to_progress_format()})
+
+
+def enqueue(kind, edition=None, max_attempts=3, **params):
+    """Queue a job; ``params`` must be JSON-serialisable."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job.objects.create(kind=kind, edition=edition, params=params, max_attempts=max_attempts)
+    _push(job)
+    return job
+
+
+def requeue_stale():
+    """Queue running jobs again whose worker stopped without finishing them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    return Job.objects.filter(status=Job.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=Job.STATUS_QUEUED, worker=""
+    )
+
+
+def claim_next(worker):
+    """
+    Claim the oldest due job for ``worker``. The conditional UPDATE makes the
+    claim safe with several workers on any database.
+    """
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.STATUS_QUEUED, run_after__lte=now)
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING,
+            worker=worker,
+            started_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def report_progress(job, progress, total=None, message=None):
+    job.progress = progress
+    if total is not None:
+        job.total = total
+    if message is not None:
+        job.message = message[:255]
+    job.save(update_fields=["progress", "total", "message"])
+    _push(job)
+
+
+def run_job(job):
+    """Run a claimed job; marks it done, queued for a retry, or failed."""
+    handler = JOB_HANDLERS.get(job.kind)
+    _push(job)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        handler(job, **job.params)
+    except Exception:
+        logger.exception("Job %s failed (attempt %d/%d)", job.pk, job.attempts, job.max_attempts)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts and handler is not None:
+            delay = settings.JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)
+            job.status = Job.STATUS_QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            job.message = f"Mislukt, nieuwe poging over {delay} s"
+        else:
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+            job.message = "Mislukt"
+    else:
+        job.status = Job.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.error = ""
+        job.progress = max(job.progress, job.total)
+    job.worker = ""
+    job.save()
+    _push(job)
+    return job
+
+
+def run_pending(worker, limit=None):
+    """Run due jobs until the queue is empty (or ``limit`` jobs ran); returns the count."""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next(worker)
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+# ── Handlers ──────────────────────────────────────────────────────
+
+@job_handler("distribute_route")
+def distribute_route_job(job, route_id):
+    route = Route.objects.select_related("edition").get(pk=route_id)
+    report_progress(job, 0, total=1, message=f"Distribueren: {route.name}")
+    result = distribute_route(route)
+    refresh_edition_state(route.edition_id)
+    report_progress(job, 1, message=str(result))
+
+
+@job_handler("clear_teamrouteparts")
+def clear_teamrouteparts_job(job, route_id):
+    route = Route.objects.get(pk=route_id)
+    report_progress(job, 0, total=1, message=f"Verwijderen: {route.name}")
+    parts = TeamRoutePart.objects.filter(route=route)
+    team_ids = set(parts.values_list("team_id", flat=True))
+    deleted, _ = parts.delete()
+    refresh_stats(team_ids)
+    refresh_edition_state(route.edition_id)
+    report_progress(job, 1, message=f"{deleted} rijen verwijderd")
+
+
+@job_handler("activate_team")
+def activate_team_job(job, team_id):
+    from server.views import _send_team_code_email
+
+    team = Team.objects.select_related("edition").get(pk=team_id)
+    report_progress(job, 0, total=2, message=f"Routes distribueren: {team.name}")
+    distribute_routes_for_team(team)
+    refresh_team_state(team.id)
+    report_progress(job, 1, message=f"Teamcode mailen: {team.name}")
+    _send_team_code_email(team)
+    report_progress(job, 2, message=f"{team.name} geactiveerd")
+
+
+RESEND_CHUNK = 200
+
+
+@job_handler("resend_team_codes")
+def resend_team_codes_job(job, edition_id):
+    """Queue the team code mail again for every activated team of the edition."""
+    from server.views import _team_code_email
+
+    teams = list(
+        Team.objects.select_related("edition")
+        .filter(edition_id=edition_id, is_activated=True)
+        .exclude(code="")
+        .order_by("id")
+    )
+    report_progress(job, 0, total=len(teams), message="Teamcodes in de wachtrij zetten")
+    for start in range(0, len(teams), RESEND_CHUNK):
+        chunk = teams[start:start + RESEND_CHUNK]
+        queue_emails([_team_code_email(team) for team in chunk])
+        report_progress(job, start + len(chunk))
+    report_progress(job, len(teams), message=f"{len(teams)} teamcodes in de wachtrij")
@@ -0,0 +1,155 @@
+import csv
+import gzip
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from server.apps.dashboard.models import Edition, LocationLog
+from server.apps.dashboard.partitions import (
+    COLUMNS,
+    drop_partitions_before,
+    move_default_rows,
+    partitions,
+    rewrite_partition,
+)
+
+DELETE_CHUNK = 1000
+
+# Partition rewrite: rows of other teams as they are, the first fix of every
+# team-minute for the edition's teams
+DOWNSAMPLE_SQL = f"""
+    SELECT {COLUMNS} FROM {{source}} WHERE NOT (team_id = ANY(%s))
+    UNION ALL
+    (SELECT DISTINCT ON (team_id, date_trunc('minute', "time")) {COLUMNS} FROM {{source}}
+     WHERE team_id = ANY(%s) ORDER BY team_id, date_trunc('minute', "time"), "time", id)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive the raw location logs of finished editions to a gzipped CSV and "
+        "downsample them to one fix per team per minute. On PostgreSQL the daily "
+        "partitions are rewritten and swapped instead of deleting rows, and "
+        "--drop-older-than-days drops whole days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=30,
+            help="Only editions that ended at least this many days ago (default 30).",
+        )
+        parser.add_argument("--edition", type=int, help="Compact this edition only.")
+        parser.add_argument(
+            "--archive-dir", default=str(getattr(settings, "LOCATION_ARCHIVE_DIR", "")),
+            help="Directory for the CSV archives.",
+        )
+        parser.add_argument(
+            "--drop-older-than-days", type=int,
+            help=(
+                "Afterwards detach and drop the daily partitions older than this many days "
+                "(PostgreSQL only; days of editions that are not compacted yet are kept)."
+            ),
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if not options["archive_dir"]:
+            raise CommandError("No --archive-dir given and LOCATION_ARCHIVE_DIR is not set.")
+        archive_dir = Path(options["archive_dir"])
+
+        editions = Edition.objects.filter(locations_compacted_at__isnull=True)
+        if options["edition"]:
+            editions = editions.filter(pk=options["edition"])
+        else:
+            cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+            editions = editions.filter(date_end__lt=cutoff)
+
+        for edition in editions.order_by("date_end"):
+            kept, removed = self.compact(edition, archive_dir, options["dry_run"])
+            self.stdout.write(f"{edition}: kept {kept}, removed {removed} location logs")
+
+        if options["drop_older_than_days"] is not None:
+            self.drop_old_days(options["drop_older_than_days"], options["dry_run"])
+
+    def compact(self, edition, archive_dir, dry_run):
+        logs = (
+            LocationLog.objects.filter(team__edition=edition)
+            .order_by("team_id", "time", "id")
+            .values_list("id", "team_id", "lat", "lng", "time")
+        )
+        path = archive_dir / f"locationlog_edition_{edition.pk}_{timezone.now():%Y%m%d%H%M%S}.csv.gz"
+
+        kept = 0
+        to_delete = []
+        days = set()
+        last_key = None
+        writer = None
+        archive = None
+        if not dry_run:
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            archive = gzip.open(path, "wt", newline="")
+            writer = csv.writer(archive)
+            writer.writerow(["id", "team_id", "lat", "lng", "time"])
+
+        try:
+            for log_id, team_id, lat, lng, logged_at in logs.iterator(chunk_size=5000):
+                if writer is not None:
+                    writer.writerow([log_id, team_id, lat, lng, logged_at.isoformat()])
+                days.add(timezone.localdate(logged_at))
+                # First fix of every team-minute is kept
+                key = (team_id, logged_at.replace(second=0, microsecond=0))
+                if key == last_key:
+                    to_delete.append(log_id)
+                else:
+                    kept += 1
+                    last_key = key
+        finally:
+            if archive is not None:
+                archive.close()
+
+        if dry_run:
+            return kept, len(to_delete)
+
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                self.rewrite_days(edition, days)
+            else:
+                for i in range(0, len(to_delete), DELETE_CHUNK):
+                    LocationLog.objects.filter(id__in=to_delete[i:i + DELETE_CHUNK]).delete()
+            edition.locations_compacted_at = timezone.now()
+            edition.save(update_fields=["locations_compacted_at"])
+        return kept, len(to_delete)
+
+    def rewrite_days(self, edition, days):
+        """Swap in downsampled copies of the daily partitions holding the edition's logs."""
+        team_ids = list(edition.teams.values_list("id", flat=True))
+        with connection.cursor() as cursor:
+            move_default_rows(cursor)
+            for day in sorted(days):
+                rewrite_partition(cursor, day, DOWNSAMPLE_SQL, [team_ids, team_ids])
+
+    def drop_old_days(self, older_than_days, dry_run):
+        if connection.vendor != "postgresql":
+            self.stdout.write("LocationLog is only partitioned on PostgreSQL; no days dropped.")
+            return
+
+        cutoff = timezone.localdate() - timedelta(days=older_than_days)
+        pending = Edition.objects.filter(locations_compacted_at__isnull=True).aggregate(
+            start=Min("date_start")
+        )["start"]
+        if pending is not None:
+            # Never drop logs that are not archived yet
+            cutoff = min(cutoff, timezone.localdate(pending))
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if dry_run:
+                dropped = [day for day in partitions(cursor) if day < cutoff]
+            else:
+                dropped = drop_partitions_before(cursor, cutoff)
+        verb = "Would drop" if dry_run else "Dropped"
+        self.stdout.write(f"{verb} {len(dropped)} daily partitions before {cutoff}")
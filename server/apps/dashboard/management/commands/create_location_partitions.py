@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from server.apps.dashboard.partitions import create_partition, move_default_rows, partition_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Create daily LocationLog partitions ahead of time and move rows out of "
+        "the default partition (PostgreSQL only). Run daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days-ahead", type=int, default=7)
+
+    def handle(self, *args, days_ahead=7, **options):
+        if connection.vendor != "postgresql":
+            self.stdout.write("LocationLog is only partitioned on PostgreSQL; nothing to do.")
+            return
+
+        # Empty the default partition first: it is scanned for every new day
+        with transaction.atomic(), connection.cursor() as cursor:
+            moved = move_default_rows(cursor)
+        if moved:
+            self.stdout.write(f"Moved rows of {moved} days out of the default partition.")
+
+        today = timezone.localdate()
+        created = 0
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    create_partition(cursor, day)
+                created += 1
+            except DatabaseError as exc:
+                self.stderr.write(f"Skipping {partition_name(day)}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Ensured {created} daily partitions."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from server.apps.dashboard.message_threads import rebuild_threads
+
+
+class Command(BaseCommand):
+    help = "Rebuild the conversation summary per team (MessageThread) from the messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--edition", type=int, dest="edition_id",
+            help="Only rebuild the threads of this edition id.",
+        )
+
+    def handle(self, *args, edition_id=None, **options):
+        count = rebuild_threads(edition_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} message threads."))
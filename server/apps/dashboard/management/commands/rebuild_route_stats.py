@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from server.apps.dashboard.route_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the progress per team and route (RouteTeamStats) from the TeamRouteParts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--team", type=int, action="append", dest="team_ids",
+            help="Only rebuild these team ids (repeatable).",
+        )
+
+    def handle(self, *args, team_ids=None, **options):
+        count = rebuild_stats(team_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} route stats rows."))
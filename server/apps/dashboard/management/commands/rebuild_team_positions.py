@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from server.apps.dashboard.positions import rebuild_positions
+
+
+class Command(BaseCommand):
+    help = "Rebuild the latest position per team (TeamPosition) from LocationLog."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--team", type=int, action="append", dest="team_ids",
+            help="Only rebuild these team ids (repeatable).",
+        )
+
+    def handle(self, *args, team_ids=None, **options):
+        count = rebuild_positions(team_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} team positions."))
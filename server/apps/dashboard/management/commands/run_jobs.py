@@ -0,0 +1,64 @@
+import logging
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from server.apps.dashboard.jobs import requeue_stale, run_pending
+from server.apps.dashboard.outbox import drain_all
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (distribution, clearing, team activation), "
+        "send the email outbox and keep LocationLog partitions ahead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Run the jobs and send the emails that are due now, then exit.",
+        )
+        parser.add_argument(
+            "--poll", type=float, default=settings.JOB_POLL_SECONDS,
+            help=f"Seconds between polls of an empty queue (default {settings.JOB_POLL_SECONDS}).",
+        )
+
+    def handle(self, *args, once=False, poll=None, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+
+        if once:
+            self.create_partitions()
+            requeue_stale()
+            count = run_pending(worker)
+            sent, failed = drain_all()
+            self.stdout.write(f"Ran {count} jobs, sent {sent} emails ({failed} failed).")
+            return
+
+        self.stdout.write(f"Job worker {worker} started.")
+        next_partitions = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() >= next_partitions:
+                    self.create_partitions()
+                    next_partitions = time.monotonic() + settings.LOCATION_PARTITIONS_SECONDS
+                requeue_stale()
+                ran = run_pending(worker)
+                sent, failed = drain_all()
+                if not ran and not sent and not failed:
+                    time.sleep(poll)
+        except KeyboardInterrupt:
+            self.stdout.write("Job worker stopped.")
+
+    def create_partitions(self):
+        try:
+            call_command("create_location_partitions", stdout=self.stdout, stderr=self.stderr)
+        except Exception:
+            logger.exception("Creating LocationLog partitions failed")
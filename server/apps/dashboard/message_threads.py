@@ -0,0 +1,170 @@
+"""
+Conversation summary per team (MessageThread) for the backoffice inbox.
+
+A new message updates its thread with one UPDATE (``record_message``, called
+from the Message post_save signal); marking a thread read subtracts the
+messages it marked from the unread count (``mark_read``). The messages page
+and the sidebar badge read the table instead of counting messages.
+``refresh_threads`` recomputes the rows of the given teams from their
+messages, e.g. after clearing a thread; ``rebuild_threads`` recomputes
+everything (see the ``rebuild_message_threads`` command).
+
+Changes are pushed as ``{"type": "unread", ...}`` to the backoffice clients of
+the edition so open pages can update their badges: the change of the team's
+count once it is committed, or the recomputed counts (``push_unread``).
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Message, MessageThread, Team
+
+REBUILD_CHUNK = 500
+
+
+def thread_team_id(message):
+    """The team whose conversation ``message`` belongs to; None for broadcasts."""
+    return message.sender_team_id or message.recipient_team_id
+
+
+def unread_total(edition_id):
+    """Unread team messages of an edition (the sidebar badge)."""
+    return (
+        MessageThread.objects.filter(edition_id=edition_id, unread_count__gt=0)
+        .aggregate(total=Sum("unread_count"))["total"] or 0
+    )
+
+
+def record_message(message):
+    """Count a new message in its thread, in one UPDATE."""
+    team_id = thread_team_id(message)
+    if team_id is None:
+        return
+    from_team = message.sender_team_id is not None
+    changes = {"last_message": message, "last_activity": message.created_at}
+    if from_team:
+        changes["unread_count"] = F("unread_count") + 1
+    updated = MessageThread.objects.filter(team_id=team_id).update(**changes)
+    if not updated:
+        # First message of the team (or threads not built yet); it is the newest
+        unread = Message.objects.filter(sender_team_id=team_id, read_at__isnull=True).count()
+        MessageThread.objects.bulk_create(
+            [MessageThread(
+                team_id=team_id, edition_id=message.edition_id, last_message=message,
+                last_activity=message.created_at, unread_count=unread,
+            )],
+            update_conflicts=True,
+            unique_fields=["team"],
+            update_fields=["last_message", "last_activity", "unread_count"],
+        )
+    if from_team:
+        transaction.on_commit(partial(push_unread_change, message.edition_id, team_id, 1))
+
+
+def mark_read(edition_id, team_id):
+    """Mark the messages of a team as read by the organisation; returns how many."""
+    with transaction.atomic(savepoint=False):
+        marked = Message.objects.filter(
+            edition_id=edition_id, sender_team_id=team_id, read_at__isnull=True
+        ).update(read_at=timezone.now())
+        if marked:
+            # Only the messages marked here: one arriving meanwhile stays unread
+            MessageThread.objects.filter(team_id=team_id).update(
+                unread_count=Greatest(F("unread_count") - marked, 0)
+            )
+    if marked:
+        transaction.on_commit(partial(push_unread_change, edition_id, team_id, -marked))
+    return marked
+
+
+def refresh_threads(team_ids):
+    """Recompute the threads of ``team_ids``; returns the number of rows written."""
+    team_ids = {team_id for team_id in team_ids if team_id is not None}
+    if not team_ids:
+        return 0
+
+    teams = (
+        Team.objects.filter(id__in=team_ids)
+        .annotate(
+            last_sent=Max("sent_messages__id"),
+            last_received=Max(
+                "received_messages__id", filter=Q(received_messages__sender_team__isnull=True)
+            ),
+        )
+        .values("id", "edition_id", "last_sent", "last_received")
+    )
+    last_ids = {}
+    editions = {}
+    for row in teams:
+        editions[row["id"]] = row["edition_id"]
+        ids = [i for i in (row["last_sent"], row["last_received"]) if i is not None]
+        if ids:
+            last_ids[row["id"]] = max(ids)
+    unread = dict(
+        Message.objects.filter(sender_team_id__in=team_ids, read_at__isnull=True)
+        .order_by()
+        .values_list("sender_team_id")
+        .annotate(n=Count("id"))
+    )
+    created = dict(
+        Message.objects.filter(id__in=last_ids.values()).values_list("id", "created_at")
+    )
+
+    rows = [
+        MessageThread(
+            team_id=team_id,
+            edition_id=editions[team_id],
+            last_message_id=message_id,
+            last_activity=created[message_id],
+            unread_count=unread.get(team_id, 0),
+        )
+        for team_id, message_id in last_ids.items()
+    ]
+    with transaction.atomic(savepoint=False):
+        # Teams without messages (left) have no thread
+        MessageThread.objects.filter(team_id__in=team_ids - last_ids.keys()).delete()
+        if rows:
+            MessageThread.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["team"],
+                update_fields=["edition", "last_message", "last_activity", "unread_count"],
+            )
+    return len(rows)
+
+
+def rebuild_threads(edition_id=None):
+    """Recompute the threads of all teams (of an edition); returns the number of rows."""
+    teams = Team.objects.order_by("id")
+    if edition_id is not None:
+        teams = teams.filter(edition_id=edition_id)
+    all_ids = list(teams.values_list("id", flat=True))
+
+    written = 0
+    for start in range(0, len(all_ids), REBUILD_CHUNK):
+        written += refresh_threads(all_ids[start:start + REBUILD_CHUNK])
+    return written
+
+
+def push_unread(edition_id, team_id):
+    """Send the unread count of the team and the edition to the backoffice clients."""
+    from server.apps.asgi_socket.consumers import push_to_backoffice
+
+    counts = MessageThread.objects.filter(edition_id=edition_id, unread_count__gt=0).aggregate(
+        total=Sum("unread_count"),
+        team=Sum(Case(When(team_id=team_id, then="unread_count"), default=Value(0))),
+    )
+    push_to_backoffice(edition_id, {
+        "type": "unread",
+        "data": {"team": team_id, "unread": counts["team"] or 0, "total": counts["total"] or 0},
+    })
+
+
+def push_unread_change(edition_id, team_id, change):
+    """Send the change of the team's unread count to the backoffice clients."""
+    from server.apps.asgi_socket.consumers import push_to_backoffice
+
+    push_to_backoffice(edition_id, {"type": "unread", "data": {"team": team_id, "change": change}})
@@ -0,0 +1,170 @@
+"""
+Query count and latency per view and per socket endpoint.
+
+``QueryMetricsMiddleware`` measures every request: number of SQL queries, time
+spent in the database and total time. It adds them as a ``Server-Timing``
+header (visible in the browser dev tools) and keeps the last
+``METRICS_WINDOW`` samples per view in memory for p50/p95 (per process, see
+the ``backoffice:metrics`` endpoint). ``SocketDataHandler.handle_request``
+and ``handle_inline`` do the same for the socket endpoints, and the location
+buffer records its batched writes (``ingestion:flush``) and the geofence
+evaluation that follows them (``ingestion:geofence``).
+
+Views and socket handlers can declare a budget with ``@query_budget(n)``.
+Going over it logs a warning, or raises ``QueryBudgetExceeded`` when
+``QUERY_BUDGET_ENFORCE`` is set (always under ``server.test_runner``), so
+regressions fail CI.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of queries of a view or socket handler."""
+    def decorate(func):
+        func.query_budget = max_queries
+        return func
+    return decorate
+
+
+class QueryTimer:
+    """Counts queries and database time on the current connection while active."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._wrapper.__exit__(*exc)
+        self.total_time = time.perf_counter() - self._started
+
+    @property
+    def db_ms(self):
+        return self.db_time * 1000
+
+    @property
+    def total_ms(self):
+        return self.total_time * 1000
+
+
+# ── Rolling samples ───────────────────────────────────────────────
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Metrics:
+    def __init__(self, window=500):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self._waits: dict[str, deque] = {}
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, samples, name):
+        if name not in samples:
+            samples[name] = deque(maxlen=self.window)
+        return samples[name]
+
+    def record(self, name, timer):
+        with self._lock:
+            self._window(self._samples, name).append((timer.queries, timer.db_ms, timer.total_ms))
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def record_wait(self, name, wait_ms):
+        """Time a request waited before it could run (socket admission control)."""
+        with self._lock:
+            self._window(self._waits, name).append(wait_ms)
+
+    def snapshot(self):
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            waits = {name: list(values) for name, values in self._waits.items()}
+            counts = dict(self._counts)
+
+        result = {}
+        for name in sorted(samples.keys() | waits.keys()):
+            entry = result[name] = {"count": counts.get(name, 0)}
+            if values := samples.get(name):
+                queries, db_ms, total_ms = zip(*values)
+                entry.update({
+                    "queries": {"p50": _percentile(queries, 50), "p95": _percentile(queries, 95),
+                                "max": max(queries)},
+                    "db_ms": {"p50": round(_percentile(db_ms, 50), 2), "p95": round(_percentile(db_ms, 95), 2)},
+                    "total_ms": {"p50": round(_percentile(total_ms, 50), 2),
+                                 "p95": round(_percentile(total_ms, 95), 2)},
+                })
+            if values := waits.get(name):
+                entry["queue_ms"] = {"p50": round(_percentile(values, 50), 2),
+                                     "p95": round(_percentile(values, 95), 2)}
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._waits.clear()
+            self._counts.clear()
+
+
+metrics = Metrics(window=getattr(settings, "METRICS_WINDOW", 500))
+
+
+def check_budget(name, func, timer):
+    budget = getattr(func, "query_budget", None)
+    if budget is None or timer.queries <= budget:
+        return
+    message = f"{name} ran {timer.queries} queries, budget is {budget}"
+    if getattr(settings, "QUERY_BUDGET_ENFORCE", False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+# ── Middleware ────────────────────────────────────────────────────
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryTimer() as timer:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        name = match.view_name if match else "unresolved"
+        metrics.record(name, timer)
+        response["Server-Timing"] = (
+            f'db;dur={timer.db_ms:.1f};desc="{timer.queries} queries", '
+            f"total;dur={timer.total_ms:.1f}"
+        )
+        # Error pages run queries of their own (QuerySet reprs in the traceback)
+        if match and response.status_code < 500:
+            check_budget(name, match.func, timer)
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0018_add_team_last_seen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='locationlog',
+            name='time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0019_locationlog_time_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamPosition',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='position', serialize=False, to='dashboard.team')),
+                ('lat', models.FloatField()),
+                ('lng', models.FloatField()),
+                ('time', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
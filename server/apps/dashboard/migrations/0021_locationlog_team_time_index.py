@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0020_teamposition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edition',
+            name='locations_compacted_at',
+            field=models.DateTimeField(blank=True, help_text='Set when the location logs were downsampled and archived', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='locationlog',
+            index=models.Index(fields=['team', 'time'], name='locationlog_team_time_idx'),
+        ),
+    ]
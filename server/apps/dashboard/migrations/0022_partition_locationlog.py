@@ -0,0 +1,87 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:12
+
+from django.db import migrations
+
+# PostgreSQL only: LocationLog becomes a table partitioned by RANGE (time).
+# Rows without a matching daily partition land in the default partition; the
+# create_location_partitions command adds daily partitions ahead of time.
+# On other databases (SQLite) the table stays a plain, indexed table.
+
+PARTITION_SQL = """
+ALTER TABLE dashboard_locationlog RENAME TO dashboard_locationlog_unpartitioned;
+
+CREATE TABLE dashboard_locationlog (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    lat double precision NOT NULL,
+    lng double precision NOT NULL,
+    "time" timestamp with time zone NOT NULL,
+    team_id bigint NOT NULL
+        REFERENCES dashboard_team (id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, "time")
+) PARTITION BY RANGE ("time");
+
+CREATE TABLE dashboard_locationlog_default
+    PARTITION OF dashboard_locationlog DEFAULT;
+
+INSERT INTO dashboard_locationlog (id, lat, lng, "time", team_id)
+    SELECT id, lat, lng, "time", team_id FROM dashboard_locationlog_unpartitioned;
+
+SELECT setval(
+    pg_get_serial_sequence('dashboard_locationlog', 'id'),
+    COALESCE((SELECT MAX(id) FROM dashboard_locationlog), 0) + 1,
+    false
+);
+
+DROP TABLE dashboard_locationlog_unpartitioned;
+
+CREATE INDEX locationlog_team_time_idx ON dashboard_locationlog (team_id, "time");
+CREATE INDEX dashboard_locationlog_team_id ON dashboard_locationlog (team_id);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE dashboard_locationlog RENAME TO dashboard_locationlog_partitioned;
+
+CREATE TABLE dashboard_locationlog (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    lat double precision NOT NULL,
+    lng double precision NOT NULL,
+    "time" timestamp with time zone NOT NULL,
+    team_id bigint NOT NULL
+        REFERENCES dashboard_team (id) DEFERRABLE INITIALLY DEFERRED
+);
+
+INSERT INTO dashboard_locationlog (id, lat, lng, "time", team_id)
+    SELECT id, lat, lng, "time", team_id FROM dashboard_locationlog_partitioned;
+
+SELECT setval(
+    pg_get_serial_sequence('dashboard_locationlog', 'id'),
+    COALESCE((SELECT MAX(id) FROM dashboard_locationlog), 0) + 1,
+    false
+);
+
+DROP TABLE dashboard_locationlog_partitioned CASCADE;
+
+CREATE INDEX locationlog_team_time_idx ON dashboard_locationlog (team_id, "time");
+CREATE INDEX dashboard_locationlog_team_id ON dashboard_locationlog (team_id);
+"""
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(PARTITION_SQL)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(UNPARTITION_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0021_locationlog_team_time_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0024_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeofenceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('arrival', 'Aangekomen'), ('near_miss', 'Net gemist'), ('unreported', 'Niet gemeld door app')], max_length=16)),
+                ('distance', models.FloatField(help_text='Metres from the destination at the time of the event')),
+                ('time', models.DateTimeField()),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='dashboard.destination')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='dashboard.team')),
+            ],
+            options={
+                'ordering': ('time',),
+                'indexes': [models.Index(fields=['team', 'time'], name='geofence_event_team_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='geofenceevent',
+            constraint=models.UniqueConstraint(fields=('destination', 'kind'), name='geofence_event_once_per_kind'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0025_geofenceevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteTeamStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parts_total', models.PositiveIntegerField(default=0)),
+                ('parts_completed', models.PositiveIntegerField(default=0)),
+                ('destinations_completed', models.PositiveIntegerField(default=0)),
+                ('first_completed', models.DateTimeField(blank=True, null=True)),
+                ('last_completed', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('current_part', models.ForeignKey(blank=True, help_text='First open part, by order', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='dashboard.teamroutepart')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_stats', to='dashboard.route')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_stats', to='dashboard.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['team', 'route'], name='route_team_stats_team_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='routeteamstats',
+            constraint=models.UniqueConstraint(fields=('route', 'team'), name='route_team_stats_unique'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+import secrets
+
+from django.db import migrations, models
+
+CODE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+
+def deduplicate_codes(apps, schema_editor):
+    """Give every team but the first one of a duplicated code a new code."""
+    Team = apps.get_model("dashboard", "Team")
+    duplicated = (
+        Team.objects.exclude(code="")
+        .values("code")
+        .annotate(n=models.Count("id"))
+        .filter(n__gt=1)
+        .values_list("code", flat=True)
+    )
+    taken = set(Team.objects.exclude(code="").values_list("code", flat=True))
+    for code in list(duplicated):
+        for team in Team.objects.filter(code=code).order_by("id")[1:]:
+            new_code = code
+            while new_code in taken:
+                new_code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(5))
+            taken.add(new_code)
+            team.code = new_code
+            team.save(update_fields=["code"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dashboard", "0026_routeteamstats"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="team",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("code", ""), _negated=True),
+                fields=("code",),
+                name="team_code_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0027_team_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='messages_read_cursor',
+            field=models.PositiveBigIntegerField(default=0, help_text='Id of the last message the team has read in the app'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['edition', 'sender_team', 'recipient_team', 'id'], name='message_edition_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender_team', 'id'], name='message_sender_idx'),
+        ),
+    ]
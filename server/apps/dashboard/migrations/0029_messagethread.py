@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0028_message_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0, help_text='Messages from the team not read by the organisation yet')),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_threads', to='dashboard.edition')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='dashboard.message')),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='message_thread', to='dashboard.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['edition', 'unread_count'], name='message_thread_unread_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0029_messagethread'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplayEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(max_length=64)),
+                ('seq', models.PositiveBigIntegerField()),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReplayStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('seq', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='replayevent',
+            constraint=models.UniqueConstraint(fields=('stream', 'seq'), name='replay_event_stream_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# PostgreSQL: 0022 copied the history into the DEFAULT partition, so every
+# partition added later had to scan (and lock) it. Move those rows into daily
+# partitions (the SQL of dashboard.partitions at the time of writing).
+#
+# 0022 also created the team index with raw SQL as
+# "dashboard_locationlog_team_id", while the model state still had the
+# ForeignKey's own index under a generated name. The index is now declared
+# under that name; on other databases (a plain table) the ForeignKey index is
+# replaced by it.
+
+TEAM_INDEX = models.Index(fields=["team"], name="dashboard_locationlog_team_id")
+
+
+TABLE = "dashboard_locationlog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+COLUMNS = 'id, lat, lng, "time", team_id'
+
+
+def split_default_partition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT DISTINCT ("time" AT TIME ZONE %s)::date FROM {DEFAULT_PARTITION}',
+            [settings.TIME_ZONE],
+        )
+        days = sorted(row[0] for row in cursor.fetchall())
+        if not days:
+            return
+
+        # Detached, the DEFAULT partition is not scanned when the days are added
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        for day in days:
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE}_p{day:%Y%m%d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+        cursor.execute(f"INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {DEFAULT_PARTITION}")
+        cursor.execute(f"TRUNCATE {DEFAULT_PARTITION}")
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+
+def declare_team_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        return
+    LocationLog = apps.get_model("dashboard", "LocationLog")
+    table = LocationLog._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    for name, info in constraints.items():
+        if info["index"] and info["columns"] == ["team_id"] and not info["primary_key"]:
+            schema_editor.execute(schema_editor._delete_index_sql(LocationLog, name))
+    schema_editor.add_index(LocationLog, TEAM_INDEX)
+
+
+def undeclare_team_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        return
+    LocationLog = apps.get_model("dashboard", "LocationLog")
+    schema_editor.remove_index(LocationLog, TEAM_INDEX)
+    schema_editor.execute(
+        schema_editor._create_index_sql(LocationLog, fields=[LocationLog._meta.get_field("team")])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0030_replay_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_default_partition, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(declare_team_index, undeclare_team_index),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='locationlog',
+                    name='team',
+                    field=models.ForeignKey(db_index=False, on_delete=models.deletion.CASCADE, related_name='location_logs', to='dashboard.team'),
+                ),
+                migrations.AddIndex(
+                    model_name='locationlog',
+                    index=TEAM_INDEX,
+                ),
+            ],
+        ),
+    ]
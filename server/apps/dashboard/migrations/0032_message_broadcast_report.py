@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0031_locationlog_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='broadcast_delivered',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='broadcast_dropped',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='broadcast_recipients',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
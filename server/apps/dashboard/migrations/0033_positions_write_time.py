@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0032_message_broadcast_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geofenceevent',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Server time the event was stored'),
+        ),
+        migrations.AddField(
+            model_name='teamposition',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
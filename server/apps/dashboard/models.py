@@ -1,10 +1,10 @@
-from datetime import datetime
 from urllib.parse import urljoin
 
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
+from . import route_cache
 from .validators import FinalDestinationValidationMixin
 from .constants import (
     DESTINATION_TYPE_MANDATORY,
@@ -91,6 +91,11 @@ class Edition(models.Model):
         default=False,
         help_text="Enable messaging between organisation and teams",
     )
+    locations_compacted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Set when the location logs were downsampled and archived",
+    )
 
     event = models.ForeignKey(
         "dashboard.Event",
@@ -118,6 +123,10 @@ class Team(models.Model):
         default=300,
         help_text="GPS location upload interval in seconds",
     )
+    messages_read_cursor = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Id of the last message the team has read in the app",
+    )
 
     edition = models.ForeignKey(
         "dashboard.Edition",
@@ -125,24 +134,18 @@ class Team(models.Model):
         related_name="teams",
     )
 
+    class Meta:
+        constraints = [
+            # The app authenticates with the code alone; teams that are not
+            # activated yet have no code
+            models.UniqueConstraint(
+                fields=["code"], condition=~models.Q(code=""), name="team_code_unique"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.name}"
 
-    def go_online(self):
-        self.online = True
-        self.last_seen = timezone.now()
-        self.save(update_fields=["online", "last_seen"])
-
-    def go_offline(self):
-        self.online = False
-        self.last_seen = timezone.now()
-        self.save(update_fields=["online", "last_seen"])
-
-    def touch(self):
-        """Update last_seen timestamp on any WebSocket activity."""
-        self.last_seen = timezone.now()
-        self.save(update_fields=["last_seen"])
-
     def get_next_open_routepart(self):
         return (
             self.teamrouteparts.filter(completed_time__isnull=True)
@@ -164,6 +167,8 @@ class Team(models.Model):
         return ret
 
     def undo_last_completion(self):
+        from .route_stats import refresh_stats
+
         last_completed_time = self._last_completed_time()
 
         if team_route_part := self.teamrouteparts.filter(
@@ -174,6 +179,8 @@ class Team(models.Model):
             team_route_part.destinations.filter(
                 completed_time=last_completed_time
             ).update(completed_time=None)
+            route_cache.invalidate_team(self.id)
+            refresh_stats([self.id])
 
     def _format_single_part(self, part):
         """Format a single TeamRoutePart into the app-friendly dict."""
@@ -195,7 +202,9 @@ class Team(models.Model):
                 "image": image_url,
                 "audio": audio_url,
                 "coordinates": self.destinations_formatted(
-                    part.destinations.filter(completed_time__isnull=True)
+                    part.open_destinations
+                    if hasattr(part, "open_destinations")
+                    else part.destinations.filter(completed_time__isnull=True)
                 ),
             },
         }
@@ -223,6 +232,13 @@ class Team(models.Model):
             .filter(bundle=bundle)
             .order_by("order")
             .select_related("routedata_image", "routedata_audio")
+            .prefetch_related(
+                models.Prefetch(
+                    "destinations",
+                    queryset=Destination.objects.filter(completed_time__isnull=True),
+                    to_attr="open_destinations",
+                )
+            )
         )
 
         # Determine the index of the first uncompleted part
@@ -252,9 +268,6 @@ class Team(models.Model):
             "parts": parts_data,
         }
 
-    def get_teamroutepart(self, destination_id):
-        return self.teamrouteparts.get(destinations__id=destination_id)
-
     @staticmethod
     def destinations_formatted(destinations):
         return [
@@ -271,10 +284,11 @@ class Team(models.Model):
         ]
 
     def handle_destination_completion(self, destination_id):
-        complete_time = datetime.now()
-        part = self.get_teamroutepart(destination_id)
-        part.complete_destination(destination_id, complete_time)
-        part.check_completion(complete_time)
+        """Complete a destination and return the next route payload for the app."""
+        from .completion import complete_destination
+
+        complete_destination(self, destination_id)
+        return route_cache.get_route_payload(self.id, self.get_next_open_routepart_formatted)
 
 
 class Route(models.Model):
@@ -428,35 +442,6 @@ class TeamRoutePart(FinalDestinationValidationMixin, models.Model):
     def __str__(self):
         return f"{self.team.name} | {self.routepart}"
 
-    def complete_destination(self, destination_id, complete_time):
-        return self.destinations.filter(id=destination_id).update(
-            completed_time=complete_time
-        )
-
-    def check_completion(self, complete_time):
-        destinations = self.destinations.all()
-
-        # mandatory not completed
-        if destinations.filter(
-            destination_type=DESTINATION_TYPE_MANDATORY, completed_time__isnull=True
-        ).exists():
-            return
-
-        # choice is not completed
-        if (
-            destinations.filter(destination_type=DESTINATION_TYPE_CHOICE).exists()
-            and not destinations.filter(
-                destination_type=DESTINATION_TYPE_CHOICE, completed_time__isnull=False
-            ).exists()
-        ):
-            return
-
-        self.complete(complete_time)
-
-    def complete(self, complete_time):
-        self.completed_time = complete_time
-        self.save()
-
     def completed(self):
         return bool(self.completed_time)
 
@@ -544,8 +529,22 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
 
+    # Delivery of a broadcast over the sockets, summed over all server processes
+    broadcast_recipients = models.PositiveIntegerField(default=0)
+    broadcast_delivered = models.PositiveIntegerField(default=0)
+    broadcast_dropped = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ("created_at",)
+        indexes = [
+            # Organisation messages of an edition: broadcasts and per team
+            models.Index(
+                fields=["edition", "sender_team", "recipient_team", "id"],
+                name="message_edition_thread_idx",
+            ),
+            # Messages sent by a team
+            models.Index(fields=["sender_team", "id"], name="message_sender_idx"),
+        ]
 
     def __str__(self):
         sender = self.sender_team.name if self.sender_team else "Organisatie"
@@ -573,11 +572,295 @@ class LocationLog(models.Model):
         "dashboard.Team",
         on_delete=models.CASCADE,
         related_name="location_logs",
+        db_index=False,  # declared in Meta.indexes under the name migration 0022 gave it
     )
 
     lat = models.FloatField(max_length=64)
     lng = models.FloatField(max_length=64)
-    time = models.DateTimeField(auto_now_add=True)
+    time = models.DateTimeField(default=timezone.now)
 
     def __str__(self) -> str:
         return f"{self.team} | {self.time.strftime('%d-%m-%Y %H:%M')}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["team", "time"], name="locationlog_team_time_idx"),
+            models.Index(fields=["team"], name="dashboard_locationlog_team_id"),
+        ]
+
+
+class TeamPosition(models.Model):
+    """Latest known fix per team, kept up to date by the location ingestion."""
+
+    team = models.OneToOneField(
+        "dashboard.Team",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="position",
+    )
+
+    lat = models.FloatField()
+    lng = models.FloatField()
+    time = models.DateTimeField(db_index=True)
+    # Server time of the last change; ``time`` is the phone's and may lag behind
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"{self.team_id} | {self.time.strftime('%d-%m-%Y %H:%M')}"
+
+
+class Job(models.Model):
+    """Background task run by the ``run_jobs`` worker (see dashboard.jobs)."""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "In wachtrij"),
+        (STATUS_RUNNING, "Bezig"),
+        (STATUS_DONE, "Klaar"),
+        (STATUS_FAILED, "Mislukt"),
+    ]
+
+    kind = models.CharField(max_length=64)
+    params = models.JSONField(default=dict, blank=True)
+    edition = models.ForeignKey(
+        "dashboard.Edition",
+        on_delete=models.CASCADE,
+        related_name="jobs",
+        null=True,
+        blank=True,
+        help_text="Progress is pushed to the backoffice of this edition",
+    )
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        ordering = ("created_at",)
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    def to_progress_format(self):
+        """Progress event for the backoffice socket."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+        }
+
+
+class OutboundEmail(models.Model):
+    """Outbox row; written in the caller's transaction, sent by the worker (see dashboard.outbox)."""
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Te verzenden"),
+        (STATUS_SENT, "Verzonden"),
+        (STATUS_FAILED, "Mislukt"),
+    ]
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    team = models.ForeignKey(
+        "dashboard.Team",
+        on_delete=models.SET_NULL,
+        related_name="outbound_emails",
+        null=True,
+        blank=True,
+    )
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Next send attempt; also a lease while a sender has claimed the row
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("created_at",)
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.to}: {self.subject} ({self.status})"
+
+
+class GeofenceEvent(models.Model):
+    """Server-side geofence observation for a team destination (see dashboard.geofence)."""
+
+    KIND_ARRIVAL = "arrival"
+    KIND_NEAR_MISS = "near_miss"
+    KIND_UNREPORTED = "unreported"
+    KIND_CHOICES = [
+        (KIND_ARRIVAL, "Aangekomen"),
+        (KIND_NEAR_MISS, "Net gemist"),
+        (KIND_UNREPORTED, "Niet gemeld door app"),
+    ]
+
+    team = models.ForeignKey(
+        "dashboard.Team",
+        on_delete=models.CASCADE,
+        related_name="geofence_events",
+    )
+    destination = models.ForeignKey(
+        "dashboard.Destination",
+        on_delete=models.CASCADE,
+        related_name="geofence_events",
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    distance = models.FloatField(help_text="Metres from the destination at the time of the event")
+    time = models.DateTimeField()
+    recorded_at = models.DateTimeField(default=timezone.now, help_text="Server time the event was stored")
+
+    class Meta:
+        ordering = ("time",)
+        constraints = [
+            models.UniqueConstraint(fields=["destination", "kind"], name="geofence_event_once_per_kind"),
+        ]
+        indexes = [
+            models.Index(fields=["team", "time"], name="geofence_event_team_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.team_id} | {self.kind} | {self.destination_id}"
+
+
+class RouteTeamStats(models.Model):
+    """Progress of a team on a route, kept up to date by completions (see dashboard.route_stats)."""
+
+    route = models.ForeignKey(
+        "dashboard.Route",
+        on_delete=models.CASCADE,
+        related_name="team_stats",
+    )
+    team = models.ForeignKey(
+        "dashboard.Team",
+        on_delete=models.CASCADE,
+        related_name="route_stats",
+    )
+
+    parts_total = models.PositiveIntegerField(default=0)
+    parts_completed = models.PositiveIntegerField(default=0)
+    destinations_completed = models.PositiveIntegerField(default=0)
+    first_completed = models.DateTimeField(null=True, blank=True)
+    last_completed = models.DateTimeField(null=True, blank=True)
+    current_part = models.ForeignKey(
+        "dashboard.TeamRoutePart",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        help_text="First open part, by order",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["route", "team"], name="route_team_stats_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["team", "route"], name="route_team_stats_team_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id} | {self.team_id} | {self.parts_completed}/{self.parts_total}"
+
+    @property
+    def duration(self):
+        if self.first_completed and self.last_completed:
+            return self.last_completed - self.first_completed
+        return None
+
+    @property
+    def pct(self):
+        return round(self.parts_completed / self.parts_total * 100) if self.parts_total else 0
+
+
+class MessageThread(models.Model):
+    """Summary of the conversation between the organisation and a team (see dashboard.message_threads)."""
+
+    edition = models.ForeignKey(
+        "dashboard.Edition",
+        on_delete=models.CASCADE,
+        related_name="message_threads",
+    )
+    team = models.OneToOneField(
+        "dashboard.Team",
+        on_delete=models.CASCADE,
+        related_name="message_thread",
+    )
+    last_message = models.ForeignKey(
+        "dashboard.Message",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    unread_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Messages from the team not read by the organisation yet",
+    )
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["edition", "unread_count"], name="message_thread_unread_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.team_id} | {self.unread_count} ongelezen"
+
+
+class ReplayStream(models.Model):
+    """Last sequence number pushed on a socket stream (see asgi_socket.sessions)."""
+
+    name = models.CharField(max_length=64, unique=True)
+    seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.seq}"
+
+
+class ReplayEvent(models.Model):
+    """A pushed socket payload, kept for replay after a reconnect (see asgi_socket.sessions)."""
+
+    stream = models.CharField(max_length=64)
+    seq = models.PositiveBigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["stream", "seq"], name="replay_event_stream_seq_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.stream} #{self.seq}"
@@ -0,0 +1,128 @@
+"""
+Outgoing email via an outbox table.
+
+Callers queue OutboundEmail rows inside their own transaction, so a slow SMTP
+server never holds a request or a database transaction. The worker
+(``run_jobs``) calls ``drain``: it claims a batch of due rows, sends them over
+one SMTP connection and reschedules failures with exponential backoff.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def build_email(to, subject, body, team=None):
+    """Unsaved outbox row; save it or pass it to ``queue_emails``."""
+    return OutboundEmail(to=to, subject=subject[:255], body=body, team=team)
+
+
+def queue_email(to, subject, body, team=None):
+    email = build_email(to, subject, body, team=team)
+    email.save()
+    return email
+
+
+def queue_emails(emails):
+    return OutboundEmail.objects.bulk_create(emails, batch_size=500)
+
+
+def claim_batch(size=None):
+    """
+    Claim up to ``size`` due emails. ``next_attempt_at`` is pushed forward as a
+    lease, so a crashed sender's rows become due again after the lease.
+    """
+    size = size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        OutboundEmail.objects
+        .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)[:size]
+    )
+    OutboundEmail.objects.filter(
+        id__in=list(due), status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now
+    ).update(
+        claim_token=token,
+        next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+    )
+    return list(OutboundEmail.objects.filter(claim_token=token).order_by("id"))
+
+
+def _mark_failed(email, exc):
+    email.attempts += 1
+    email.last_error = f"{type(exc).__name__}: {exc}"
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboundEmail.STATUS_FAILED
+    else:
+        delay = settings.OUTBOX_RETRY_DELAY_SECONDS * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+
+def drain(batch_size=None, connection=None):
+    """Send one batch of due emails; returns (sent, failed)."""
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception:
+        logger.exception("Outbox: could not connect to the mail server")
+
+    try:
+        for email in batch:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[email.to],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                logger.warning("Outbox: sending %s to %s failed: %s", email.pk, email.to, exc)
+                _mark_failed(email, exc)
+                failed += 1
+                # Start over with a fresh connection for the rest of the batch
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                email.attempts += 1
+                email.status = OutboundEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ""
+                sent += 1
+            email.claim_token = ""
+    finally:
+        connection.close()
+        OutboundEmail.objects.bulk_update(
+            batch,
+            ["status", "attempts", "next_attempt_at", "claim_token", "last_error", "sent_at"],
+        )
+    return sent, failed
+
+
+def drain_all(batch_size=None):
+    """Drain batches until nothing is due; returns (sent, failed)."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = drain(batch_size)
+        if not sent and not failed:
+            return total_sent, total_failed
+        total_sent += sent
+        total_failed += failed
@@ -0,0 +1,134 @@
+"""
+Daily RANGE partitions of LocationLog (PostgreSQL only).
+
+Migration 0022 partitions ``dashboard_locationlog`` by ``time`` with one
+partition per local day and a DEFAULT partition for rows outside them. The
+DEFAULT partition is kept empty: adding a partition makes PostgreSQL scan it,
+under lock, for rows of the new range, which is only instant when it holds
+nothing. ``create_location_partitions`` (run at deploy and by the ``run_jobs``
+worker) adds the coming days ahead of time and ``move_default_rows`` moves
+rows that still ended up there (the history copied by the migration, pings
+from a phone with a wrong clock) into their days.
+
+Whole days are rewritten or removed by swapping partitions instead of
+deleting rows: ``rewrite_partition`` (downsampling in
+``compact_location_logs``) and ``drop_partitions_before`` (retention).
+
+The helpers take a cursor and use raw table names.
+"""
+import re
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+TABLE = "dashboard_locationlog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+COLUMNS = 'id, lat, lng, "time", team_id'
+
+_NAME_RE = re.compile(rf"^{TABLE}_p(\d{{8}})$")
+
+
+def partition_name(day):
+    return f"{TABLE}_p{day:%Y%m%d}"
+
+
+def day_bounds(day):
+    """Start and end (next local midnight) of ``day``."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def partitions(cursor):
+    """The daily partitions: {day: table name}."""
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = %s
+        """,
+        [TABLE],
+    )
+    found = {}
+    for (name,) in cursor.fetchall():
+        if match := _NAME_RE.match(name):
+            found[datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+    return found
+
+
+def create_partition(cursor, day):
+    """Create the partition of ``day`` unless it exists."""
+    start, end = day_bounds(day)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+
+
+def move_default_rows(cursor):
+    """Move the rows of the DEFAULT partition into daily partitions; returns the number of days."""
+    cursor.execute(
+        f'SELECT DISTINCT ("time" AT TIME ZONE %s)::date FROM {DEFAULT_PARTITION}',
+        [settings.TIME_ZONE],
+    )
+    days = sorted(row[0] for row in cursor.fetchall())
+    if not days:
+        return 0
+
+    # Detached, the DEFAULT partition is not scanned when the days are added
+    cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    for day in days:
+        create_partition(cursor, day)
+    cursor.execute(f"INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {DEFAULT_PARTITION}")
+    cursor.execute(f"TRUNCATE {DEFAULT_PARTITION}")
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    return len(days)
+
+
+def _attach(cursor, name, day):
+    """Attach table ``name`` as the partition of ``day`` without a validation scan."""
+    start, end = day_bounds(day)
+    check = f"{name}_range"
+    # The CHECK constraint proves the range, so ATTACH skips the range scan
+    cursor.execute(
+        f'ALTER TABLE {name} ADD CONSTRAINT {check} CHECK ("time" >= %s AND "time" < %s)',
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end]
+    )
+    cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {check}")
+
+
+def rewrite_partition(cursor, day, select_sql, params=()):
+    """
+    Replace the partition of ``day`` by the rows of ``select_sql``.
+
+    ``select_sql`` selects ``COLUMNS`` from ``{source}`` (the current
+    partition). The result is written to a new table that is swapped in; the
+    old partition is detached and dropped.
+    """
+    name = partition_name(day)
+    new = f"{name}_new"
+    cursor.execute(f"DROP TABLE IF EXISTS {new}")
+    cursor.execute(f"CREATE TABLE {new} (LIKE {TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(f"INSERT INTO {new} ({COLUMNS}) " + select_sql.format(source=name), params)
+    cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+    cursor.execute(f"DROP TABLE {name}")
+    cursor.execute(f"ALTER TABLE {new} RENAME TO {name}")
+    _attach(cursor, name, day)
+
+
+def drop_partitions_before(cursor, day):
+    """Detach and drop the daily partitions before ``day``; returns the dropped days."""
+    dropped = []
+    for partition_day, name in sorted(partitions(cursor).items()):
+        if partition_day >= day:
+            break
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+        dropped.append(partition_day)
+    return dropped
+
@@ -0,0 +1,76 @@
+"""
+Latest position per team (TeamPosition), maintained next to LocationLog.
+
+``record_positions`` is called by the location ingestion with every batch it
+writes; an existing row is only replaced by a newer fix, so late offline
+batches never move a team back; ``updated_at`` is the server time of the last
+change (the live map pages on it). ``rebuild_positions`` recomputes the table
+from LocationLog (see the ``rebuild_team_positions`` command).
+"""
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import LocationLog, Team, TeamPosition
+
+
+def latest_per_team(rows):
+    """Reduce LocationLog rows (or objects with team_id/lat/lng/time) to the newest per team."""
+    latest = {}
+    for row in rows:
+        current = latest.get(row.team_id)
+        if current is None or row.time > current.time:
+            latest[row.team_id] = row
+    return latest
+
+
+def record_positions(rows):
+    """Upsert the newest fix per team from ``rows``, keeping newer existing fixes."""
+    latest = latest_per_team(rows)
+    if not latest:
+        return 0
+
+    qn = connection.ops.quote_name
+    table = qn(TeamPosition._meta.db_table)
+    team_id, lat, lng, time, updated_at = (
+        qn(column) for column in ("team_id", "lat", "lng", "time", "updated_at")
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(latest))
+    params = []
+    for row_team_id, row in latest.items():
+        params.extend([
+            row_team_id, row.lat, row.lng,
+            connection.ops.adapt_datetimefield_value(row.time), now,
+        ])
+
+    # Both SQLite (>= 3.24) and PostgreSQL support this upsert form
+    sql = (
+        f"INSERT INTO {table} ({team_id}, {lat}, {lng}, {time}, {updated_at}) VALUES {values} "
+        f"ON CONFLICT ({team_id}) DO UPDATE SET "
+        f"{lat} = EXCLUDED.{lat}, {lng} = EXCLUDED.{lng}, {time} = EXCLUDED.{time}, "
+        f"{updated_at} = EXCLUDED.{updated_at} "
+        f"WHERE {table}.{time} < EXCLUDED.{time}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    return len(latest)
+
+
+def rebuild_positions(team_ids=None):
+    """Recompute TeamPosition from LocationLog; returns the number of rows written."""
+    teams = Team.objects.order_by()
+    if team_ids is not None:
+        teams = teams.filter(id__in=team_ids)
+
+    newest = LocationLog.objects.filter(team=OuterRef("pk")).order_by("-time", "-id")
+    latest_ids = teams.annotate(latest_id=Subquery(newest.values("id")[:1])).values("latest_id")
+    rows = [
+        TeamPosition(team_id=log.team_id, lat=log.lat, lng=log.lng, time=log.time)
+        for log in LocationLog.objects.filter(id__in=latest_ids)
+    ]
+
+    with transaction.atomic():
+        TeamPosition.objects.filter(team__in=teams).delete()
+        TeamPosition.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,121 @@
+"""
+Versioned per-team cache of the route payload sent to the app.
+
+Every team has a version token in the cache; the payload is stored under
+``route_payload:<team>:<token>``. Invalidating a team only drops its token,
+so stale payloads are never served and simply expire. Reconnecting phones that
+ask for ``newLocation`` are answered from the cache without touching the DB.
+
+The cache (alias ``ROUTE_PAYLOAD_CACHE``) is in-memory per process. A change
+drops the tokens here straight away and, once committed, in every other
+process through the channel layer (``consumers.push_invalidation``), e.g.
+after a distribution by the ``run_jobs`` worker.
+
+The tokens differ per process; what the app compares on resume is
+``route_version``, a hash of the payload itself.
+"""
+import hashlib
+import json
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+_MISSING = object()
+
+
+def _cache():
+    return caches[getattr(settings, "ROUTE_PAYLOAD_CACHE", "default")]
+
+
+def _version_key(team_id):
+    return f"route_payload_version:{team_id}"
+
+
+def _payload_key(team_id, version):
+    return f"route_payload:{team_id}:{version}"
+
+
+def _version(cache, team_id):
+    version = cache.get(_version_key(team_id))
+    if version is None:
+        cache.add(_version_key(team_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(team_id))
+    return version
+
+
+def get_route_payload(team_id, build):
+    """Return ``build()`` (``Team.get_next_open_routepart_formatted``), cached per version."""
+    cache = _cache()
+    key = _payload_key(team_id, _version(cache, team_id))
+
+    payload = cache.get(key, _MISSING)
+    if payload is _MISSING:
+        payload = build()
+        cache.set(key, payload, getattr(settings, "ROUTE_PAYLOAD_TTL", 6 * 3600))
+    return payload
+
+
+def route_version(payload):
+    """Short hash of a route payload; the same in every process."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+
+def get_versions(team_ids):
+    """Current version token per team in this process; changes whenever the team is invalidated."""
+    cache = _cache()
+    team_ids = list(team_ids)
+    found = cache.get_many([_version_key(team_id) for team_id in team_ids])
+    return {
+        team_id: found.get(_version_key(team_id)) or _version(cache, team_id)
+        for team_id in team_ids
+    }
+
+
+def forget_teams(team_ids):
+    """Drop the cached payload of the given teams in this process."""
+    _cache().delete_many([_version_key(team_id) for team_id in team_ids])
+
+
+def invalidate_teams(team_ids):
+    """Drop the cached payload of the given teams here now, and everywhere once committed."""
+    team_ids = sorted({team_id for team_id in team_ids if team_id is not None})
+    if team_ids:
+        forget_teams(team_ids)
+        transaction.on_commit(partial(_invalidate_everywhere, team_ids))
+
+
+def _invalidate_everywhere(team_ids):
+    from server.apps.asgi_socket.consumers import push_invalidation
+
+    # Rebuilt before the commit (by another thread) it may hold the old route
+    forget_teams(team_ids)
+    push_invalidation("route_payloads", team_ids)
+
+
+def invalidate_team(team_id):
+    invalidate_teams([team_id])
+
+
+def invalidate_teamrouteparts(teamroutepart_ids):
+    from .models import TeamRoutePart
+
+    invalidate_teams(
+        TeamRoutePart.objects.filter(id__in=teamroutepart_ids)
+        .values_list("team_id", flat=True)
+        .distinct()
+    )
+
+
+def invalidate_destinations(destination_ids):
+    """For queryset ``.update()`` calls, which send no signals."""
+    from .models import TeamRoutePart
+
+    invalidate_teams(
+        TeamRoutePart.objects.filter(destinations__id__in=destination_ids)
+        .values_list("team_id", flat=True)
+        .distinct()
+    )
@@ -0,0 +1,126 @@
+"""
+Progress per team and route (RouteTeamStats), maintained next to the
+completions.
+
+A completion updates its row in place with one UPDATE (``record_completion``).
+``refresh_stats`` recomputes the rows of the given teams from their
+TeamRouteParts and is used by undo, distribution and clearing. The stats
+pages read the table directly.
+``rebuild_stats`` recomputes everything (see the ``rebuild_route_stats``
+command), e.g. after edits in the admin or for a backfill.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import RouteTeamStats, Team, TeamRoutePart
+
+STATS_FIELDS = [
+    "parts_total",
+    "parts_completed",
+    "destinations_completed",
+    "first_completed",
+    "last_completed",
+    "current_part",
+]
+
+REBUILD_CHUNK = 500
+
+
+def record_completion(team_id, route_id, complete_time, part_completed):
+    """Count one completed destination (and its part) in the stats row, in one UPDATE."""
+    changes = {"destinations_completed": F("destinations_completed") + 1}
+    if part_completed:
+        at = Value(complete_time)
+        changes.update(
+            parts_completed=F("parts_completed") + 1,
+            first_completed=Least(Coalesce("first_completed", at), at),
+            last_completed=Greatest(Coalesce("last_completed", at), at),
+            current_part=Subquery(
+                TeamRoutePart.objects
+                .filter(team_id=team_id, route_id=route_id, completed_time__isnull=True)
+                .order_by("order", "id")
+                .values("id")[:1]
+            ),
+        )
+    updated = RouteTeamStats.objects.filter(team_id=team_id, route_id=route_id).update(**changes)
+    if not updated:
+        # No row yet (not distributed through the engine, or not backfilled)
+        refresh_stats([team_id])
+
+
+def refresh_stats(team_ids):
+    """Recompute the stats rows of ``team_ids``; returns the number of rows written."""
+    team_ids = {team_id for team_id in team_ids if team_id is not None}
+    if not team_ids:
+        return 0
+
+    parts = TeamRoutePart.objects.filter(team_id__in=team_ids, route__isnull=False)
+    aggregates = (
+        parts.order_by()
+        .values("team_id", "route_id")
+        .annotate(
+            parts_total=Count("id", distinct=True),
+            parts_completed=Count("id", distinct=True, filter=Q(completed_time__isnull=False)),
+            destinations_completed=Count(
+                "destinations", filter=Q(destinations__completed_time__isnull=False)
+            ),
+            first_completed=Min("completed_time"),
+            last_completed=Max("completed_time"),
+        )
+    )
+    current = {}
+    for team_id, route_id, part_id in (
+        parts.filter(completed_time__isnull=True)
+        .order_by("team_id", "route_id", "-order", "-id")
+        .values_list("team_id", "route_id", "id")
+    ):
+        # Descending order: the last one seen is the first open part
+        current[(team_id, route_id)] = part_id
+
+    rows = [
+        RouteTeamStats(
+            team_id=row["team_id"],
+            route_id=row["route_id"],
+            parts_total=row["parts_total"],
+            parts_completed=row["parts_completed"],
+            destinations_completed=row["destinations_completed"],
+            first_completed=row["first_completed"],
+            last_completed=row["last_completed"],
+            current_part_id=current.get((row["team_id"], row["route_id"])),
+        )
+        for row in aggregates
+    ]
+
+    keep = {(row.team_id, row.route_id) for row in rows}
+    with transaction.atomic(savepoint=False):
+        # Routes the team no longer has parts on
+        stale = [
+            stats_id
+            for stats_id, team_id, route_id in RouteTeamStats.objects
+            .filter(team_id__in=team_ids).values_list("id", "team_id", "route_id")
+            if (team_id, route_id) not in keep
+        ]
+        if stale:
+            RouteTeamStats.objects.filter(id__in=stale).delete()
+        if rows:
+            RouteTeamStats.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["route", "team"],
+                update_fields=STATS_FIELDS + ["updated_at"],
+            )
+    return len(rows)
+
+
+def rebuild_stats(team_ids=None):
+    """Recompute the stats of all (or the given) teams; returns the number of rows."""
+    teams = Team.objects.order_by("id")
+    if team_ids is not None:
+        teams = teams.filter(id__in=team_ids)
+    all_ids = list(teams.values_list("id", flat=True))
+
+    written = 0
+    for start in range(0, len(all_ids), REBUILD_CHUNK):
+        written += refresh_stats(all_ids[start:start + REBUILD_CHUNK])
+    return written
@@ -0,0 +1,64 @@
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import message_threads, route_cache
+from .models import Bundle, Destination, Edition, File, Message, Team, TeamRoutePart
+from .geofence import geofence_engine
+from .team_codes import team_codes
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    team_codes.invalidate()
+    if kwargs.get("signal") is post_delete or not instance.is_activated:
+        geofence_engine.forget(instance.id)
+
+
+@receiver(post_save, sender=Edition)
+def edition_changed(sender, instance, **kwargs):
+    # The table carries messaging_enabled for the app socket
+    team_codes.invalidate()
+
+
+@receiver(post_save, sender=TeamRoutePart)
+@receiver(post_delete, sender=TeamRoutePart)
+def teamroutepart_changed(sender, instance, **kwargs):
+    route_cache.invalidate_team(instance.team_id)
+
+
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Destination)
+def destination_changed(sender, instance, **kwargs):
+    if instance.teamroutepart_id is None:
+        return
+    if Destination.teamroutepart.is_cached(instance):
+        route_cache.invalidate_team(instance.teamroutepart.team_id)
+    else:
+        route_cache.invalidate_teamrouteparts([instance.teamroutepart_id])
+
+
+@receiver(post_save, sender=Bundle)
+def bundle_changed(sender, instance, **kwargs):
+    # Browse modes are part of the bundle payload
+    route_cache.invalidate_teams(
+        instance.teamrouteparts.values_list("team_id", flat=True).distinct()
+    )
+
+
+@receiver(post_save, sender=File)
+def file_changed(sender, instance, created, **kwargs):
+    # Payloads contain the file URL; a new file is not referenced yet
+    if not created:
+        route_cache.invalidate_teams(
+            TeamRoutePart.objects.filter(
+                Q(routedata_image=instance) | Q(routedata_audio=instance)
+            ).values_list("team_id", flat=True).distinct()
+        )
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if created:
+        message_threads.record_message(instance)
@@ -0,0 +1,93 @@
+"""
+Process-local lookup table: team code → what the app socket needs of the team.
+
+The app authenticates with the team code on every (re)connect. After a network
+outage all phones of an edition reconnect at once; with this table a known
+code is resolved to its team, and the socket builds its ``TeamState`` from
+the entry, without a query. The table is loaded in one query on first use (or
+``warm()`` at startup). It is a cache, not the source of truth: a code that is
+not in it is looked up through the unique index on ``Team.code`` and added
+when it exists, so codes created by another process are never rejected.
+
+Saving or deleting a Team (activation, code or edition changes) or an Edition
+(messaging) drops the table in this process, and once the change is committed
+in every process through the channel layer (``consumers.push_invalidation``),
+so no process keeps serving changed or deleted codes.
+"""
+import threading
+from typing import NamedTuple
+
+from django.db import transaction
+
+FIELDS = ("id", "edition_id", "is_activated", "edition__messaging_enabled", "location_update_interval")
+
+
+class TeamCode(NamedTuple):
+    team_id: int
+    edition_id: int
+    activated: bool
+    messaging_enabled: bool
+    location_interval: int
+
+
+class TeamCodeTable:
+    def __init__(self):
+        self._codes: dict[str, TeamCode] | None = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """(Re)load every team code; returns the number of codes."""
+        from .models import Team
+
+        codes = {
+            code: TeamCode(*row)
+            for code, *row in Team.objects.exclude(code="").values_list("code", *FIELDS)
+        }
+        with self._lock:
+            self._codes = codes
+        return len(codes)
+
+    def lookup(self, code):
+        """The ``TeamCode`` for ``code``, or None when no team has that code."""
+        code = (code or "").strip()
+        if not code:
+            return None
+        if self._codes is None:
+            self.warm()
+        entry = self._codes.get(code)
+        if entry is None:
+            entry = self._load(code)
+        return entry
+
+    def _load(self, code):
+        """Look a missing code up in the database and remember it when found."""
+        from .models import Team
+
+        row = Team.objects.filter(code=code).values_list(*FIELDS).first()
+        if row is None:
+            return None
+        entry = TeamCode(*row)
+        with self._lock:
+            if self._codes is not None:
+                self._codes[code] = entry
+        return entry
+
+    def reset(self):
+        """Drop the table in this process; it is reloaded on the next lookup."""
+        with self._lock:
+            self._codes = None
+
+    def invalidate(self):
+        """Drop the table here now, and in every process once the change is committed."""
+        self.reset()
+        transaction.on_commit(self._invalidate_everywhere)
+
+    def _invalidate_everywhere(self):
+        from server.apps.asgi_socket.consumers import push_invalidation
+
+        # Reloaded before the commit (by another thread) it may hold old rows
+        self.reset()
+        push_invalidation("team_codes")
+
+
+team_codes = TeamCodeTable()
@@ -0,0 +1,124 @@
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from server.apps.dashboard.completion import complete_destination, part_is_complete
+from server.apps.dashboard.constants import (
+    DESTINATION_TYPE_CHOICE,
+    DESTINATION_TYPE_MANDATORY,
+)
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    Organization,
+    Route,
+    RoutePart,
+    RouteTeamStats,
+    Team,
+    TeamRoutePart,
+)
+from server.apps.dashboard.route_stats import rebuild_stats
+
+
+@override_settings(
+    SERVER_URI="http://testserver",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class CompletionTestCase(TestCase):
+    """Completion rules and the number of queries per completion."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.route = Route.objects.create(name="Route A", edition=edition)
+        self.team = Team.objects.create(
+            name="Team 1",
+            code="ABC12",
+            contact_name="Tester",
+            contact_email="tester@test.nl",
+            edition=edition,
+        )
+
+    def _create_part(self, order, *destination_types):
+        rp = RoutePart.objects.create(name=f"Part {order}", route=self.route, order=order)
+        trp = TeamRoutePart.objects.create(
+            name=rp.name, route=self.route, routepart=rp, team=self.team, order=order
+        )
+        dests = [
+            Destination.objects.create(
+                lat=52.0, lng=6.0, destination_type=destination_type, teamroutepart=trp
+            )
+            for destination_type in destination_types
+        ]
+        return trp, dests
+
+    def test_part_completes_when_all_mandatory_done(self):
+        trp, (d1, d2) = self._create_part(1, DESTINATION_TYPE_MANDATORY, DESTINATION_TYPE_MANDATORY)
+
+        self.assertFalse(complete_destination(self.team, d1.id).part_completed)
+        self.assertTrue(complete_destination(self.team, d2.id).part_completed)
+
+        trp.refresh_from_db()
+        self.assertIsNotNone(trp.completed_time)
+
+    def test_one_choice_is_enough(self):
+        trp, (c1, _c2) = self._create_part(1, DESTINATION_TYPE_CHOICE, DESTINATION_TYPE_CHOICE)
+        self.assertTrue(complete_destination(self.team, c1.id).part_completed)
+
+    def test_rules_in_memory(self):
+        mandatory = Destination(destination_type=DESTINATION_TYPE_MANDATORY)
+        choice = Destination(destination_type=DESTINATION_TYPE_CHOICE)
+        self.assertFalse(part_is_complete([mandatory]))
+        self.assertFalse(part_is_complete([choice]))
+        choice.completed_time = timezone.now()
+        self.assertTrue(part_is_complete([choice]))
+
+    def test_destination_of_other_team_is_rejected(self):
+        other = Team.objects.create(
+            name="Team 2", code="XYZ99", contact_name="X", contact_email="x@x.nl",
+            edition=self.team.edition,
+        )
+        _, (dest,) = self._create_part(1, DESTINATION_TYPE_MANDATORY)
+        with self.assertRaises(TeamRoutePart.DoesNotExist):
+            complete_destination(other, dest.id)
+
+    def test_queries_per_completion(self):
+        """Benchmark: 1 SELECT + destination, part and stats UPDATE (+ savepoint pair)."""
+        _, (dest,) = self._create_part(1, DESTINATION_TYPE_MANDATORY)
+        rebuild_stats([self.team.id])
+        with self.assertNumQueries(6):
+            result = complete_destination(self.team, dest.id)
+        self.assertTrue(result.part_completed)
+
+    def test_duplicate_confirmation_is_ignored(self):
+        trp, (d1, d2) = self._create_part(1, DESTINATION_TYPE_MANDATORY, DESTINATION_TYPE_MANDATORY)
+        rebuild_stats([self.team.id])
+        first = timezone.now()
+        complete_destination(self.team, d1.id, first)
+        self.assertTrue(complete_destination(self.team, d2.id, first).part_completed)
+
+        with self.assertNumQueries(1):
+            result = complete_destination(self.team, d2.id, first + timezone.timedelta(minutes=5))
+        self.assertFalse(result.part_completed)
+
+        d2.refresh_from_db()
+        self.assertEqual(d2.completed_time, first)
+        stats = RouteTeamStats.objects.get(team=self.team, route=self.route)
+        self.assertEqual((stats.destinations_completed, stats.parts_completed), (2, 1))
+
+    def test_handle_destination_completion_returns_next_payload(self):
+        _, (d1,) = self._create_part(1, DESTINATION_TYPE_MANDATORY)
+        _, (d2,) = self._create_part(2, DESTINATION_TYPE_MANDATORY)
+
+        payload = self.team.handle_destination_completion(d1.id)
+
+        self.assertEqual(payload["data"]["coordinates"][0]["id"], d2.id)
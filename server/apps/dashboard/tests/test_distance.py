@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from server.apps.dashboard.constants import DESTINATION_TYPE_CHOICE, DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.distance import (
+    google_walking_distance,
+    haversine_distance,
+    route_distance_km,
+    walking_distance_km,
+)
+from server.apps.dashboard.models import Destination, Edition, Event, Organization, Route, RoutePart
+
+# Roughly 1 km in degrees of latitude
+KM = 1 / 111.32
+
+
+class WalkingDistanceTestCase(TestCase):
+    """Pluggable distance providers with a cache keyed on the coordinates."""
+
+    def setUp(self):
+        cache.clear()
+        self.points = [(52.0 + i * KM, 6.0) for i in range(4)]
+
+    def test_haversine_sums_consecutive_legs(self):
+        self.assertAlmostEqual(haversine_distance(self.points), 3000, delta=5)
+        self.assertEqual(walking_distance_km(self.points), 3.0)
+        self.assertEqual(walking_distance_km(self.points[:1]), 0.0)
+
+    def test_result_is_cached_by_coordinates(self):
+        provider = mock.Mock(return_value=1234)
+        with mock.patch.dict("server.apps.dashboard.distance.DISTANCE_PROVIDERS", {"test": provider}):
+            self.assertEqual(walking_distance_km(self.points, provider="test"), 1.23)
+            self.assertEqual(walking_distance_km(self.points, provider="test"), 1.23)
+            self.assertEqual(provider.call_count, 1)
+
+            # Moved destination: different key, computed again
+            walking_distance_km(self.points[:-1] + [(53.0, 6.0)], provider="test")
+            self.assertEqual(provider.call_count, 2)
+
+    def test_failing_provider_falls_back_to_haversine(self):
+        provider = mock.Mock(side_effect=RuntimeError("offline"))
+        with mock.patch.dict("server.apps.dashboard.distance.DISTANCE_PROVIDERS", {"test": provider}):
+            with self.assertLogs("server.apps.dashboard.distance", "WARNING"):
+                self.assertEqual(walking_distance_km(self.points, provider="test"), 3.0)
+
+    def test_google_counts_every_leg_and_the_joins_between_chunks(self):
+        points = [(52.0 + i * KM, 6.0) for i in range(12)]
+
+        def directions(origin, destination, mode, waypoints):
+            legs = [{"distance": {"value": 1000}} for _ in range(len(waypoints) + 1)]
+            return [{"legs": legs}]
+
+        with mock.patch("googlemaps.Client") as client:
+            client.return_value.directions.side_effect = directions
+            self.assertEqual(google_walking_distance(points), 11000)
+        self.assertEqual(client.return_value.directions.call_count, 2)
+
+
+class RouteDistanceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.route = Route.objects.create(name="Route A", edition=edition)
+        # Created out of order: the distance follows the route part order
+        for order, lat in ((3, 52.0 + 2 * KM), (1, 52.0), (2, 52.0 + KM)):
+            rp = RoutePart.objects.create(name=f"Part {order}", route=self.route, order=order)
+            Destination.objects.create(lat=lat, lng=6.0, destination_type=DESTINATION_TYPE_MANDATORY, routepart=rp)
+            Destination.objects.create(lat=53.0, lng=7.0, destination_type=DESTINATION_TYPE_CHOICE, routepart=rp)
+
+    @override_settings(DISTANCE_PROVIDER="haversine")
+    def test_mandatory_destinations_in_route_order(self):
+        self.assertEqual(route_distance_km(self.route), 2.0)
+
+        Destination.objects.filter(routepart__order=3, destination_type=DESTINATION_TYPE_MANDATORY) \
+            .update(lat=52.0 + 3 * KM)
+        self.assertEqual(route_distance_km(self.route), 3.0)
+
+    @override_settings(DISTANCE_PROVIDER="haversine")
+    def test_stats_page_needs_no_network(self):
+        User.objects.create_superuser("admin", "admin@test.nl", "pass123")
+        self.client.login(username="admin", password="pass123")
+        with mock.patch("googlemaps.Client") as client:
+            response = self.client.get(reverse("backoffice:route_stats", args=[self.route.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["distance"], 2.0)
+        client.assert_not_called()
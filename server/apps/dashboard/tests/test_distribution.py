@@ -0,0 +1,122 @@
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from server.apps.dashboard.constants import DESTINATION_TYPE_CHOICE, DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.distribution import distribute_route, distribute_routes_for_team
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    Organization,
+    Route,
+    RoutePart,
+    RouteTeamStats,
+    Team,
+    TeamRoutePart,
+)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class DistributionTestCase(TestCase):
+    """Set-based distribution of route parts and destinations to teams."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.route = Route.objects.create(name="Route A", edition=self.edition)
+        self.parts = []
+        for order in (1, 2):
+            part = RoutePart.objects.create(name=f"Part {order}", route=self.route, order=order)
+            Destination.objects.create(
+                lat=52.0 + order * 0.01, lng=6.0, destination_type=DESTINATION_TYPE_MANDATORY, routepart=part
+            )
+            Destination.objects.create(
+                lat=52.5 + order * 0.01, lng=6.0, destination_type=DESTINATION_TYPE_CHOICE, routepart=part
+            )
+            self.parts.append(part)
+
+    def _add_teams(self, count):
+        start = Team.objects.count()
+        return [
+            Team.objects.create(
+                name=f"Team {i}", code=f"T{i:04d}", contact_name="T",
+                contact_email="t@test.nl", edition=self.edition,
+            )
+            for i in range(start, start + count)
+        ]
+
+    def test_distributes_parts_and_destinations(self):
+        teams = self._add_teams(3)
+        result = distribute_route(self.route)
+
+        self.assertEqual((result.parts_created, result.destinations_created), (6, 12))
+        trp = TeamRoutePart.objects.get(team=teams[0], routepart=self.parts[1])
+        self.assertEqual((trp.name, trp.order, trp.route_id), ("Part 2", 2, self.route.id))
+        self.assertEqual(
+            sorted(trp.destinations.values_list("destination_type", flat=True)),
+            sorted([DESTINATION_TYPE_CHOICE, DESTINATION_TYPE_MANDATORY]),
+        )
+
+    def test_second_run_only_syncs_changes(self):
+        self._add_teams(2)
+        distribute_route(self.route)
+
+        result = distribute_route(self.route)
+        self.assertEqual(
+            (result.parts_created, result.parts_updated, result.destinations_created, result.destinations_updated),
+            (0, 0, 0, 0),
+        )
+
+        RoutePart.objects.filter(pk=self.parts[0].pk).update(name="Renamed")
+        Destination.objects.filter(routepart=self.parts[0], destination_type=DESTINATION_TYPE_CHOICE).update(
+            hide_for_user=True
+        )
+        result = distribute_route(self.route)
+        self.assertEqual((result.parts_updated, result.destinations_updated), (2, 2))
+        self.assertEqual(
+            set(TeamRoutePart.objects.filter(routepart=self.parts[0]).values_list("name", flat=True)),
+            {"Renamed"},
+        )
+        self.assertEqual(Destination.objects.filter(teamroutepart__isnull=False).count(), 8)
+
+    def test_query_count_does_not_grow_with_teams(self):
+        self._add_teams(2)
+        with self.assertNumQueries(13), self.captureOnCommitCallbacks(execute=True):
+            distribute_route(self.route)
+
+        TeamRoutePart.objects.all().delete()
+        self._add_teams(20)
+        with self.assertNumQueries(13), self.captureOnCommitCallbacks(execute=True):
+            distribute_route(self.route)
+        self.assertEqual(TeamRoutePart.objects.count(), 44)
+
+    def test_distribute_for_single_team(self):
+        self._add_teams(1)
+        distribute_route(self.route)
+        team = self._add_teams(1)[0]
+
+        result = distribute_routes_for_team(team)
+        self.assertEqual((result.parts_created, result.destinations_created), (2, 4))
+        self.assertEqual(TeamRoutePart.objects.count(), 4)
+
+    def test_cache_and_stats_wait_for_the_commit(self):
+        self._add_teams(1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            distribute_route(self.route)
+        self.assertEqual(len(callbacks), 2)
+        self.assertFalse(RouteTeamStats.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(RouteTeamStats.objects.get().parts_total, 2)
@@ -0,0 +1,181 @@
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from server.apps.asgi_socket.ingestion import LocationBuffer
+from server.apps.dashboard.constants import DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.geofence import (
+    Fence,
+    GeofenceEngine,
+    GeofenceIndex,
+    cell_size_deg,
+    distance_m,
+    geofence_engine,
+    geohash,
+    precision_for,
+)
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    GeofenceEvent,
+    Organization,
+    Route,
+    RoutePart,
+    Team,
+    TeamRoutePart,
+)
+
+# Roughly 1 m in degrees of latitude
+M = 1 / 111320
+
+
+class GeofenceIndexTestCase(TestCase):
+    def test_geohash(self):
+        # Reference value from the geohash specification
+        self.assertEqual(geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_cells_are_wide_enough_for_the_reach(self):
+        for reach in (10, 75, 300, 2000):
+            precision = precision_for(reach, 52.0)
+            dlat, dlng = cell_size_deg(precision)
+            self.assertGreaterEqual(dlat * 111320, reach)
+            self.assertGreaterEqual(dlng * 111320 * 0.6, reach)
+
+    def test_nearby_finds_fences_across_cell_borders(self):
+        fences = [
+            Fence(i, 1, 1, 1, 52.0 + i * 0.01, 6.0 + i * 0.01, 25)
+            for i in range(100)
+        ]
+        index = GeofenceIndex(fences, margin=50)
+        target = fences[42]
+
+        for dlat, dlng in ((0, 0), (60 * M, 0), (0, -60 * M), (-50 * M, 40 * M)):
+            hits = index.nearby(target.lat + dlat, target.lng + dlng)
+            self.assertEqual([f.destination_id for f, _ in hits], [42])
+        self.assertEqual(index.nearby(target.lat + 100 * M, target.lng), [])
+
+    def test_distance(self):
+        self.assertAlmostEqual(distance_m(52.0, 6.0, 52.0 + 100 * M, 6.0), 100, delta=0.5)
+
+
+@override_settings(
+    SERVER_URI="http://testserver",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class GeofenceEngineTestCase(TestCase):
+    """Arrivals, near misses and unreported arrivals against the open destinations."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        route = Route.objects.create(name="Route A", edition=self.edition)
+        self.team = Team.objects.create(
+            name="Team 1",
+            code="ABC12",
+            contact_name="Tester",
+            contact_email="tester@test.nl",
+            edition=self.edition,
+        )
+        self.destinations = []
+        for order in (1, 2):
+            rp = RoutePart.objects.create(name=f"Part {order}", route=route, order=order)
+            trp = TeamRoutePart.objects.create(
+                name=rp.name, route=route, routepart=rp, team=self.team, order=order
+            )
+            self.destinations.append(Destination.objects.create(
+                lat=52.0 + order * 0.01, lng=6.0, radius=25,
+                destination_type=DESTINATION_TYPE_MANDATORY,
+                teamroutepart=trp,
+            ))
+        self.engine = GeofenceEngine(near_miss_margin=50, unreported_after=120)
+        self.start = timezone.make_aware(datetime.combine(self.edition.date_start.date(), time(9)))
+
+    def ping(self, dest, north_m, seconds=0):
+        return SimpleNamespace(
+            team_id=self.team.id, lat=dest.lat + north_m * M, lng=dest.lng,
+            time=self.start + timedelta(seconds=seconds),
+        )
+
+    def kinds(self, hits):
+        return [(hit.fence.destination_id, hit.kind) for hit in hits]
+
+    def test_arrival_is_reported_once(self):
+        dest = self.destinations[0]
+        hits = self.engine.evaluate([self.ping(dest, 500), self.ping(dest, 10, 60)])
+        self.assertEqual(self.kinds(hits), [(dest.id, GeofenceEvent.KIND_ARRIVAL)])
+        self.assertEqual(self.engine.evaluate([self.ping(dest, 5, 70)]), [])
+
+    def test_near_miss_when_leaving_the_band_without_arriving(self):
+        dest = self.destinations[0]
+        hits = self.engine.evaluate([self.ping(dest, 60, 0), self.ping(dest, 40, 10)])
+        self.assertEqual(hits, [])
+
+        hits = self.engine.evaluate([self.ping(dest, 200, 20)])
+        self.assertEqual(self.kinds(hits), [(dest.id, GeofenceEvent.KIND_NEAR_MISS)])
+        self.assertAlmostEqual(hits[0].distance, 40, delta=0.5)
+
+    def test_no_near_miss_when_the_team_arrives(self):
+        dest = self.destinations[0]
+        hits = self.engine.evaluate([
+            self.ping(dest, 60, 0), self.ping(dest, 10, 10), self.ping(dest, 200, 20),
+        ])
+        self.assertEqual(self.kinds(hits), [(dest.id, GeofenceEvent.KIND_ARRIVAL)])
+
+    def test_unreported_arrival_after_grace_period(self):
+        dest = self.destinations[0]
+        self.engine.evaluate([self.ping(dest, 0, 0)])
+        self.assertEqual(self.engine.evaluate([self.ping(dest, 500, 100)]), [])
+
+        hits = self.engine.evaluate([self.ping(dest, 500, 130)])
+        self.assertEqual(self.kinds(hits), [(dest.id, GeofenceEvent.KIND_UNREPORTED)])
+
+    def test_unchanged_route_does_not_query(self):
+        dest = self.destinations[0]
+        self.engine.evaluate([self.ping(dest, 500)])
+        with self.assertNumQueries(0):
+            self.engine.evaluate([self.ping(dest, 0, 10)])
+
+    def test_completion_rebuilds_the_index(self):
+        first, second = self.destinations
+        self.engine.evaluate([self.ping(first, 0, 0)])
+        self.team.handle_destination_completion(first.id)
+
+        # Completed: no longer unreported; the next destination is still watched
+        hits = self.engine.evaluate([self.ping(first, 0, 300), self.ping(second, 0, 310)])
+        self.assertEqual(self.kinds(hits), [(second.id, GeofenceEvent.KIND_ARRIVAL)])
+
+    def test_idle_teams_are_pruned(self):
+        dest = self.destinations[0]
+        self.engine.evaluate([self.ping(dest, 500)])
+        self.engine._teams[self.team.id].last_ping -= 3600
+        self.assertEqual(self.engine.prune(), 1)
+        self.assertEqual(self.engine._teams, {})
+
+    def test_deactivated_team_is_forgotten(self):
+        with mock.patch("server.apps.dashboard.signals.geofence_engine") as engine:
+            self.team.is_activated = False
+            self.team.save()
+        engine.forget.assert_called_once_with(self.team.id)
+
+    def test_location_buffer_records_and_pushes_hits(self):
+        dest = self.destinations[0]
+        geofence_engine.forget(self.team.id)
+        LocationBuffer().add(self.team.id, dest.lat, dest.lng, self.start)
+        LocationBuffer().add(self.team.id, dest.lat, dest.lng, self.start + timedelta(seconds=5))
+
+        event = GeofenceEvent.objects.get()
+        self.assertEqual((event.team_id, event.destination_id, event.kind),
+                         (self.team.id, dest.id, GeofenceEvent.KIND_ARRIVAL))
@@ -0,0 +1,137 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from server.apps.dashboard import jobs
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    Job,
+    Organization,
+    OutboundEmail,
+    Route,
+    RoutePart,
+    Team,
+    TeamRoutePart,
+)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+    JOB_RETRY_DELAY_SECONDS=30,
+)
+class JobQueueTestCase(TestCase):
+    """DB-backed job queue: claiming, progress, retries and the built-in handlers."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.route = Route.objects.create(name="Route A", edition=self.edition)
+        part = RoutePart.objects.create(name="Part 1", route=self.route, order=1)
+        Destination.objects.create(lat=52.0, lng=6.0, routepart=part)
+        self.team = Team.objects.create(
+            name="Team 1", code="ABC12", contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition,
+        )
+        push = mock.patch("server.apps.dashboard.jobs.push_to_backoffice")
+        self.push = push.start()
+        self.addCleanup(push.stop)
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("nope")
+
+    def test_distribute_job_runs_and_reports_progress(self):
+        job = jobs.enqueue("distribute_route", edition=self.edition, route_id=self.route.id)
+        self.assertEqual(jobs.run_pending("test"), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total, job.attempts), (Job.STATUS_DONE, 1, 1, 1))
+        self.assertEqual(TeamRoutePart.objects.filter(team=self.team).count(), 1)
+
+        statuses = [call.args[1]["data"]["status"] for call in self.push.call_args_list]
+        self.assertEqual(statuses[0], Job.STATUS_QUEUED)
+        self.assertEqual(statuses[-1], Job.STATUS_DONE)
+        self.assertEqual({call.args[0] for call in self.push.call_args_list}, {self.edition.id})
+
+    def test_clear_job_removes_team_route_parts(self):
+        jobs.enqueue("distribute_route", edition=self.edition, route_id=self.route.id)
+        jobs.enqueue("clear_teamrouteparts", edition=self.edition, route_id=self.route.id)
+        jobs.run_pending("test")
+        self.assertFalse(TeamRoutePart.objects.exists())
+
+    def test_activate_job_distributes_and_queues_mail(self):
+        jobs.enqueue("activate_team", edition=self.edition, team_id=self.team.id)
+        jobs.run_pending("test")
+        self.assertEqual(TeamRoutePart.objects.filter(team=self.team).count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIn("ABC12", OutboundEmail.objects.get(team=self.team).body)
+
+    def test_resend_codes_job_queues_one_mail_per_activated_team(self):
+        self.team.is_activated = True
+        self.team.save()
+        Team.objects.create(
+            name="Team 2", code="", contact_name="T2", contact_email="t2@test.nl", edition=self.edition,
+        )
+        job = jobs.enqueue("resend_team_codes", edition=self.edition, edition_id=self.edition.id)
+        jobs.run_pending("test")
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), (Job.STATUS_DONE, 1, 1))
+        self.assertEqual(list(OutboundEmail.objects.values_list("to", flat=True)), ["tester@test.nl"])
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        job = jobs.enqueue("distribute_route", edition=self.edition, route_id=0, max_attempts=2)
+
+        with self.assertLogs("server.apps.dashboard.jobs", "ERROR"):
+            jobs.run_pending("test")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertIn("DoesNotExist", job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+
+        # Not due yet
+        self.assertEqual(jobs.run_pending("test"), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs("server.apps.dashboard.jobs", "ERROR"):
+            jobs.run_pending("test")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        jobs.enqueue("distribute_route", edition=self.edition, route_id=self.route.id)
+        self.assertIsNotNone(jobs.claim_next("a"))
+        self.assertIsNone(jobs.claim_next("b"))
+
+    @override_settings(JOB_STALE_SECONDS=60)
+    def test_stale_running_job_is_queued_again(self):
+        job = jobs.enqueue("distribute_route", edition=self.edition, route_id=self.route.id)
+        jobs.claim_next("crashed")
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim_next("b").pk, job.pk)
+
+    def test_run_jobs_command_once(self):
+        jobs.enqueue("distribute_route", edition=self.edition, route_id=self.route.id)
+        out = StringIO()
+        call_command("run_jobs", "--once", stdout=out)
+        self.assertIn("Ran 1 jobs, sent 0 emails", out.getvalue())
+        # LocationLog partitions are kept ahead as well (a no-op without PostgreSQL)
+        self.assertIn("nothing to do", out.getvalue())
@@ -0,0 +1,81 @@
+import csv
+import gzip
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from server.apps.dashboard.models import (
+    Edition,
+    Event,
+    LocationLog,
+    Organization,
+    Team,
+)
+
+
+class CompactLocationLogsTestCase(TestCase):
+    """Archive + one-fix-per-minute downsampling of finished editions."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        ended = timezone.now() - timedelta(days=60)
+        self.edition = Edition.objects.create(
+            name="Old Edition", date_start=ended - timedelta(days=1), date_end=ended, event=event,
+        )
+        self.current = Edition.objects.create(
+            name="Current Edition", date_start=timezone.now(), date_end=timezone.now(), event=event,
+        )
+        self.team = Team.objects.create(
+            name="Team 1", code="ABC12", contact_name="T", contact_email="t@t.nl", edition=self.edition,
+        )
+        self.other = Team.objects.create(
+            name="Team 2", code="XYZ99", contact_name="T", contact_email="t@t.nl", edition=self.current,
+        )
+        minute = ended.replace(second=0, microsecond=0)
+        for team in (self.team, self.other):
+            for seconds in (0, 10, 20, 65, 70):
+                LocationLog.objects.create(
+                    team=team, lat=52.0, lng=6.0, time=minute + timedelta(seconds=seconds)
+                )
+        self.archive_dir = tempfile.mkdtemp()
+
+    def test_old_edition_is_downsampled_and_archived(self):
+        call_command("compact_location_logs", archive_dir=self.archive_dir, stdout=StringIO())
+
+        self.assertEqual(LocationLog.objects.filter(team=self.team).count(), 2)
+        self.assertEqual(LocationLog.objects.filter(team=self.other).count(), 5)
+        self.edition.refresh_from_db()
+        self.assertIsNotNone(self.edition.locations_compacted_at)
+
+        [archive] = Path(self.archive_dir).glob("*.csv.gz")
+        with gzip.open(archive, "rt", newline="") as f:
+            self.assertEqual(len(list(csv.reader(f))), 1 + 5)
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command("compact_location_logs", archive_dir=self.archive_dir, dry_run=True, stdout=out)
+
+        self.assertIn("kept 2, removed 3", out.getvalue())
+        self.assertEqual(LocationLog.objects.count(), 10)
+        self.assertEqual(list(Path(self.archive_dir).iterdir()), [])
+
+    def test_partitions_command_is_a_noop_without_postgres(self):
+        out = StringIO()
+        call_command("create_location_partitions", stdout=out)
+        self.assertIn("nothing to do", out.getvalue())
+
+    def test_dropping_days_needs_postgres(self):
+        out = StringIO()
+        call_command(
+            "compact_location_logs", archive_dir=self.archive_dir, drop_older_than_days=1, stdout=out
+        )
+        self.assertIn("no days dropped", out.getvalue())
+        self.assertEqual(LocationLog.objects.count(), 7)
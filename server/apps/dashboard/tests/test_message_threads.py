@@ -0,0 +1,142 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from server.apps.dashboard import message_threads
+from server.apps.dashboard.models import Edition, Event, Message, MessageThread, Organization, Team
+
+
+class MessageThreadTestCase(TestCase):
+    """MessageThread follows new messages, mark-read and clearing."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+            messaging_enabled=True,
+        )
+        self.team = Team.objects.create(
+            name="Team 1", code="ABC12", contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition,
+        )
+        self.other = Team.objects.create(
+            name="Team 2", code="DEF34", contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition,
+        )
+
+    def send(self, team=None, recipient=None, text="Hallo"):
+        return Message.objects.create(
+            edition=self.edition, sender_team=team, recipient_team=recipient, text=text
+        )
+
+    def thread(self, team=None):
+        return MessageThread.objects.get(team=team or self.team)
+
+    def test_messages_update_the_thread(self):
+        self.send(self.team)
+        last = self.send(self.team)
+        thread = self.thread()
+        self.assertEqual((thread.unread_count, thread.last_message_id), (2, last.id))
+
+        # Organisation replies: newer last message, unread count unchanged
+        reply = self.send(recipient=self.team)
+        self.assertEqual((self.thread().unread_count, self.thread().last_message_id), (2, reply.id))
+
+        # Broadcasts are not part of a team thread
+        self.send()
+        self.assertEqual(self.thread().last_message_id, reply.id)
+        self.assertEqual(message_threads.unread_total(self.edition.id), 2)
+
+    def test_missing_thread_is_created_with_the_unread_messages(self):
+        self.send(self.team)
+        MessageThread.objects.all().delete()
+        last = self.send(self.team)
+        self.assertEqual((self.thread().unread_count, self.thread().last_message_id), (2, last.id))
+
+    def test_mark_read(self):
+        self.send(self.team)
+        self.send(self.other)
+        self.assertEqual(message_threads.mark_read(self.edition.id, self.team.id), 1)
+        self.assertEqual(self.thread().unread_count, 0)
+        self.assertEqual(message_threads.unread_total(self.edition.id), 1)
+
+    def test_mark_read_keeps_a_message_arriving_meanwhile(self):
+        self.send(self.team)
+        self.send(self.team)
+        arrived = []
+
+        def receive_after_marking(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # A new message is counted after the UPDATE chose its rows
+            if not arrived and sql.startswith('UPDATE "dashboard_message"'):
+                arrived.append(self.send(self.team))
+            return result
+
+        with connection.execute_wrapper(receive_after_marking):
+            self.assertEqual(message_threads.mark_read(self.edition.id, self.team.id), 2)
+        self.assertEqual(len(arrived), 1)
+        self.assertEqual(self.thread().unread_count, 1)
+
+    def test_unread_changes_are_pushed_once_committed(self):
+        with mock.patch("server.apps.asgi_socket.consumers.push_to_backoffice") as push:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.send(self.team)
+            push.assert_not_called()
+            for callback in callbacks:
+                callback()
+            push.assert_called_once_with(
+                self.edition.id, {"type": "unread", "data": {"team": self.team.id, "change": 1}}
+            )
+
+            push.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                message_threads.mark_read(self.edition.id, self.team.id)
+            push.assert_called_once_with(
+                self.edition.id, {"type": "unread", "data": {"team": self.team.id, "change": -1}}
+            )
+
+    def test_incremental_matches_rebuild(self):
+        self.send(self.team)
+        self.send(recipient=self.team)
+        self.send(self.other)
+        message_threads.mark_read(self.edition.id, self.other.id)
+        self.send(self.other)
+        fields = ("team_id", "edition_id", "unread_count", "last_message_id", "last_activity")
+        incremental = list(MessageThread.objects.order_by("team_id").values(*fields))
+
+        MessageThread.objects.all().delete()
+        call_command("rebuild_message_threads", stdout=StringIO())
+        self.assertEqual(list(MessageThread.objects.order_by("team_id").values(*fields)), incremental)
+
+    def test_clearing_a_thread(self):
+        self.send(self.team)
+        User.objects.create_superuser("admin", "admin@test.nl", "pass123")
+        self.client.login(username="admin", password="pass123")
+
+        self.client.post(reverse("backoffice:messages_clear_team", args=[self.edition.id, self.team.id]))
+        self.assertFalse(MessageThread.objects.filter(team=self.team).exists())
+
+    def test_pages_read_the_threads(self):
+        self.send(self.team)
+        self.send(self.team)
+        User.objects.create_superuser("admin", "admin@test.nl", "pass123")
+        self.client.login(username="admin", password="pass123")
+
+        response = self.client.get(reverse("backoffice:messages", args=[self.edition.id]))
+        unread = {t.id: t.unread_count for t in response.context["teams"]}
+        self.assertEqual(unread, {self.team.id: 2, self.other.id: 0})
+
+        response = self.client.get(reverse("backoffice:team_list", args=[self.edition.id]))
+        self.assertEqual(response.context["sidebar_unread_messages"], 2)
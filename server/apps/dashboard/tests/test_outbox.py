@@ -0,0 +1,112 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from server.apps.dashboard.models import Edition, Event, Organization, OutboundEmail, Team
+from server.apps.dashboard.outbox import claim_batch, drain, drain_all, queue_email
+
+
+class CountingBackend(EmailBackend):
+    """Locmem backend that counts connection opens and can fail for one address."""
+
+    opened = 0
+    fail_for = None
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(self.fail_for in m.to for m in messages):
+            raise ConnectionError("SMTP down")
+        return super().send_messages(messages)
+
+
+@override_settings(
+    OUTBOX_BATCH_SIZE=10,
+    OUTBOX_MAX_ATTEMPTS=2,
+    OUTBOX_RETRY_DELAY_SECONDS=60,
+    OUTBOX_LEASE_SECONDS=300,
+)
+class OutboxTestCase(TestCase):
+    """Email outbox: queued in the caller's transaction, drained in batches."""
+
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.fail_for = None
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(3):
+            queue_email(f"team{i}@test.nl", "Onderwerp", "Tekst")
+
+        connection = CountingBackend()
+        self.assertEqual(drain(connection=connection), (3, 0))
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT).count(), 3)
+
+        # Nothing left to send
+        self.assertEqual(drain(connection=CountingBackend()), (0, 0))
+
+    def test_failure_is_retried_with_backoff_then_marked_failed(self):
+        CountingBackend.fail_for = "bad@test.nl"
+        bad = queue_email("bad@test.nl", "Onderwerp", "Tekst")
+        queue_email("good@test.nl", "Onderwerp", "Tekst")
+
+        with self.assertLogs("server.apps.dashboard.outbox", "WARNING"):
+            self.assertEqual(drain(connection=CountingBackend()), (1, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboundEmail.STATUS_PENDING, 1))
+        self.assertIn("SMTP down", bad.last_error)
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        OutboundEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs("server.apps.dashboard.outbox", "WARNING"):
+            drain(connection=CountingBackend())
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboundEmail.STATUS_FAILED, 2))
+
+    def test_claimed_rows_are_leased(self):
+        queue_email("team@test.nl", "Onderwerp", "Tekst")
+        self.assertEqual(len(claim_batch()), 1)
+        self.assertEqual(claim_batch(), [])
+
+    @override_settings(OUTBOX_BATCH_SIZE=2)
+    def test_drain_all_sends_every_batch(self):
+        for i in range(5):
+            queue_email(f"team{i}@test.nl", "Onderwerp", "Tekst")
+        self.assertEqual(drain_all(), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+
+class RegistrationOutboxTestCase(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+            registration_mode=Edition.REGISTRATION_QUICK,
+        )
+
+    def test_quick_registration_queues_the_code_mail(self):
+        with mock.patch("django.core.mail.EmailMessage.send") as send:
+            self.client.post(
+                reverse("register", args=[self.edition.id]),
+                {"contact_name": "Piet", "contact_email": "piet@test.nl"},
+            )
+        send.assert_not_called()
+
+        team = Team.objects.get(edition=self.edition)
+        email = OutboundEmail.objects.get(team=team)
+        self.assertEqual(email.to, "piet@test.nl")
+        self.assertIn(team.code, email.body)
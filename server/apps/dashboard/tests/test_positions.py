@@ -0,0 +1,72 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from server.apps.dashboard.models import (
+    Edition,
+    Event,
+    LocationLog,
+    Organization,
+    Team,
+    TeamPosition,
+)
+from server.apps.dashboard.positions import rebuild_positions, record_positions
+
+
+class TeamPositionTestCase(TestCase):
+    """Latest fix per team, upserted on ingestion and rebuildable from LocationLog."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.team = Team.objects.create(
+            name="Team 1",
+            code="ABC12",
+            contact_name="Tester",
+            contact_email="tester@test.nl",
+            edition=edition,
+        )
+        self.now = timezone.now()
+
+    def _log(self, lat, minutes_ago, save=False):
+        log = LocationLog(team=self.team, lat=lat, lng=6.0, time=self.now - timedelta(minutes=minutes_ago))
+        if save:
+            log.save()
+        return log
+
+    def test_newest_fix_of_a_batch_wins(self):
+        record_positions([self._log(52.1, 5), self._log(52.3, 1), self._log(52.2, 3)])
+        self.assertEqual(TeamPosition.objects.get(team=self.team).lat, 52.3)
+
+    def test_older_batch_does_not_move_team_back(self):
+        record_positions([self._log(52.3, 1)])
+        record_positions([self._log(52.1, 10)])
+        self.assertEqual(TeamPosition.objects.get(team=self.team).lat, 52.3)
+
+        record_positions([self._log(52.4, 0)])
+        self.assertEqual(TeamPosition.objects.get(team=self.team).lat, 52.4)
+
+    def test_rebuild_from_location_log(self):
+        self._log(52.1, 5, save=True)
+        self._log(52.2, 1, save=True)
+        TeamPosition.objects.create(team=self.team, lat=0, lng=0, time=self.now - timedelta(days=1))
+
+        self.assertEqual(rebuild_positions(), 1)
+        self.assertEqual(TeamPosition.objects.get(team=self.team).lat, 52.2)
+
+    def test_rebuild_command(self):
+        self._log(52.1, 5, save=True)
+        out = StringIO()
+        call_command("rebuild_team_positions", stdout=out)
+        self.assertIn("Rebuilt 1 team positions", out.getvalue())
@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from server.apps.asgi_socket import consumers
+from server.apps.dashboard.constants import DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    Organization,
+    Route,
+    RoutePart,
+    Team,
+    TeamRoutePart,
+)
+from server.apps.dashboard.route_cache import (
+    get_route_payload,
+    invalidate_destinations,
+    invalidate_teams,
+    route_version,
+)
+
+
+@override_settings(
+    SERVER_URI="http://testserver",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class RoutePayloadCacheTestCase(TestCase):
+    """Versioned per-team cache of the newLocation payload."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        route = Route.objects.create(name="Route A", edition=edition)
+        self.team = Team.objects.create(
+            name="Team 1",
+            code="ABC12",
+            contact_name="Tester",
+            contact_email="tester@test.nl",
+            edition=edition,
+        )
+        self.parts = []
+        for order in (1, 2):
+            rp = RoutePart.objects.create(name=f"Part {order}", route=route, order=order)
+            trp = TeamRoutePart.objects.create(
+                name=rp.name, route=route, routepart=rp, team=self.team, order=order
+            )
+            Destination.objects.create(
+                lat=52.0, lng=6.0, radius=25,
+                destination_type=DESTINATION_TYPE_MANDATORY,
+                teamroutepart=trp,
+            )
+            self.parts.append(trp)
+
+    def payload(self):
+        return get_route_payload(self.team.id, self.team.get_next_open_routepart_formatted)
+
+    def test_repeated_requests_do_not_touch_the_db(self):
+        first = self.payload()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.payload(), first)
+
+    def test_completion_invalidates(self):
+        self.payload()
+        dest = self.parts[0].destinations.get()
+        self.team.handle_destination_completion(dest.id)
+
+        payload = self.payload()
+        self.assertEqual(payload["data"]["coordinates"][0]["id"], self.parts[1].destinations.get().id)
+        self.assertTrue(payload["data"]["hasUndoableCompletions"])
+
+    def test_undo_invalidates(self):
+        dest = self.parts[0].destinations.get()
+        self.team.handle_destination_completion(dest.id)
+        self.payload()
+
+        self.team.undo_last_completion()
+
+        payload = self.payload()
+        self.assertEqual(payload["data"]["coordinates"][0]["id"], dest.id)
+        self.assertFalse(payload["data"]["hasUndoableCompletions"])
+
+    def test_destination_edits_invalidate(self):
+        dest = self.parts[0].destinations.get()
+        self.payload()
+
+        dest.radius = 50
+        dest.save()
+        self.assertEqual(self.payload()["data"]["coordinates"][0]["radius"], 50)
+
+        Destination.objects.filter(id=dest.id).update(radius=75)
+        invalidate_destinations([dest.id])
+        self.assertEqual(self.payload()["data"]["coordinates"][0]["radius"], 75)
+
+    def test_distribution_changes_invalidate(self):
+        self.payload()
+        TeamRoutePart.objects.filter(team=self.team).delete()
+        self.assertIsNone(self.payload())
+
+    def test_other_processes_are_told_after_the_commit(self):
+        with mock.patch.object(consumers, "push_invalidation") as push:
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_teams([self.team.id])
+                push.assert_not_called()
+        push.assert_called_once_with("route_payloads", [self.team.id])
+
+    def test_route_version_follows_the_content(self):
+        version = route_version(self.payload())
+        invalidate_teams([self.team.id])
+        self.assertEqual(route_version(self.payload()), version)
+
+        self.parts[0].destinations.update(radius=50)
+        invalidate_teams([self.team.id])
+        self.assertNotEqual(route_version(self.payload()), version)
@@ -0,0 +1,119 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from server.apps.dashboard.completion import complete_destination
+from server.apps.dashboard.constants import DESTINATION_TYPE_MANDATORY
+from server.apps.dashboard.distribution import distribute_route
+from server.apps.dashboard.models import (
+    Destination,
+    Edition,
+    Event,
+    Organization,
+    Route,
+    RoutePart,
+    RouteTeamStats,
+    Team,
+    TeamRoutePart,
+)
+from server.apps.dashboard.route_stats import rebuild_stats
+
+
+@override_settings(
+    SERVER_URI="http://testserver",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROUTE_PAYLOAD_CACHE="default",
+)
+class RouteTeamStatsTestCase(TestCase):
+    """RouteTeamStats follows distribution, completion and undo."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.route = Route.objects.create(name="Route A", edition=self.edition)
+        for order in (1, 2, 3):
+            rp = RoutePart.objects.create(name=f"Part {order}", route=self.route, order=order)
+            Destination.objects.create(
+                lat=52.0 + order * 0.01, lng=6.0,
+                destination_type=DESTINATION_TYPE_MANDATORY, routepart=rp,
+            )
+        self.team = Team.objects.create(
+            name="Team 1", code="ABC12", contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            distribute_route(self.route)
+        self.parts = list(TeamRoutePart.objects.filter(team=self.team).order_by("order"))
+        self.start = timezone.now()
+
+    def stats(self):
+        return RouteTeamStats.objects.get(team=self.team, route=self.route)
+
+    def complete_part(self, index, minutes):
+        dest = self.parts[index].destinations.get()
+        complete_destination(self.team, dest.id, self.start + timedelta(minutes=minutes))
+
+    def test_distribution_creates_the_row(self):
+        stats = self.stats()
+        self.assertEqual((stats.parts_total, stats.parts_completed), (3, 0))
+        self.assertEqual(stats.current_part_id, self.parts[0].id)
+        self.assertIsNone(stats.duration)
+
+    def test_completions_update_the_row(self):
+        self.complete_part(0, 0)
+        self.complete_part(1, 30)
+
+        stats = self.stats()
+        self.assertEqual((stats.parts_completed, stats.destinations_completed), (2, 2))
+        self.assertEqual(stats.current_part_id, self.parts[2].id)
+        self.assertEqual(stats.duration, timedelta(minutes=30))
+        self.assertEqual(stats.pct, 67)
+
+    def test_undo_recomputes_the_row(self):
+        self.complete_part(0, 0)
+        self.complete_part(1, 30)
+        self.team.undo_last_completion()
+
+        stats = self.stats()
+        self.assertEqual((stats.parts_completed, stats.destinations_completed), (1, 1))
+        self.assertEqual(stats.current_part_id, self.parts[1].id)
+        self.assertEqual(stats.last_completed, self.start)
+
+    def test_incremental_matches_rebuild(self):
+        self.complete_part(0, 0)
+        self.complete_part(2, 45)
+        fields = ("parts_total", "parts_completed", "destinations_completed",
+                  "first_completed", "last_completed", "current_part_id")
+        incremental = RouteTeamStats.objects.values(*fields).get()
+
+        RouteTeamStats.objects.all().delete()
+        call_command("rebuild_route_stats", stdout=StringIO())
+        self.assertEqual(RouteTeamStats.objects.values(*fields).get(), incremental)
+
+    def test_rebuild_drops_rows_without_parts(self):
+        TeamRoutePart.objects.filter(team=self.team).delete()
+        rebuild_stats([self.team.id])
+        self.assertFalse(RouteTeamStats.objects.exists())
+
+    def test_stats_page_reads_the_table(self):
+        self.complete_part(0, 0)
+        User.objects.create_superuser("admin", "admin@test.nl", "pass123")
+        self.client.login(username="admin", password="pass123")
+
+        response = self.client.get(reverse("backoffice:route_stats", args=[self.route.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s.team for s in response.context["team_stats"]], [self.team])
+        self.assertContains(response, "Team 1")
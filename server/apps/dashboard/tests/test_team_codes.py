@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+
+from server.apps.asgi_socket import consumers
+from server.apps.dashboard.models import Edition, Event, Organization, Team
+from server.apps.dashboard.team_codes import TeamCode, team_codes
+from server.views import _unique_team_code
+
+
+class TeamCodeTableTestCase(TestCase):
+    """In-memory code lookup, kept in step with the Team table."""
+
+    def setUp(self):
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        self.edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.team = self.create_team("ABC12")
+
+    def create_team(self, code, **kwargs):
+        return Team.objects.create(
+            name=f"Team {code}", code=code, contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition, **kwargs,
+        )
+
+    def entry(self, team, activated=True):
+        return TeamCode(
+            team.id, self.edition.id, activated, self.edition.messaging_enabled,
+            team.location_update_interval,
+        )
+
+    def test_lookup_after_warm_needs_no_queries(self):
+        team_codes.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(team_codes.lookup("ABC12"), self.entry(self.team))
+            self.assertIsNone(team_codes.lookup(""))
+
+    def test_unknown_code_is_checked_in_the_database(self):
+        team_codes.warm()
+        with self.assertNumQueries(1):
+            self.assertIsNone(team_codes.lookup("ZZZ99"))
+
+    def test_code_created_elsewhere_is_found(self):
+        team_codes.warm()
+        # Created by another process: this table was not invalidated
+        Team.objects.bulk_create([Team(
+            name="Team NEW34", code="NEW34", contact_name="Tester",
+            contact_email="tester@test.nl", edition=self.edition,
+        )])
+        new = Team.objects.get(code="NEW34")
+        self.assertEqual(team_codes.lookup("NEW34"), self.entry(new))
+        with self.assertNumQueries(0):
+            team_codes.lookup("NEW34")
+
+    def test_saving_a_team_invalidates(self):
+        team_codes.warm()
+        self.team.code = "NEW34"
+        self.team.save()
+
+        self.assertIsNone(team_codes.lookup("ABC12"))
+        self.assertEqual(team_codes.lookup("NEW34").team_id, self.team.id)
+
+        self.team.delete()
+        self.assertIsNone(team_codes.lookup("NEW34"))
+
+    def test_saving_an_edition_invalidates(self):
+        team_codes.warm()
+        self.edition.messaging_enabled = True
+        self.edition.save()
+        self.assertTrue(team_codes.lookup("ABC12").messaging_enabled)
+
+    def test_other_processes_are_told_after_the_commit(self):
+        team_codes.warm()
+        with mock.patch.object(consumers, "push_invalidation") as push:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.team.save()
+                push.assert_not_called()
+        push.assert_called_once_with("team_codes")
+
+    def test_invalidation_of_another_process_is_applied(self):
+        team_codes.warm()
+        Team.objects.filter(pk=self.team.pk).update(is_activated=False)
+
+        consumers.apply_invalidation({"origin": "other", "cache": "team_codes", "ids": None})
+        self.assertFalse(team_codes.lookup("ABC12").activated)
+
+        # This process dropped its table when it sent the invalidation
+        team_codes.warm()
+        with self.assertNumQueries(0):
+            consumers.apply_invalidation(
+                {"origin": consumers.PROCESS_ID, "cache": "team_codes", "ids": None}
+            )
+            team_codes.lookup("ABC12")
+
+    def test_code_is_unique_across_editions(self):
+        with self.assertRaises(IntegrityError):
+            self.create_team("ABC12")
+
+    def test_empty_codes_may_repeat(self):
+        self.create_team("", is_activated=False)
+        self.create_team("", is_activated=False)
+        self.assertEqual(Team.objects.filter(code="").count(), 2)
+
+    def test_unique_team_code(self):
+        code = _unique_team_code()
+        self.assertEqual(len(code), 5)
+        self.assertFalse(Team.objects.filter(code=code).exists())
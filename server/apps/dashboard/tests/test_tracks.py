@@ -0,0 +1,132 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from server.apps.dashboard.models import Edition, Event, LocationLog, Organization, Team
+from server.apps.dashboard.tracks import (
+    base_track,
+    base_tracks,
+    encode_polyline,
+    simplify,
+    team_tracks,
+    tolerance_for_zoom,
+)
+
+
+class TrackGeometryTestCase(TestCase):
+    def test_encode_polyline(self):
+        # Example from the Google encoded polyline documentation
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(points), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_simplify_drops_points_on_a_straight_line(self):
+        line = [(52.0 + i * 0.0001, 6.0) for i in range(50)]
+        self.assertEqual(simplify(line, 1.0), [line[0], line[-1]])
+
+    def test_simplify_keeps_corners(self):
+        corner = [(52.0, 6.0), (52.0005, 6.0), (52.001, 6.0), (52.001, 6.0005), (52.001, 6.001)]
+        self.assertEqual(simplify(corner, 1.0), [corner[0], corner[2], corner[4]])
+
+    def test_tolerance_shrinks_when_zooming_in(self):
+        self.assertAlmostEqual(tolerance_for_zoom(15) * 2, tolerance_for_zoom(14))
+        self.assertEqual(tolerance_for_zoom(40), tolerance_for_zoom(22))
+
+
+class TeamTrackTestCase(TestCase):
+    """Cached base tracks per team-day, extended with new pings only."""
+
+    def setUp(self):
+        cache.clear()
+        org = Organization.objects.create(
+            name="Test Org", contact_person="Test", contact_email="test@test.nl"
+        )
+        event = Event.objects.create(name="Test Event", organization=org)
+        edition = Edition.objects.create(
+            name="Test Edition",
+            date_start=timezone.make_aware(timezone.datetime(2026, 6, 1)),
+            date_end=timezone.make_aware(timezone.datetime(2026, 6, 2)),
+            event=event,
+        )
+        self.team = Team.objects.create(
+            name="Team 1",
+            code="ABC12",
+            contact_name="Tester",
+            contact_email="tester@test.nl",
+            edition=edition,
+        )
+        self.day = date(2026, 6, 1)
+        self.start = timezone.make_aware(datetime.combine(self.day, time(9)))
+
+    def _log(self, minute, lat, lng=6.0):
+        LocationLog.objects.create(
+            team=self.team, lat=lat, lng=lng, time=self.start + timedelta(minutes=minute)
+        )
+
+    def test_new_pings_are_appended_without_reading_the_day_again(self):
+        for minute in range(10):
+            self._log(minute, 52.0 + minute * 0.0001)
+        self.assertEqual(len(base_track(self.team.id, self.day)["points"]), 2)
+
+        self._log(10, 52.0009, 6.001)  # turn east
+        with self.assertNumQueries(1):
+            track = base_track(self.team.id, self.day)
+        self.assertEqual(track["points"], [(52.0, 6.0), (52.0009, 6.0), (52.0009, 6.001)])
+
+        with self.assertNumQueries(1):
+            base_track(self.team.id, self.day)
+
+    def test_late_offline_ping_rebuilds_the_track(self):
+        self._log(0, 52.0)
+        self._log(10, 52.001)
+        base_track(self.team.id, self.day)
+
+        self._log(5, 52.0005, 6.001)  # older than the end of the cached track
+        with self.assertNumQueries(2):
+            track = base_track(self.team.id, self.day)
+        self.assertEqual(track["points"], [(52.0, 6.0), (52.0005, 6.001), (52.001, 6.0)])
+
+    def test_other_days_are_ignored(self):
+        self._log(0, 52.0)
+        self._log(-24 * 60, 51.0)
+        self.assertEqual(base_track(self.team.id, self.day)["points"], [(52.0, 6.0)])
+
+    def test_team_tracks_skip_single_points(self):
+        self._log(0, 52.0)
+        self.assertEqual(team_tracks([self.team.id], self.day, 14), [])
+
+        self._log(1, 52.001)
+        tracks = team_tracks([self.team.id], self.day, 14)
+        self.assertEqual(tracks[0]["team"], self.team.id)
+        self.assertEqual(tracks[0]["points"], 2)
+        self.assertEqual(tracks[0]["polyline"], encode_polyline([(52.0, 6.0), (52.001, 6.0)]))
+
+    def test_tracks_of_many_teams_in_fixed_queries(self):
+        teams = [self.team] + [
+            Team.objects.create(
+                name=f"Team {i}", code=f"T{i:04d}", contact_name="Tester",
+                contact_email="tester@test.nl", edition=self.team.edition,
+            )
+            for i in range(2, 22)
+        ]
+        team_ids = [team.id for team in teams]
+        for offset, team in enumerate(teams):
+            for minute in range(3):
+                LocationLog.objects.create(
+                    team=team, lat=52.0 + minute * 0.001, lng=6.0 + offset * 0.01,
+                    time=self.start + timedelta(minutes=minute),
+                )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(team_tracks(team_ids, self.day, 14)), 21)
+
+        # Cached per zoom: only the query for new pings
+        with self.assertNumQueries(1):
+            tracks = team_tracks(team_ids, self.day, 14)
+        self.assertEqual([t["team"] for t in tracks], team_ids)
+
+        self._log(5, 52.01)
+        with self.assertNumQueries(1):
+            tracks = base_tracks(team_ids, self.day)
+        self.assertEqual(tracks[self.team.id]["points"][-1], (52.01, 6.0))
@@ -0,0 +1,219 @@
+"""
+Simplified GPS tracks per team for the live map.
+
+Raw LocationLog points of a team-day are reduced with Douglas–Peucker once at
+a fine base tolerance and cached; new pings are simplified onto the end of the
+cached track instead of recomputing it. Per map zoom level the base track is
+simplified again (about one screen pixel), sent as a Google encoded
+polyline and cached until the base track changes. The tracks of all teams on
+a map are read together, so a request costs a fixed number of queries
+whatever the number of teams.
+"""
+import math
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import LocationLog
+
+EARTH_RADIUS_M = 6371000
+
+# Base track tolerance; finer than any zoom level we draw
+BASE_TOLERANCE_M = 2.0
+
+TRACK_CACHE_TTL = 24 * 3600
+
+
+# ── Geometry ──────────────────────────────────────────────────────
+
+def _project(lat, lng, ref_lat):
+    """Equirectangular projection to metres; accurate enough at track scale."""
+    x = math.radians(lng) * EARTH_RADIUS_M * math.cos(math.radians(ref_lat))
+    y = math.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def _segment_distance(p, a, b):
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(points, tolerance_m):
+    """Douglas–Peucker on [(lat, lng), ...]; keeps first and last point."""
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    ref_lat = points[0][0]
+    projected = [_project(lat, lng, ref_lat) for lat, lng in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            dist = _segment_distance(projected[i], projected[first], projected[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def tolerance_for_zoom(zoom, lat=52.0):
+    """Size of one screen pixel in metres at a Google Maps zoom level."""
+    zoom = max(0, min(22, int(zoom)))
+    return 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def encode_polyline(points):
+    """Google encoded polyline (precision 5) for [(lat, lng), ...]."""
+    result = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat_e5, lng_e5 = round(lat * 1e5), round(lng * 1e5)
+        for delta in (lat_e5 - prev_lat, lng_e5 - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        prev_lat, prev_lng = lat_e5, lng_e5
+    return "".join(result)
+
+
+# ── Cached base tracks ────────────────────────────────────────────
+
+def _cache_key(team_id, day):
+    return f"track:{team_id}:{day.isoformat()}"
+
+
+def _zoom_key(team_id, day, zoom, last_id):
+    return f"track:{team_id}:{day.isoformat()}:z{zoom}:{last_id}"
+
+
+def _day_logs(team_ids, day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return LocationLog.objects.filter(
+        team_id__in=team_ids, time__gte=start, time__lt=start + timedelta(days=1)
+    )
+
+
+def _rows_per_team(logs):
+    columns = ("team_id", "id", "lat", "lng", "time")
+    rows = {}
+    for team_id, *row in logs.order_by("time", "id").values_list(*columns):
+        rows.setdefault(team_id, []).append(row)
+    return rows
+
+
+def _empty_track():
+    return {"last_id": 0, "last_time": None, "points": []}
+
+
+def base_tracks(team_ids, day):
+    """
+    Cached base tracks of team-days: {team_id: {"last_id", "last_time", "points"}}.
+
+    The new pings of all cached teams are read in one query (ids above the
+    lowest ``last_id``), simplified together with the last kept point of their
+    track and appended. Teams without a cached track, and tracks that got a
+    ping older than their end (a late offline batch), are read in full in one
+    more query.
+    """
+    team_ids = list(team_ids)
+    cached = cache.get_many([_cache_key(team_id, day) for team_id in team_ids])
+    tracks = {team_id: cached.get(_cache_key(team_id, day)) for team_id in team_ids}
+    changed = {}
+
+    extend = {team_id: track for team_id, track in tracks.items() if track is not None}
+    if extend:
+        new_rows = _rows_per_team(
+            _day_logs(list(extend), day)
+            .filter(id__gt=min(track["last_id"] for track in extend.values()))
+        )
+        for team_id, track in extend.items():
+            rows = [row for row in new_rows.get(team_id, ()) if row[0] > track["last_id"]]
+            if not rows:
+                continue
+            if rows[0][3] < track["last_time"]:
+                tracks[team_id] = None
+                continue
+            tail = simplify(track["points"][-1:] + [(lat, lng) for _, lat, lng, _ in rows], BASE_TOLERANCE_M)
+            changed[team_id] = {
+                "last_id": max(track["last_id"], max(row[0] for row in rows)),
+                "last_time": rows[-1][3],
+                "points": track["points"] + tail[1:],
+            }
+
+    rebuild = [team_id for team_id, track in tracks.items() if track is None]
+    if rebuild:
+        all_rows = _rows_per_team(_day_logs(rebuild, day))
+        for team_id in rebuild:
+            rows = all_rows.get(team_id)
+            if not rows:
+                tracks[team_id] = _empty_track()
+                continue
+            changed[team_id] = {
+                "last_id": max(row[0] for row in rows),
+                "last_time": rows[-1][3],
+                "points": simplify([(lat, lng) for _, lat, lng, _ in rows], BASE_TOLERANCE_M),
+            }
+
+    if changed:
+        cache.set_many(
+            {_cache_key(team_id, day): track for team_id, track in changed.items()}, TRACK_CACHE_TTL
+        )
+        tracks.update(changed)
+    return tracks
+
+
+def base_track(team_id, day):
+    """Cached base track of one team-day (see ``base_tracks``)."""
+    return base_tracks([team_id], day)[team_id]
+
+
+def team_tracks(team_ids, day, zoom):
+    """
+    Encoded polylines for the teams, simplified for ``zoom``.
+
+    The simplified track per zoom level is cached next to the base track,
+    keyed on its ``last_id``, so it is only recomputed after new pings.
+    """
+    zoom = max(0, min(22, int(zoom)))
+    base = base_tracks(team_ids, day)
+    keys = {
+        team_id: _zoom_key(team_id, day, zoom, track["last_id"])
+        for team_id, track in base.items()
+        if len(track["points"]) >= 2
+    }
+    cached = cache.get_many(list(keys.values()))
+
+    tracks = []
+    computed = {}
+    for team_id in team_ids:
+        key = keys.get(team_id)
+        if key is None:
+            continue
+        track = cached.get(key)
+        if track is None:
+            points = base[team_id]["points"]
+            simplified = simplify(points, tolerance_for_zoom(zoom, points[0][0]))
+            track = computed[key] = {
+                "team": team_id,
+                "points": len(simplified),
+                "polyline": encode_polyline(simplified),
+            }
+        tracks.append(track)
+    if computed:
+        cache.set_many(computed, TRACK_CACHE_TTL)
+    return tracks
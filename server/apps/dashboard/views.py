@@ -1,55 +1,22 @@
 # views.py
-import googlemaps
+from datetime import datetime, time
+
 from django.core.serializers.json import DjangoJSONEncoder
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
-from .models import Destination, Team, TeamRoutePart, LocationLog, Route
+from .distance import route_distance_km
+from .models import Destination, Team, TeamRoutePart, Route, RouteTeamStats, TeamPosition
 from django.db.models import OuterRef, Subquery, Case, When, Value, CharField
 from django.utils import timezone
 
-from django.db.models import Count, Max, Min, F, Q, ExpressionWrapper, fields
-from django.db.models.functions import Now, TruncTime
+from django.db.models.functions import Now
 from django.conf import settings
 from .constants import (
     DESTINATION_TYPE_MANDATORY,
     DESTINATION_TYPE_CHOICE,
 )
 
-def calculate_walking_distance(destinations):
-    
-    # Initialize Google Maps client
-    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-
-    total_distance = 0.0
-
-    # Split destinations into chunks of 10
-    chunk_size = 10
-    for i in range(0, len(destinations), chunk_size):
-        chunk = destinations[i:i + chunk_size]
-
-        # Create a list of waypoints, excluding the first and last points
-        waypoints = chunk[1:-1]
-
-
-        # Calculate the walking distance for the chunk
-        if waypoints:
-            directions_result = gmaps.directions(
-                chunk[0],  # Starting point
-                chunk[-1],  # Ending point
-                mode="walking",  # Walking mode
-                waypoints=waypoints,
-            )
-            #print(directions_result)
-
-            # Extract distance from the result
-            distance = directions_result[0]["legs"][0]["distance"]["value"]  # in meters
-            total_distance += distance
-
-    # Convert total distance to kilometers or miles, depending on your preference
-    total_distance_km = total_distance / 1000.0
-    return round(total_distance_km,2)
-
 # def calculate_distance_between_destinations(destination1, destination2):
 #     # Initialize Google Maps client
 #     gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
@@ -116,35 +83,12 @@ def stats_view(request, route_id):
     # Collect all destinations into a list
     destinations_count = mandatory_destinations.count()
 
-    # Calculate distance between mandatory destinations
-    my_dests = [(dest.lat, dest.lng) for dest in mandatory_destinations]    
-    distance = calculate_walking_distance(my_dests)
-
-
-    # Fetch all teams associated with the route
-    teams = Team.objects.filter(teamrouteparts__route=route).distinct()
-
-    # Calculate the first completed teamroutepart and last completed teamroutepart for each team
-    team_stats = teams.annotate(
-        first_completed=TruncTime(Min('teamrouteparts__completed_time')),
-        last_completed=TruncTime(Max('teamrouteparts__completed_time')),
-    )
+    # Distance along the mandatory destinations (cached, see dashboard.distance)
+    distance = route_distance_km(route)
 
-    # Calculate the time difference in hours
-    team_stats = team_stats.annotate(
-        time_difference=ExpressionWrapper(
-            F('last_completed') - F('first_completed'),
-            output_field=fields.DurationField(),
-        ),
-    )
 
-    # Calculate the number of completed destinations for each teamroutepart
-    team_stats = team_stats.annotate(
-        completed_destinations_count=Count(
-            'teamrouteparts__destinations',
-            filter=Q(teamrouteparts__destinations__completed_time__isnull=False),
-        ),
-    )
+    # Progress per team, precomputed (see dashboard.route_stats)
+    team_stats = RouteTeamStats.objects.filter(route=route).select_related("team").order_by("team__name")
 
     context = {
         'route': route,
@@ -175,14 +119,12 @@ def map_view(request, route_id=None):
     #     team__in=teams
     # ).values('team__name', 'team__id', 'lat', 'lng', 'time')
 
-    # Get the current date in the server's timezone
-    current_date = timezone.now().date()
-
-    # Filter LocationLog objects for today
-    team_locations = LocationLog.objects.filter(
+    # Current position of each team, if it was logged today
+    today_start = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    team_locations = TeamPosition.objects.filter(
         team__in=teams,
-        time__date=current_date
-    ).values('team__name', 'team__id', 'lat', 'lng', 'time')    
+        time__gte=today_start,
+    ).values('team__name', 'team__id', 'lat', 'lng', 'time')
 
     completed_destinations = Destination.objects.filter(
         teamroutepart__team__in=teams,
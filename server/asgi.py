@@ -1,6 +1,9 @@
+import atexit
+
 from django.core.asgi import get_asgi_application as get_asgi_django_application
 from channels.routing import ProtocolTypeRouter
 from server.apps.asgi_socket.asgi import (
+    ProcessTaskMiddleware,
     get_asgi_application as get_asgi_websocket_application,
 )
 
@@ -8,9 +11,14 @@ from server.apps.asgi_socket.asgi import (
 django_asgi_app = get_asgi_django_application()
 websocket_asgi_app = get_asgi_websocket_application()
 
-application = ProtocolTypeRouter(
+application = ProcessTaskMiddleware(ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": websocket_asgi_app,
     }
-)
+))
+
+# Pings still buffered when the server stops would be lost otherwise
+from server.apps.asgi_socket.ingestion import location_buffer  # noqa: E402
+
+atexit.register(location_buffer.close)
@@ -61,6 +61,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "server.apps.dashboard.metrics.QueryMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -154,12 +155,112 @@ MEDIA_URL = "/media/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-CHANNEL_LAYERS = {
+# On PostgreSQL, socket pushes are fanned out to all Daphne processes with
+# LISTEN/NOTIFY; elsewhere (SQLite, tests) a single in-process layer is used.
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "server.apps.asgi_socket.layers.PostgresChannelLayer",
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+CACHES = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     },
+    # Route payloads sent to the app (see dashboard.route_cache), per process;
+    # changes reach the other processes as invalidations over the channel layer
+    "route_payloads": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "route-payloads",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+ROUTE_PAYLOAD_CACHE = "route_payloads"
+ROUTE_PAYLOAD_TTL = 6 * 3600
+
+# Edition broadcasts: parallel sends per process and per-socket send timeout
+BROADCAST_CONCURRENCY = 50
+BROADCAST_SEND_TIMEOUT = 5
+
+# Admission control for the app socket (asgi_socket.admission): database-bound
+# requests running at once per process, how long one may wait for a slot
+# before the app is told to retry ("busy"), and a token bucket per team and
+# endpoint: (requests per second, burst)
+SOCKET_DB_CONCURRENCY = int(os.environ.get("SOCKET_DB_CONCURRENCY", "8"))
+SOCKET_ADMISSION_TIMEOUT = 2.0
+SOCKET_BUSY_RETRY_AFTER = 5
+SOCKET_RATE_LIMITS = {
+    "updateLocation": (1.0, 10),
+    "updateLocations": (0.2, 5),
+    "newLocation": (0.5, 5),
 }
 
+# App session resumption (asgi_socket.sessions): token lifetime and the events
+# per team/edition kept for replay after a reconnect
+SOCKET_SESSION_MAX_AGE = 12 * 3600
+SOCKET_REPLAY_SIZE = 100
+SOCKET_REPLAY_TTL = 3600
+
+# Messages per getMessages window of the app
+MESSAGE_PAGE_SIZE = 50
+
+# Location pings are buffered in memory and written in batches
+LOCATION_FLUSH_INTERVAL_MS = int(os.environ.get("LOCATION_FLUSH_INTERVAL_MS", "1000"))
+LOCATION_FLUSH_MAX_ROWS = int(os.environ.get("LOCATION_FLUSH_MAX_ROWS", "500"))
+# Failed flushes in a row before the pings are written one by one (dropping bad ones)
+LOCATION_FLUSH_RETRIES = 3
+LOCATION_BATCH_MAX_POINTS = 1000
+# Raw location logs of compacted editions (compact_location_logs)
+LOCATION_ARCHIVE_DIR = os.environ.get("LOCATION_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+
+# Team presence (online/last_seen) is kept in memory and written back in bulk
+PRESENCE_FLUSH_SECONDS = 15
+PRESENCE_STALE_SECONDS = 3600
+
+# Server-side geofencing of location pings (dashboard.geofence): a ping within
+# radius + margin is a near miss; an arrival the app has not completed after
+# this many seconds is flagged as unreported. The state of a team is dropped
+# after GEOFENCE_IDLE_SECONDS without pings.
+GEOFENCE_NEAR_MISS_METERS = 50
+GEOFENCE_UNREPORTED_SECONDS = 120
+GEOFENCE_IDLE_SECONDS = 3600
+
+# Background jobs (run_jobs worker): poll interval, retry backoff base and the
+# age after which a running job of a crashed worker is queued again
+JOB_POLL_SECONDS = 2
+JOB_RETRY_DELAY_SECONDS = 30
+JOB_STALE_SECONDS = 15 * 60
+# The worker also adds the coming days' LocationLog partitions at this interval
+LOCATION_PARTITIONS_SECONDS = 6 * 3600
+
+# Outgoing mail is queued in OutboundEmail and sent in batches by the worker
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY_SECONDS = 60
+OUTBOX_LEASE_SECONDS = 5 * 60
+
+# Query count/latency per view and socket endpoint (dashboard.metrics): samples
+# kept per view for p50/p95; @query_budget violations raise when enforced (the
+# test runner always enforces them)
+METRICS_WINDOW = 500
+QUERY_BUDGET_ENFORCE = os.environ.get("QUERY_BUDGET_ENFORCE", "").lower() in ("true", "1", "yes")
+TEST_RUNNER = "server.test_runner.TestRunner"
+
+# Edition dashboard stats are cached per edition for everyone viewing it
+DASHBOARD_CACHE_SECONDS = 10
+
+# Walking distance on the route stats (dashboard.distance): "haversine" works
+# offline, "google" uses the Directions API, or a dotted path to a function
+DISTANCE_PROVIDER = os.environ.get("DISTANCE_PROVIDER", "haversine")
+DISTANCE_CACHE_TTL = 7 * 24 * 3600
+
 GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY", "")
 GOOGLE_MAPS_MAP_ID = 'TapaHikeMap'
 
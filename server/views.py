@@ -1,19 +1,17 @@
 import secrets
 import string
 
-from django.conf import settings
-from django.core.mail import send_mail
 from django.db import transaction
 from django.forms.models import model_to_dict
 from django.http import Http404
 from django.shortcuts import get_object_or_404, render, redirect
 
+from server.apps.dashboard.distribution import distribute_routes_for_team
 from server.apps.dashboard.models import (
-    Destination,
     Edition,
     Team,
-    TeamRoutePart,
 )
+from server.apps.dashboard.outbox import build_email, queue_email
 from server.forms import ExtendedRegistrationForm, QuickRegistrationForm
 
 
@@ -33,83 +31,53 @@ def _generate_team_code(length=5):
     return "".join(secrets.choice(alphabet) for _ in range(length))
 
 
-def _unique_team_code(edition):
-    """Generate a team code that doesn't exist yet in this edition."""
-    existing = set(edition.teams.values_list("code", flat=True))
-    for _ in range(100):
-        code = _generate_team_code()
-        if code not in existing:
-            return code
+def _unique_team_code():
+    """Generate a team code that no team (in any edition) has yet."""
+    for _ in range(10):
+        candidates = {_generate_team_code() for _ in range(10)}
+        taken = set(Team.objects.filter(code__in=candidates).values_list("code", flat=True))
+        if free := candidates - taken:
+            return free.pop()
     raise RuntimeError("Could not generate unique team code")
 
 
 def _distribute_routes_for_team(team):
-    """Distribute all route parts to a single team (mirrors admin action logic)."""
-    edition = team.edition
-    for route in edition.routes.all():
-        for part in route.routeparts.select_related(
-            "routedata_image", "routedata_audio"
-        ).all():
-            trp, _ = TeamRoutePart.objects.get_or_create(
-                routepart=part,
-                team=team,
-                defaults={
-                    "route": route,
-                    "name": part.name,
-                    "route_type": part.route_type,
-                    "routepart_zoom": part.routepart_zoom,
-                    "routepart_fullscreen": part.routepart_fullscreen,
-                    "routedata_image": part.routedata_image,
-                    "routedata_audio": part.routedata_audio,
-                    "final": part.final,
-                    "order": part.order,
-                    "bundle": part.bundle,
-                },
-            )
-
-            for d in part.destinations.all().order_by("id"):
-                Destination.objects.get_or_create(
-                    teamroutepart=trp,
-                    lat=d.lat,
-                    lng=d.lng,
-                    radius=d.radius,
-                    destination_type=d.destination_type,
-                    defaults={
-                        "confirm_by_user": d.confirm_by_user,
-                        "hide_for_user": d.hide_for_user,
-                    },
-                )
+    """Distribute all route parts to a single team."""
+    return distribute_routes_for_team(team)
 
 
-def _send_team_code_email(team):
-    """Send the team code to the contact email."""
-    send_mail(
+def _team_code_email(team):
+    """Unsaved outbox row with the team code for the contact email."""
+    return build_email(
+        to=team.contact_email,
         subject=f"Je teamcode voor {team.edition.name}",
-        message=(
+        body=(
             f"Hallo {team.contact_name},\n\n"
             f"Je bent aangemeld voor {team.edition.name}.\n"
             f"Je teamcode is: {team.code}\n\n"
             f"Veel plezier!\n"
         ),
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[team.contact_email],
-        fail_silently=False,
+        team=team,
     )
 
 
+def _send_team_code_email(team):
+    """Queue the team code for the contact email (sent by the outbox worker)."""
+    _team_code_email(team).save()
+
+
 def _send_confirmation_email(team, confirmation_text):
-    """Send a confirmation email for extended registration."""
+    """Queue a confirmation email for extended registration."""
     body = confirmation_text or (
         f"Hallo {team.contact_name},\n\n"
         f"Bedankt voor je aanmelding voor {team.edition.name}.\n"
         f"We nemen zo snel mogelijk contact met je op.\n"
     )
-    send_mail(
+    queue_email(
+        to=team.contact_email,
         subject=f"Bevestiging aanmelding {team.edition.name}",
-        message=body,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[team.contact_email],
-        fail_silently=False,
+        body=body,
+        team=team,
     )
 
 
@@ -128,7 +96,7 @@ def register(request, edition_id):
         if form.is_valid():
             with transaction.atomic():
                 if is_quick:
-                    code = _unique_team_code(edition)
+                    code = _unique_team_code()
                     team = Team.objects.create(
                         edition=edition,
                         name=form.cleaned_data["contact_name"],
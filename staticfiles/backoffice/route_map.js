@@ -6,10 +6,14 @@
   const compGroups = new Map();   // posKey -> { marker, lat, lng, imgUrl }
   const compIndex  = new Map();   // posKey -> Set(teamId)
   const teamMarkers = new Map();  // teamId -> marker
+  const teamTracks  = new Map();  // teamId -> google.maps.Polyline
+  const geofenceMarks = new Map(); // `${destination}:${kind}` -> { circle, team }
 
   // State
   const selectedTeams = new Set();   // Numbers
   let showDestinations = true;
+  let showTracks = true;
+  let showGeofence = true;
 
   // Team registries (uit teams_meta)
   const teamMeta = [];               // [{id,name,color?,icon?,label?}] (orde zoals aangeleverd)
@@ -42,6 +46,7 @@
       await new Promise(r=>setTimeout(r,50));
     }
     await google.maps.importLibrary("maps");
+    await google.maps.importLibrary("geometry");
     try { await google.maps.importLibrary("marker"); } catch {}
   }
 
@@ -290,6 +295,104 @@
     }
   }
 
+  // ---------- Tracks (vereenvoudigde polylines per team, per zoomniveau) ----------
+  let tracksZoom = null;
+  let tracksTimer = null;
+
+  function trackVisible(teamId){
+    return showTracks && selectedTeams.size>0 && selectedTeams.has(nTeamId(teamId));
+  }
+  function ensureTrack(teamIdRaw){
+    const teamId = nTeamId(teamIdRaw);
+    let line = teamTracks.get(teamId);
+    if (!line){
+      line = new google.maps.Polyline({
+        strokeColor: teamColorById.get(teamId) || "#444444",
+        strokeOpacity: 0.8,
+        strokeWeight: 3,
+        clickable: false,
+      });
+      teamTracks.set(teamId, line);
+    }
+    line.setMap(trackVisible(teamId) ? map : null);
+    return line;
+  }
+  function refreshTracksVisibility(){
+    for (const [teamId, line] of teamTracks.entries()){
+      line.setMap(trackVisible(teamId) ? map : null);
+    }
+  }
+
+  async function loadTracks(){
+    const zoom = map.getZoom();
+    const url = new URL(document.getElementById("map").dataset.tracksUrl, window.location.origin);
+    url.searchParams.set("zoom", zoom);
+    const res = await fetch(url, { credentials: "same-origin" });
+    if (!res.ok) throw new Error(`tracks ${res.status}`);
+    const payload = await res.json();
+    tracksZoom = zoom;
+    for (const t of (payload.tracks||[])){
+      ensureTrack(t.team).setPath(google.maps.geometry.encoding.decodePath(t.polyline));
+    }
+  }
+  function scheduleTracks(delay){
+    clearTimeout(tracksTimer);
+    tracksTimer = setTimeout(()=>{ loadTracks().catch(console.error); }, delay);
+  }
+
+  // Nieuwe ping: lokaal aan het spoor plakken; bij de volgende zoom komt de vereenvoudigde versie
+  function extendTrack(teamId, lat, lng){
+    const line = ensureTrack(teamId);
+    line.getPath().push(new google.maps.LatLng(lat, lng));
+  }
+
+  // ---------- Geofence (aankomst / bijna-mis / niet gemeld, berekend op de server) ----------
+  const GEOFENCE_STYLE = {
+    arrival:    { color: "#16A34A", title: "Aangekomen" },
+    near_miss:  { color: "#F59E0B", title: "Bijna gemist" },
+    unreported: { color: "#DC2626", title: "Aangekomen, niet gemeld" },
+  };
+
+  function geofenceVisible(teamId){
+    return showGeofence && selectedTeams.size>0 && selectedTeams.has(nTeamId(teamId));
+  }
+  function applyGeofence(rows){
+    for (const g of (rows||[])){
+      const style = GEOFENCE_STYLE[g.kind]; if (!style) continue;
+      const key = `${g.destination}:${g.kind}`;
+      if (geofenceMarks.has(key)) continue;
+      const lat=num(g.lat), lng=num(g.lng); if(!Number.isFinite(lat)||!Number.isFinite(lng)) continue;
+      const circle = new google.maps.Circle({
+        center: { lat, lng },
+        radius: g.kind === "near_miss" ? 25 : 15,
+        strokeColor: style.color,
+        strokeWeight: 2,
+        fillColor: style.color,
+        fillOpacity: 0.25,
+        clickable: true,
+      });
+      circle.addListener("click", ()=>{
+        const meta = teamMeta.find(t => t.id === nTeamId(g.team));
+        const name = meta ? meta.name : `Team ${g.team}`;
+        infoWindow = infoWindow || new google.maps.InfoWindow();
+        const el = document.createElement("div");
+        el.className = "text-sm";
+        el.append(Object.assign(document.createElement("b"), { textContent: name }),
+                  document.createElement("br"), `${style.title} · ${g.distance} m`);
+        infoWindow.setContent(el);
+        infoWindow.setPosition({ lat, lng });
+        infoWindow.open({ map });
+      });
+      circle.setMap(geofenceVisible(g.team) ? map : null);
+      geofenceMarks.set(key, { circle, team: nTeamId(g.team) });
+    }
+  }
+  function refreshGeofenceVisibility(){
+    for (const { circle, team } of geofenceMarks.values()){
+      circle.setMap(geofenceVisible(team) ? map : null);
+    }
+  }
+
   // ---------- Initial build ----------
   function buildInitial(){
     const dests     = readJSON("live-map-destinations");
@@ -309,52 +412,138 @@
     }
 
     // Completed -> index + markers
+    completedIds.clear();
     for (const c of completed){
       const lat=num(c.lat), lng=num(c.lng); if(!Number.isFinite(lat)||!Number.isFinite(lng)) continue;
+      if (c.id != null) completedIds.add(c.id);
       addCompletedEntry(lat, lng, c["teamroutepart__team_id"]);
     }
     rebuildCompletedMarkersFromIndex();
+    applyGeofence(readJSON("live-map-geofence"));
 
-    // Team latest
-    const seen = new Set();
-    for (const t of teamlocs){
-      const id = nTeamId(t["team__id"]); if (seen.has(id)) continue; seen.add(id);
-      const lat=num(t.lat), lng=num(t.lng); if(!Number.isFinite(lat)||!Number.isFinite(lng)) continue;
-      ensureTeamMarker(id, lat, lng);
-    }
+    // Team latest (één positie per team)
+    teamTimes.clear();
+    applyTeamPositions(teamlocs);
+    serverTime = document.getElementById("map").dataset.serverTime || null;
 
     if (!bounds.isEmpty()) map.fitBounds(bounds, 48);
     updateDestinationVisibility();
     refreshTeamsVisibility();
   }
 
-  // ---------- Live updates ----------
-  function applyLiveState(payload){
-    
-    // Teams (laatste per team)
-    const latest = new Map();
-    for (const t of (payload.teams||[])){
+  // ---------- Live updates (push via backoffice-socket, delta's via ?since=) ----------
+  const RECONNECT_MS = 3000;
+  const teamTimes = new Map();     // teamId -> tijd van getoonde positie
+  const completedIds = new Set();  // destination ids die als completed getoond worden
+  let serverTime = null;           // cursor: server_time van de vorige response
+
+  function applyTeamPositions(rows){
+    for (const t of (rows||[])){
       const id = nTeamId(t["team__id"]);
-      if (!latest.has(id)) latest.set(id,t);
-    }
-    for (const [teamId, t] of latest.entries()){
+      const at = Date.parse(t.time) || 0;
+      if (teamTimes.has(id) && teamTimes.get(id) >= at) continue;  // ouder dan wat we hebben
       const lat=num(t.lat), lng=num(t.lng); if(!Number.isFinite(lat)||!Number.isFinite(lng)) continue;
-      ensureTeamMarker(teamId, lat, lng);
+      teamTimes.set(id, at);
+      ensureTeamMarker(id, lat, lng);
     }
+  }
 
-    // Completed
-    clearCompleted();
+  function applyLiveState(payload, isDelta){
+    applyTeamPositions(payload.teams);
+
+    if (!isDelta){
+      clearCompleted();
+      completedIds.clear();
+    }
+    const touched = new Set();
     for (const c of (payload.completed_destinations||[])){
+      if (c.id != null && completedIds.has(c.id)) continue;
       const lat=num(c.lat), lng=num(c.lng); if(!Number.isFinite(lat)||!Number.isFinite(lng)) continue;
+      if (c.id != null) completedIds.add(c.id);
       addCompletedEntry(lat, lng, c["teamroutepart__team_id"]);
+      touched.add(posKey(lat, lng));
+    }
+    if (isDelta){
+      for (const key of touched){
+        const [latStr,lngStr] = key.split(",");
+        ensureCompletedMarker(key, parseFloat(latStr), parseFloat(lngStr));
+      }
+    } else {
+      rebuildCompletedMarkersFromIndex();
     }
-    rebuildCompletedMarkersFromIndex();
 
-    updateDestinationVisibility();
+    applyGeofence(payload.geofence);
+
     refreshTeamsVisibility();
     refreshCompletedVisibility();
   }
 
+  async function fetchState(params){
+    const url = new URL(document.getElementById("map").dataset.stateUrl, window.location.origin);
+    Object.entries(params||{}).forEach(([k,v])=>url.searchParams.set(k, v));
+    const res = await fetch(url, { credentials: "same-origin" });
+    if (!res.ok) throw new Error(`state ${res.status}`);
+    return res.json();
+  }
+
+  async function refreshState(opts){
+    const isDelta = !!serverTime && !(opts && opts.full);
+    const payload = await fetchState(isDelta ? { since: serverTime } : {});
+    applyLiveState(payload, isDelta);
+    serverTime = payload.server_time;
+
+    // Een undo haalt completions weg; dat zie je niet in een delta → volledig herladen
+    if (isDelta && payload.completed_total !== completedIds.size){
+      const full = await fetchState({});
+      applyLiveState(full, false);
+    }
+  }
+
+  // Events van AppConsumer: {type: "completion"|"undo"|"geofence", data: {team, ...}}
+  // en {type: "locations", data: [{team, lat, lng, time}, ...]} (nieuwste positie per team)
+  function handleEvent(evt){
+    if (evt.type === "locations"){
+      const positions = (evt.data || []).filter(d => teamIndexById.has(nTeamId(d.team)));
+      for (const d of positions){
+        const lat=num(d.lat), lng=num(d.lng);
+        if (Number.isFinite(lat) && Number.isFinite(lng)) extendTrack(nTeamId(d.team), lat, lng);
+      }
+      if (!positions.length) return;
+      applyTeamPositions(positions.map(d => ({ team__id: nTeamId(d.team), lat: d.lat, lng: d.lng, time: d.time })));
+      refreshTeamsVisibility();
+      return;
+    }
+
+    const d = evt.data || {};
+    const teamId = nTeamId(d.team);
+    if (!teamIndexById.has(teamId)) return;  // team rijdt niet op deze route
+
+    if (evt.type === "completion"){
+      if (String(d.route) !== document.getElementById("map").dataset.routeId) return;
+      applyLiveState({ completed_destinations: [
+        { id: d.id, lat: d.lat, lng: d.lng, teamroutepart__team_id: teamId, completed_time: d.time }
+      ]}, true);
+    } else if (evt.type === "geofence"){
+      if (String(d.route) !== document.getElementById("map").dataset.routeId) return;
+      applyGeofence([d]);
+    } else if (evt.type === "undo"){
+      refreshState({ full: true }).catch(console.error);
+    }
+  }
+
+  function connectLive(){
+    const editionId = document.getElementById("map").dataset.editionId;
+    const proto = location.protocol === "https:" ? "wss:" : "ws:";
+    const ws = new WebSocket(`${proto}//${location.host}/ws/backoffice/${editionId}/`);
+
+    // Na (her)verbinden inhalen wat we gemist hebben
+    ws.onopen = ()=>{ refreshState().catch(console.error); scheduleTracks(0); };
+    ws.onmessage = (e)=>{
+      try { handleEvent(JSON.parse(e.data)); } catch (err) { console.error(err); }
+    };
+    ws.onclose = ()=>{ setTimeout(connectLive, RECONNECT_MS); };
+  }
+
   // ---------- Filters ----------
   function initFilters(){
     // bouw registry uit teams_meta    
@@ -387,6 +576,8 @@
         if (on) selectedTeams.add(nTeamId(cb.dataset.team));
       });
       refreshTeamsVisibility();
+      refreshTracksVisibility();
+      refreshGeofenceVisibility();
       refreshCompletedVisibility();   // << recompute icons + counts
       syncAll();
     });
@@ -396,6 +587,8 @@
         const id = nTeamId(cb.dataset.team);
         if (cb.checked) selectedTeams.add(id); else selectedTeams.delete(id);
         refreshTeamsVisibility();
+        refreshTracksVisibility();
+        refreshGeofenceVisibility();
         refreshCompletedVisibility(); // << recompute icons + counts
         syncAll();
       });
@@ -406,6 +599,18 @@
       updateDestinationVisibility();
     });
 
+    const tracksCb = document.getElementById("tracks-filter");
+    tracksCb.addEventListener("change", ()=>{
+      showTracks = tracksCb.checked;
+      refreshTracksVisibility();
+    });
+
+    const geofenceCb = document.getElementById("geofence-filter");
+    geofenceCb.addEventListener("change", ()=>{
+      showGeofence = geofenceCb.checked;
+      refreshGeofenceVisibility();
+    });
+
     syncAll();
   }
 
@@ -426,12 +631,10 @@
     initFilters();
     buildInitial();
 
-    // HTMX live (nu uitgeschakeld in applyLiveState)
-    document.body.addEventListener("htmx:afterOnLoad", (e)=>{
-      const txt = e.detail?.xhr?.responseText || "";
-      if (!txt) return;
-      try { applyLiveState(JSON.parse(txt)); } catch {}
-    });
+    // Andere zoom → andere tolerantie; pas na het inzoomen/uitzoomen ophalen
+    map.addListener("idle", ()=>{ if (map.getZoom() !== tracksZoom) scheduleTracks(300); });
+
+    connectLive();
   }
 
   document.addEventListener("DOMContentLoaded", ()=>{ init().catch(console.error); });